@@ -0,0 +1 @@
+"""Performance benchmarks for workbook loading and document generation"""
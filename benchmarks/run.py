@@ -0,0 +1,326 @@
+"""Benchmark suite: python -m benchmarks.run [--sizes 10,100,...] [--baseline FILE] [--output FILE]"""
+import argparse
+import glob
+import io
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from rup_fill.fastpath import verify
+from rup_fill.package import DEFAULT_COMPRESSLEVEL
+from rup_fill.render import build_context, iter_jobs, today
+from rup_fill.snapshot import SnapshotCache, read_workbook_cached
+from rup_fill.templates import TemplateCache
+from rup_fill.timing import Timings, collect
+from rup_fill.workbook import DATI_GENERALI, GENERAZIONI_OFFERTE, read_workbook
+
+from .startup import measure_startup
+from .synthetic import workbook_for
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_DIR = os.path.join(REPO_DIR, 'template_doc')
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+LOADING_PHASES = ['load_workbook', 'load_snapshot', 'build_context']
+DOCUMENT_PHASES = ['render', 'save']
+# Documenti per template resi in entrambi i modi per confrontare fast path e docxtpl
+VERIFY_DOCS = 3
+# Sotto questa differenza (secondi) una fase non è considerata in regressione: è rumore
+MIN_REGRESSION_SECONDS = 0.002
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """Latency statistics (seconds) of a list of samples"""
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'total': round(sum(ordered), 6),
+        'mean': round(sum(ordered) / len(ordered), 6) if ordered else None,
+        'p50': percentile(ordered, 50),
+        'p90': percentile(ordered, 90),
+        'p99': percentile(ordered, 99),
+        'max': ordered[-1] if ordered else None
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unavailable)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss è in byte su macOS, in KB su Linux
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def bench_loading(sizes, workdir, repeat=1):
+    """Time workbook loading (openpyxl and snapshot) and context assembly for each size"""
+    results = {}
+    snapshots = SnapshotCache(os.path.join(workdir, 'snapshots'))
+    current_date = today()
+    for rows in sizes:
+        log(f"[loading] {rows} righe")
+        path = workbook_for(rows, workdir)
+        samples = {phase: [] for phase in LOADING_PHASES}
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = read_workbook(path)
+            samples['load_workbook'].append(time.perf_counter() - started)
+
+        # Il primo accesso crea lo snapshot, le letture misurate lo trovano in cache
+        read_workbook_cached(path, snapshots)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            read_workbook_cached(path, snapshots)
+            samples['load_snapshot'].append(time.perf_counter() - started)
+
+        for _ in range(repeat):
+            started = time.perf_counter()
+            context = build_context(data['field_values'], data[DATI_GENERALI], current_date)
+            for job in iter_jobs(GENERAZIONI_OFFERTE, context, ['template.docx'], workdir, current_date,
+                                 data[GENERAZIONI_OFFERTE]):
+                pass
+            samples['build_context'].append(time.perf_counter() - started)
+
+        results[str(rows)] = dict({phase: summarize(samples[phase]) for phase in LOADING_PHASES},
+                                  rows=rows, peak_rss_mb=peak_rss_mb())
+    return results
+
+
+def bench_templates(template_paths, workdir, docs=20, fast_path=True, compresslevel=DEFAULT_COMPRESSLEVEL):
+    """Render and save docs rows of a synthetic workbook with every template, timing each phase.
+
+    The phases are the render and save spans of rup_fill.templates and
+    rup_fill.fastpath: save covers the serialization of the parts and the
+    zip written to the output file. The first document is rendered twice
+    before sampling, so the one-time fast path compilation is reported as
+    warmup instead of inflating a render sample.
+
+    With the fast path, the first VERIFY_DOCS documents of every template
+    are also rendered through docxtpl and compared member by member; the
+    templates whose output differs are listed in fast_path_mismatches.
+    """
+    data = read_workbook(workbook_for(docs, workdir))
+    current_date = today()
+    context = build_context(data['field_values'], data[DATI_GENERALI], current_date)
+    output_dir = os.path.join(workdir, 'output')
+    os.makedirs(output_dir, exist_ok=True)
+    cache = TemplateCache(fast_path=fast_path, compresslevel=compresslevel)
+
+    results = {}
+    totals = {phase: [] for phase in DOCUMENT_PHASES}
+    for template_path in template_paths:
+        name = os.path.relpath(template_path, TEMPLATE_DIR)
+        log(f"[template] {name}")
+        # Niente plan_renders: si vuole il costo di ogni singolo documento
+        jobs = list(iter_jobs(GENERAZIONI_OFFERTE, context, [template_path], output_dir, current_date,
+                              data[GENERAZIONI_OFFERTE]))
+        samples = {phase: [] for phase in DOCUMENT_PHASES}
+        try:
+            started = time.perf_counter()
+            compiled = cache.get(template_path)
+            compiled.variables
+            load_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            if jobs:
+                # Il fast path si compila dal secondo documento in poi
+                for _ in range(2):
+                    compiled.render(compiled.project(jobs[0][2]), io.BytesIO(), fast_path, compresslevel)
+            warmup_seconds = time.perf_counter() - started
+            for row_idx, path, job_context, output_path in jobs:
+                timings = Timings()
+                with collect(timings):
+                    compiled.render(compiled.project(job_context), output_path, fast_path, compresslevel)
+                spans = timings.summary()
+                for phase in DOCUMENT_PHASES:
+                    samples[phase].append(spans[phase]['total'] if phase in spans else 0.0)
+        except Exception as e:
+            results[name] = {'error': str(e)}
+            continue
+
+        differences = None
+        if fast_path and compiled.fast_template():
+            differences = verify_fast_path(compiled, jobs[:VERIFY_DOCS], compresslevel)
+        for phase in DOCUMENT_PHASES:
+            totals[phase].extend(samples[phase])
+        elapsed = sum(samples['render']) + sum(samples['save'])
+        results[name] = dict({phase: summarize(samples[phase]) for phase in DOCUMENT_PHASES},
+                             engine='fast' if fast_path and compiled.fast_template() else 'docxtpl',
+                             fast_path_differences=differences,
+                             load_template=round(load_seconds, 6),
+                             warmup=round(warmup_seconds, 6),
+                             docs_per_second=round(len(jobs) / elapsed, 3) if elapsed > 0 else None)
+
+    elapsed = sum(totals['render']) + sum(totals['save'])
+    documents = len(totals['render'])
+    summary = dict({phase: summarize(totals[phase]) for phase in DOCUMENT_PHASES},
+                   documents=documents,
+                   failed_templates=sum(1 for r in results.values() if 'error' in r),
+                   fast_path_mismatches=[name for name, r in results.items() if r.get('fast_path_differences')],
+                   docs_per_second=round(documents / elapsed, 3) if elapsed > 0 else None,
+                   peak_rss_mb=peak_rss_mb())
+    return results, summary
+
+
+def verify_fast_path(compiled, jobs, compresslevel):
+    """Zip members differing between fast path and docxtpl over jobs (None if no job took the fast path)"""
+    differences = None
+    for row_idx, path, job_context, output_path in jobs:
+        members = verify(compiled, compiled.project(job_context), compresslevel)
+        if members is not None:
+            differences = sorted(set(differences or ()) | set(members))
+    return differences
+
+
+def metrics(results):
+    """Flatten a results dict into {name: (value, higher_is_better)} for comparisons"""
+    flat = {}
+    for size, phases in results.get('loading', {}).items():
+        for phase in LOADING_PHASES:
+            flat[f"loading.{size}.{phase}.p50"] = (phases[phase]['p50'], False)
+    for name, template in results.get('templates', {}).items():
+        if 'error' in template:
+            continue
+        for phase in DOCUMENT_PHASES:
+            flat[f"templates.{name}.{phase}.p50"] = (template[phase]['p50'], False)
+    startup = results.get('startup')
+    if startup and 'import_seconds' in startup:
+        flat['startup.import_seconds'] = (startup['import_seconds'], False)
+    documents = results.get('documents')
+    if documents:
+        for phase in DOCUMENT_PHASES:
+            flat[f"documents.{phase}.p90"] = (documents[phase]['p90'], False)
+        flat['documents.docs_per_second'] = (documents['docs_per_second'], True)
+    return flat
+
+
+def compare(current, baseline, tolerance=0.2):
+    """Regressions of current against baseline, as readable messages"""
+    regressions = []
+    base = metrics(baseline)
+    for name, (value, higher_is_better) in metrics(current).items():
+        if name not in base or value is None or base[name][0] is None:
+            continue
+        reference = base[name][0]
+        if higher_is_better:
+            if value < reference * (1 - tolerance):
+                regressions.append(f"{name}: {value} (baseline {reference})")
+        elif value > reference * (1 + tolerance) and value - reference > MIN_REGRESSION_SECONDS:
+            regressions.append(f"{name}: {value:.4f}s (baseline {reference:.4f}s)")
+    return regressions
+
+
+def parse_sizes(spec):
+    try:
+        return [int(size) for size in spec.split(',') if size.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"dimensioni non valide: {spec!r}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description="Misura lettura dei file Excel e generazione dei documenti su dati sintetici.")
+    parser.add_argument('--sizes', type=parse_sizes, default=DEFAULT_SIZES,
+                        help="righe di generazioni_offerte dei workbook sintetici, es. 10,1000 "
+                             "(default: 10,100,1000,10000,100000; vuoto per saltare la lettura)")
+    parser.add_argument('--docs', type=int, default=20,
+                        help="documenti generati per ogni template (default: %(default)s)")
+    parser.add_argument('--templates', nargs='+', default=[TEMPLATE_DIR],
+                        help="template o cartelle di template (default: tutto template_doc)")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="ripetizioni delle misure di lettura (default: %(default)s)")
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'rup_fill_bench'),
+                        help="cartella per workbook sintetici, snapshot e documenti (default: %(default)s)")
+    parser.add_argument('--compress-level', type=int, default=DEFAULT_COMPRESSLEVEL, choices=range(10),
+                        metavar='0-9', help="livello di compressione (default: %(default)s)")
+    parser.add_argument('--no-fast-path', action='store_true',
+                        help="rende tutti i template con la pipeline completa di docxtpl")
+    parser.add_argument('--startup-module', default='excel_reader_window',
+                        help="modulo di cui misurare il tempo di import all'avvio (default: %(default)s)")
+    parser.add_argument('--no-startup', action='store_true', help="salta la misura dell'avvio")
+    parser.add_argument('--output', help="salva i risultati in questo file JSON (es. come nuova baseline)")
+    parser.add_argument('--baseline', help="file JSON di una misura precedente con cui confrontarsi")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="peggioramento relativo tollerato prima di segnalare una regressione "
+                             "(default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    os.makedirs(args.workdir, exist_ok=True)
+
+    template_paths = []
+    for path in args.templates:
+        if os.path.isdir(path):
+            template_paths.extend(sorted(glob.glob(os.path.join(path, '**', '*.docx'), recursive=True)))
+        else:
+            template_paths.append(path)
+    template_paths = [p for p in template_paths if not os.path.basename(p).startswith('~$')]
+
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'docs': args.docs, 'repeat': args.repeat, 'compress_level': args.compress_level,
+                     'fast_path': not args.no_fast_path},
+        'loading': bench_loading(args.sizes, args.workdir, args.repeat)
+    }
+    if not args.no_startup:
+        log(f"[startup] {args.startup_module}")
+        results['startup'] = measure_startup(args.startup_module)
+    results['templates'], results['documents'] = bench_templates(
+        template_paths, args.workdir, args.docs, not args.no_fast_path, args.compress_level)
+    results['peak_rss_mb'] = peak_rss_mb()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    status = 0
+    mismatches = results['documents']['fast_path_mismatches']
+    for name in mismatches:
+        log(f"DIFFERENZA fast path/docxtpl in {name}: {', '.join(results['templates'][name]['fast_path_differences'])}")
+    if mismatches:
+        status = 1
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results['regressions'] = regressions
+        for regression in regressions:
+            log(f"REGRESSIONE {regression}")
+        status = 1 if regressions or mismatches else 0
+
+    documents = results['documents']
+    log(f"{documents['documents']} documenti, {documents['docs_per_second']} doc/s, "
+        f"picco RSS {results['peak_rss_mb']} MB")
+    startup = results.get('startup')
+    if startup:
+        log(f"avvio {startup['module']}: "
+            + (f"{startup['import_seconds']} s di import, librerie pesanti caricate: "
+               f"{', '.join(startup['heavy_modules_loaded']) or 'nessuna'}"
+               if 'error' not in startup else startup['error']))
+    print(json.dumps(results, ensure_ascii=False))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
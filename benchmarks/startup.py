@@ -0,0 +1,55 @@
+"""Start-up cost of the GUI modules, measured with python -X importtime"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Librerie che non dovrebbero essere caricate all'avvio della finestra
+HEAVY_MODULES = ['openpyxl', 'docxtpl', 'docx', 'lxml', 'jinja2', 'pandas']
+
+
+def parse_importtime(output):
+    """[(module, self_us, cumulative_us, depth)] from -X importtime stderr output"""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+            entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        except ValueError:
+            continue
+    return entries
+
+
+def measure_startup(module='excel_reader_window', runs=3):
+    """Import time of module in fresh interpreters: median seconds, heavy modules loaded, slowest imports"""
+    import_seconds = []
+    wall_seconds = []
+    entries = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=REPO_DIR, capture_output=True, text=True,
+                                env=dict(os.environ, QT_QPA_PLATFORM='offscreen'))
+        wall_seconds.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            return {'module': module, 'error': result.stderr.strip().splitlines()[-1]}
+        entries = parse_importtime(result.stderr)
+        total = sum(cumulative for name, self_us, cumulative, depth in entries if depth == 0)
+        import_seconds.append(total / 1e6)
+
+    loaded = {name for name, self_us, cumulative, depth in entries}
+    slowest = sorted((e for e in entries if e[3] <= 1), key=lambda e: e[2], reverse=True)[:10]
+    return {
+        'module': module,
+        'runs': runs,
+        'import_seconds': round(statistics.median(import_seconds), 4),
+        'wall_seconds': round(statistics.median(wall_seconds), 4),
+        'heavy_modules_loaded': [name for name in HEAVY_MODULES if name in loaded],
+        'slowest': [{'module': name, 'cumulative_seconds': cumulative / 1e6}
+                    for name, self_us, cumulative, depth in slowest]
+    }
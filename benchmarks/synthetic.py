@@ -0,0 +1,48 @@
+"""Synthetic procedure workbooks shaped like template.xlsx"""
+import os
+
+import openpyxl
+
+from rup_fill.workbook import GENERAZIONI_OFFERTE
+
+TEMPLATE_WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'template.xlsx')
+
+CITIES = [('Firenze', 50121), ('Prato', 59100), ('Pisa', 56121), ('Roma', 100), ('Bologna', 40121),
+          ('Sassari', 7100), ('Lecce', 73100), ('Trento', 38121)]
+
+
+def synthetic_row(i, headers):
+    """Values for the i-th generazioni_offerte row, one per header"""
+    city, cap = CITIES[i % len(CITIES)]
+    known = {
+        'nome_OE': f"Operatore Economico {i} S.r.l.",
+        'indirizzo_OE': f"via della Ricerca {i % 400 + 1}",
+        'sede_OE': city,
+        'cap_OE': cap + i % 20,
+        'pec_OE': f"oe{i}@pec.example.it",
+        'CNEL_OE': f"K{i % 97:03d}",
+        'Codice_ATECO_OE': f"{i % 99 + 1:02d}.{i % 9}{i % 7}.{i % 10}0"
+    }
+    return [known.get(header, f"{header} {i}") for header in headers]
+
+
+def build_workbook(rows, path, template=TEMPLATE_WORKBOOK):
+    """Save a copy of template with rows synthetic generazioni_offerte rows, returns path"""
+    wb = openpyxl.load_workbook(template)
+    ws = wb[GENERAZIONI_OFFERTE]
+    headers = [cell.value for cell in ws[1]]
+    if ws.max_row > 1:
+        ws.delete_rows(2, ws.max_row - 1)
+    for i in range(1, rows + 1):
+        ws.append(synthetic_row(i, headers))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    wb.save(path)
+    return path
+
+
+def workbook_for(rows, directory):
+    """Path of the synthetic workbook with rows rows in directory, built on first use"""
+    path = os.path.join(directory, f"synthetic_{rows}.xlsx")
+    if not os.path.exists(path):
+        build_workbook(rows, path)
+    return path
@@ -1,20 +1,33 @@
 import os
 import sys
+import time
+from contextlib import nullcontext
 from datetime import datetime
-from docxtpl import DocxTemplate
-import openpyxl
-from openpyxl.utils import get_column_letter
 
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
     QLineEdit, QPushButton, QFileDialog, QTextEdit, QMessageBox,
-    QListWidget, QListWidgetItem, QGroupBox, QTabWidget,
-    QFormLayout, QSplitter, QFrame, QScrollArea
+    QListView, QGroupBox, QTabWidget,
+    QFormLayout, QSplitter, QFrame, QScrollArea, QProgressBar, QCheckBox
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QThread, QTimer, QFileSystemWatcher, QItemSelectionModel
 from PyQt6.QtGui import QPixmap, QIcon
 from PyQt6.QtWidgets import QApplication
 
+from rup_fill.client import service_url
+from rup_fill.failures import failure_text, retry_jobs
+from rup_fill.parallel import default_workers, new_executor
+from rup_fill.render import build_context, iter_jobs, today
+from rup_fill.schema import build_schema, load_schema
+from rup_fill.timing import Timings, collect, span
+from rup_fill.workbook import DATI_GENERALI, GENERAZIONI_OFFERTE
+from field_form import FieldForm
+from models import DatiGeneraliModel, OfferteModel
+from workers import GenerationWorker, SchemaLoader, WorkbookLoader, WorkbookReloader
+
+# Documenti elencati nei messaggi di fine generazione (gli altri sono nel log)
+MAX_LISTED_DOCUMENTS = 30
+
 class ExcelReaderWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -131,10 +144,32 @@ class ExcelReaderWindow(QMainWindow):
         
         # Current data storage
         self.current_file = None
+        self.generation_thread = None
+        self.generation_worker = None
+        self.generation_log = None
+        # Documenti dell'ultima generazione e voci del rapporto di quelli falliti, per "Riprova falliti"
+        self.generation_jobs = []
+        self.generation_report_dir = None
+        self.last_failures = []
+        self.failure_report = None
+        self.load_thread = None
+        self.load_worker = None
+        self.reload_thread = None
+        self.reload_worker = None
+        # Tempi dell'ultima lettura, esportati con la generazione successiva
+        self.load_timings = None
+        self.autofill_values = {}
         self.sheet_data = {
             'dati_generali_procedura': None,
             'generazioni_offerte': None
         }
+        # Processi di rendering creati alla prima generazione e tenuti fino alla chiusura:
+        # import e template restano caricati fra una generazione e l'altra
+        self.render_executor = None
+        self.schema_thread = None
+        self.schema_worker = None
+        if self.schema_pending:
+            self.start_schema_load()
         
         # Load default logo (replace with your logo path)
         self.load_logo("images/default_logo.png")
@@ -193,8 +228,25 @@ class ExcelReaderWindow(QMainWindow):
         file_button.clicked.connect(self.browse_excel_file)
         file_layout.addWidget(self.file_path)
         file_layout.addWidget(file_button)
+        
+        # Rilettura automatica quando il file viene salvato da Excel/LibreOffice
+        self.watch_checkbox = QCheckBox("Aggiorna alle modifiche del file")
+        self.watch_checkbox.setChecked(True)
+        self.watch_checkbox.toggled.connect(self.update_file_watch)
+        file_layout.addWidget(self.watch_checkbox)
+        # Tempi di lettura e generazione riportati nei risultati e salvati in JSON/CSV
+        self.timing_checkbox = QCheckBox("Misura tempi")
+        file_layout.addWidget(self.timing_checkbox)
         file_group.setLayout(file_layout)
         
+        self.file_watcher = QFileSystemWatcher(self)
+        self.file_watcher.fileChanged.connect(self.on_watched_file_changed)
+        # I salvataggi arrivano a raffiche: si rilegge solo a scrittura conclusa
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(700)
+        self.reload_timer.timeout.connect(self.reload_changed_workbook)
+        
         # Splitter for the two lists
         self.splitter = QSplitter(Qt.Orientation.Horizontal)
         self.splitter.setHandleWidth(8)
@@ -207,16 +259,22 @@ class ExcelReaderWindow(QMainWindow):
         """)
         
         # List for dati_generali_procedura
-        self.dati_generali_list = QListWidget()
-        self.dati_generali_list.itemDoubleClicked.connect(
-            lambda item: self.show_variable_value(item, 'dati_generali_procedura'))
+        self.dati_generali_model = DatiGeneraliModel(self)
+        self.dati_generali_list = QListView()
+        self.dati_generali_list.setModel(self.dati_generali_model)
+        self.dati_generali_list.setUniformItemSizes(True)
+        self.dati_generali_list.doubleClicked.connect(
+            lambda index: self.show_variable_value(index, 'dati_generali_procedura'))
         self.dati_generali_list.setMinimumWidth(300)
         
-        # List for generazioni_offerte
-        self.generazioni_offerte_list = QListWidget()
-        self.generazioni_offerte_list.setSelectionMode(QListWidget.SelectionMode.MultiSelection)
-        self.generazioni_offerte_list.itemDoubleClicked.connect(
-            lambda item: self.show_variable_value(item, 'generazioni_offerte'))
+        # List for generazioni_offerte (virtualizzata: il testo è creato solo per le righe visibili)
+        self.offerte_model = OfferteModel(self)
+        self.generazioni_offerte_list = QListView()
+        self.generazioni_offerte_list.setModel(self.offerte_model)
+        self.generazioni_offerte_list.setUniformItemSizes(True)
+        self.generazioni_offerte_list.setSelectionMode(QListView.SelectionMode.MultiSelection)
+        self.generazioni_offerte_list.doubleClicked.connect(
+            lambda index: self.show_variable_value(index, 'generazioni_offerte'))
         self.generazioni_offerte_list.setMinimumWidth(300)
         
         # Add lists to splitter
@@ -242,9 +300,9 @@ class ExcelReaderWindow(QMainWindow):
         """)
         
         # Scan button
-        scan_button = QPushButton("Leggi Fogli Excel")
-        scan_button.setIcon(QIcon.fromTheme("document-open"))
-        scan_button.setStyleSheet("""
+        self.scan_button = QPushButton("Leggi Fogli Excel")
+        self.scan_button.setIcon(QIcon.fromTheme("document-open"))
+        self.scan_button.setStyleSheet("""
             QPushButton {
                 padding: 8px;
                 background-color: #2c3e50;
@@ -255,11 +313,24 @@ class ExcelReaderWindow(QMainWindow):
                 background-color: #34495e;
             }
         """)
-        scan_button.clicked.connect(self.read_excel_sheets)
+        self.scan_button.clicked.connect(self.read_excel_sheets)
         
         # Add widgets to Excel tab
         excel_layout.addWidget(file_group)
-        excel_layout.addWidget(scan_button)
+        excel_layout.addWidget(self.scan_button)
+        
+        # Stato della lettura in background
+        load_layout = QHBoxLayout()
+        self.load_status = QLabel("")
+        self.load_status.setStyleSheet("font-size: 12px; color: #7f8c8d;")
+        self.cancel_load_btn = QPushButton("Annulla lettura")
+        self.cancel_load_btn.setIcon(QIcon.fromTheme("process-stop"))
+        self.cancel_load_btn.clicked.connect(self.cancel_excel_load)
+        self.cancel_load_btn.setVisible(False)
+        load_layout.addWidget(self.load_status, stretch=1)
+        load_layout.addWidget(self.cancel_load_btn)
+        excel_layout.addLayout(load_layout)
+        
         excel_layout.addWidget(self.splitter)
         excel_layout.addWidget(QLabel("Output:"))
         excel_layout.addWidget(self.results_display)
@@ -285,16 +356,16 @@ class ExcelReaderWindow(QMainWindow):
         layout.setContentsMargins(5, 5, 5, 5)
         
         list_widget.setStyleSheet("""
-            QListWidget {
+            QListView {
                 background-color: #f8f9fa;
                 border: 1px solid #dee2e6;
                 padding: 5px;
                 font-size: 12px;
             }
-            QListWidget::item {
+            QListView::item {
                 padding: 3px;
             }
-            QListWidget::item:selected {
+            QListView::item:selected {
                 background-color: #d4e6f1;
                 color: #2c3e50;
             }
@@ -317,250 +388,188 @@ class ExcelReaderWindow(QMainWindow):
             self.current_file = file_name
             self.cartella_assoluta = os.path.dirname(file_name)  # Aggiorna la cartella con l'ultima usata
             self.results_display.append(f"File selezionato: {file_name}")
-
-    def format_excel_date(self, value):
-        """Format Excel date value to dd/mm/YYYY string"""
-        if value is None:
-            return ""
-        
-        if isinstance(value, datetime):
-            return value.strftime("%d/%m/%Y")
-        elif isinstance(value, str):
-            try:
-                # Try to parse string as date
-                dt = datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
-                return dt.strftime("%d/%m/%Y")
-            except ValueError:
-                try:
-                    dt = datetime.strptime(value, "%d/%m/%Y")
-                    return dt.strftime("%d/%m/%Y")
-                except ValueError:
-                    return value
-        else:
-            try:
-                # Try to convert Excel numeric date
-                dt = datetime.fromordinal(datetime(1900, 1, 1).toordinal() + int(value) - 2)
-                return datetime.fromordinal(dt).strftime("%d/%m/%Y")
-            except (ValueError, TypeError):
-                return str(value)
+            self.update_file_watch()
 
     def read_excel_sheets(self):
         if not self.current_file:
             QMessageBox.warning(self, "Attenzione", "Seleziona prima un file excel.")
             return
+        
+        if self.load_thread is not None:
+            QMessageBox.warning(self, "Attenzione", "Lettura del file Excel già in corso.")
+            return
             
-        try:
-            workbook = openpyxl.load_workbook(self.current_file, read_only=True, data_only=True)
-            
-            # Clear previous data
-            self.dati_generali_list.clear()
-            self.generazioni_offerte_list.clear()
-            self.sheet_data = {
-                'dati_generali_procedura': None,
-                'generazioni_offerte': None
-            }
-            
-            # List of date fields that need special formatting
-            date_fields = [
-                'data_nascita_richiedente',
-                'data_nascita_RUP',
-                'data_nascita_direttore',
-                'data_nascita_RSS',
-                'data_rda',
-                'data_scadenza',
-                'data_scadenza_offerta',
-                'data_oggi'
-            ]
-            
-            # Read dati_generali_procedura sheet
-            if 'dati_generali_procedura' in workbook.sheetnames:
-                sheet = workbook['dati_generali_procedura']
-                self.sheet_data['dati_generali_procedura'] = sheet
-                
-                # Mappatura tra nomi delle colonne Excel e campi QLineEdit
-                field_mapping = {
-                    'numero_CUP': None,
-                    'servizio_fornitura': None,
-                    'acronimo_progetto': None,
-                    'oggetto_fornitura_servizio': None,
-                    'oggetto_esteso_fornitura_servizio': None,
-                    'nome_cognome_richiedente': None,
-                    'mail_contatto_richiedente': None,
-                    'data_oggi': None,
-                    'data_rda': None,
-                    'data_scadenza': None,
-                    'descrizione_servizio_fornitura': None,
-                    'descrizione_caratteristiche_prestazioni': None,
-                    'descrizione_motivazione_acquisizione': None,
-                    'clausola_cam': None,
-                    'clausola_servizi_fornitura': None,
-                    'dichiarazione_deroga_MEPA': None,
-                    'dichiarazione_mancata_consip_informatica': None,
-                    'dichiarazione_valore_affidamento': None,
-                    'dichiarazione_motivo_deroga_principio_rotazione': None,
-                    'dichiarazione_individuazione_OE': None,
-                    'dichiarazione_individuazione_preventiva_OE': None,
-                    'dichiarazione_non_imponibile': None,
-                    'importo_massimo': None,
-                    'quantita': None,
-                    'numero_CIG': None,
-                    'numero_COAN': None,
-                    'voce_piano_dei_conti': None,
-                    'voce_costo_COAN': None,
-                    'codice_CPV': None,
-                    'piattaforma_scelta': None,
-                    'bando_MEPA':None,
-                    'riferimento_PAD': None,
-                    'codice_ateco_OE': None,
-                    'codice_ateco_OE_sec': None,
-                    'codice_ateco_OE_dich': None,
-                    'dichiarazione_individuazione_OE': None,
-                    'nome_OE_scelta': None,
-                    'indirizzo_OE_scelta': None,
-                    'legale_rap_OE_scelta': None,
-                    'sede_OE_scelta': None,
-                    'piva_OE_scelta': None,
-                    'codice_CNEL': None,
-                    'estratti_CNEL': None,
-                    'data_nascita_richiedente': None,
-                    'luogo_nascita_richiedente': None,
-                    'CF_richiedente': None,
-                    'sede_richiedente': None,
-                    'dichiarazioni_comunicazione_incarichi_richiedente': None,
-                    'dichiarazioni_partecipazione_associazioni_organizzazioni_richiedente': None,
-                    'qualifica_richiedente': None,
-                    'nome_cognome_RUP': None,
-                    'data_nascita_RUP': None,
-                    'luogo_nascita_RUP': None,
-                    'CF_RUP': None,
-                    'sede_RUP': None,
-                    'mail_contatto_RUP': None,
-                    'nome_cognome_direttore': None,
-                    'data_nascita_direttore': None,
-                    'luogo_nascita_direttore': None,
-                    'CF_direttore': None,
-                    'sede_direttore': None,
-                    'mail_contatto_direttore': None,
-                    'nome_cognome_RSS': None,
-                    'data_nascita_RSS': None,
-                    'luogo_nascita_RSS': None,
-                    'CF_RSS': None,
-                    'sede_RSS': None,
-                    'mail_contatto_RSS': None,
-                    'ulteriori_riferimenti_normativi_attuativi_operativi': None,
-                    'url_gara': None,
-                    'protocollo_RDA': None,
-                    'protocollo_richiesta_url': None,
-                    'protocollo_nomina_RUP': None,
-                    'protocollo_conflittoint_richiedente': None,
-                    'protocollo_conflittoint_RUP': None,
-                    'protocollo_conflittoint_direttore': None,
-                    'protocollo_allegato2_CIG': None,
-                    'protocollo_istruttoria_RUP': None,
-                    'protocollo_DAC': None,
-                    'protocollo_ordine': None
-                }
-                
-                # Process column C with names from column E, starting from row 2
-                for row_idx, row in enumerate(sheet.iter_rows(min_row=2, min_col=3, max_col=5, values_only=False), start=2):
-                    cell_c = row[0]  # Column C
-                    cell_e = row[2]  # Column E
-                    
-                    if (cell_c.value is None or not str(cell_c.value).strip() or 
-                        cell_e.value is None or not str(cell_e.value).strip()):
-                        continue
-                        
-                    name = str(cell_e.value)
-                    value = cell_c.value
-                    
-                    # Format date fields
-                    for date_field in date_fields:
-                        if date_field.lower() in name.lower():
-                            value = self.format_excel_date(value)
-                            break
-                    
-                    item_text = f"{name}: {value}"
-                    
-                    # Check if this value matches one of our fields
-                    for field_name in field_mapping.keys():
-                        if field_name.lower() in name.lower():
-                            field_mapping[field_name] = str(value) if value else ""
-                    
-                    item = QListWidgetItem(item_text)
-                    item.setData(Qt.ItemDataRole.UserRole, {
-                        'type': 'value',
-                        'coord': cell_c.coordinate,
-                        'name': name,
-                        'value': value
-                    })
-                    self.dati_generali_list.addItem(item)
-                
-                # Process column D with flag names, starting from row 2
-                for row_idx, row in enumerate(sheet.iter_rows(min_row=2, min_col=4, max_col=4, values_only=False), start=2):
-                    cell_d = row[0]  # Column D
-                    
-                    if cell_d.value is not None and str(cell_d.value).strip():
-                        flag_name = f"flag_{row_idx}"
-                        item_text = f"{flag_name}: {cell_d.value}"
-                        
-                        item = QListWidgetItem(item_text)
-                        item.setData(Qt.ItemDataRole.UserRole, {
-                            'type': 'flag',
-                            'coord': cell_d.coordinate,
-                            'name': flag_name,
-                            'value': cell_d.value
-                        })
-                        self.dati_generali_list.addItem(item)
-                
-                # Auto-fill QLineEdit fields
-                for field_name, value in field_mapping.items():
-                    if value is not None and field_name in self.doc_fields:
-                        self.doc_fields[field_name].setText(value)
-            
-            # Read generazioni_offerte sheet as table (first row = column names)
-            if 'generazioni_offerte' in workbook.sheetnames:
-                sheet = workbook['generazioni_offerte']
-                self.sheet_data['generazioni_offerte'] = sheet
-                
-                # Read first row as column names
-                headers = []
-                for cell in sheet[1]:
-                    header_name = str(cell.value) if cell.value else f"col_{cell.column_letter}"
-                    headers.append(header_name)
-                
-                # Read data for each subsequent row
-                for row_idx, row in enumerate(sheet.iter_rows(min_row=2), start=2):
-                    row_data = {}
-                    for col_idx, cell in enumerate(row, start=1):
-                        if col_idx - 1 < len(headers):
-                            value = cell.value
-                            # Format date fields
-                            for date_field in date_fields:
-                                if date_field.lower() in headers[col_idx - 1].lower():
-                                    value = self.format_excel_date(value)
-                                    break
-                            row_data[headers[col_idx - 1]] = value
-                    
-                    # Add to list as single item for the row
-                    item_text = f" {', '.join(f' {v}' for k, v in row_data.items() if v)}"
-                    item = QListWidgetItem(item_text)
-                    item.setData(Qt.ItemDataRole.UserRole, {
-                        'type': 'row',
-                        'row_idx': row_idx-1,
-                        'data': row_data
-                    })
-                    self.generazioni_offerte_list.addItem(item)
-            
-            workbook.close()
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Errore", f"Errore nella lettura del file Excel:\n{str(e)}")
+        # Clear previous data
+        self.dati_generali_model.clear()
+        self.offerte_model.clear()
+        self.sheet_data = {
+            DATI_GENERALI: None,
+            GENERAZIONI_OFFERTE: None
+        }
+        
+        # La lettura avviene in un thread: le righe compaiono a blocchi
+        self.scan_button.setEnabled(False)
+        self.cancel_load_btn.setVisible(True)
+        self.cancel_load_btn.setEnabled(True)
+        self.load_status.setText("Lettura in corso...")
+        
+        self.load_timings = Timings() if self.timing_checkbox.isChecked() else None
+        self.load_thread = QThread(self)
+        self.load_worker = WorkbookLoader(self.current_file, self.load_timings)
+        self.load_worker.moveToThread(self.load_thread)
+        self.load_thread.started.connect(self.load_worker.run)
+        self.load_worker.dati_generali_loaded.connect(self.on_dati_generali_loaded)
+        self.load_worker.rows_loaded.connect(self.on_rows_loaded)
+        self.load_worker.failed.connect(self.on_excel_load_failed)
+        self.load_worker.finished.connect(self.on_excel_load_finished)
+        self.load_worker.finished.connect(self.load_thread.quit)
+        self.load_worker.finished.connect(self.load_worker.deleteLater)
+        self.load_thread.finished.connect(self.load_thread.deleteLater)
+        self.load_thread.start()
+
+    def start_schema_load(self):
+        """Read variabili_testo.xlsx in a background thread and add its variables to the form"""
+        self.schema_thread = QThread(self)
+        self.schema_worker = SchemaLoader()
+        self.schema_worker.moveToThread(self.schema_thread)
+        self.schema_thread.started.connect(self.schema_worker.run)
+        self.schema_worker.loaded.connect(self.on_schema_loaded)
+        self.schema_worker.finished.connect(self.schema_thread.quit)
+        self.schema_worker.finished.connect(self.schema_worker.deleteLater)
+        self.schema_thread.finished.connect(self.schema_thread.deleteLater)
+        self.schema_thread.finished.connect(self.on_schema_thread_finished)
+        self.schema_thread.start()
+
+    def on_schema_loaded(self, schema):
+        added = [name for name in schema.names if name not in self.document_form]
+        self.document_form.extend(schema)
+        # Valori letti dal file Excel prima che i nuovi campi esistessero
+        for name in added:
+            if name in self.autofill_values:
+                self.document_form.set_value(name, self.autofill_values[name])
+
+    def on_schema_thread_finished(self):
+        self.schema_thread = None
+        self.schema_worker = None
+
+    def cancel_excel_load(self):
+        if self.load_worker is not None:
+            self.load_worker.cancel()
+            self.cancel_load_btn.setEnabled(False)
+
+    def on_dati_generali_loaded(self, entries, field_values):
+        self.sheet_data[DATI_GENERALI] = entries
+        self.dati_generali_model.set_entries(entries)
+        self.autofill_values = dict(field_values)
+        
+        # Auto-fill form fields
+        for field_name, value in field_values.items():
+            if field_name in self.document_form:
+                self.document_form.set_value(field_name, value)
+
+    def on_rows_loaded(self, rows):
+        # Le righe finiscono nello store colonnare del modello, non in item separati
+        self.offerte_model.append_rows(rows)
+        self.sheet_data[GENERAZIONI_OFFERTE] = self.offerte_model.store
+        self.load_status.setText(f"Righe lette: {len(self.offerte_model.store)}")
+
+    def on_excel_load_failed(self, message):
+        QMessageBox.critical(self, "Errore", f"Errore nella lettura del file Excel:\n{message}")
+
+    def on_excel_load_finished(self, rows_read, cancelled):
+        self.load_thread = None
+        self.load_worker = None
+        self.scan_button.setEnabled(True)
+        self.cancel_load_btn.setVisible(False)
+        self.load_status.setText(f"Righe lette: {rows_read}{' (lettura annullata)' if cancelled else ''}")
+        if self.load_timings is not None:
+            self.results_display.append(f"Tempi di lettura del file Excel:\n{self.load_timings.summary_text()}")
+        self.update_file_watch()
 
-    def show_variable_value(self, item, sheet_name):
+    def update_file_watch(self):
+        """Watch the current workbook while the option is enabled and the file has been read"""
+        if self.file_watcher.files():
+            self.file_watcher.removePaths(self.file_watcher.files())
+        loaded = any(data is not None for data in self.sheet_data.values())
+        if self.watch_checkbox.isChecked() and self.current_file and loaded and os.path.exists(self.current_file):
+            self.file_watcher.addPath(self.current_file)
+
+    def on_watched_file_changed(self, path):
+        # Molti editor salvano sostituendo il file: il watcher lo perde e va ri-aggiunto
+        if path not in self.file_watcher.files() and os.path.exists(path):
+            self.file_watcher.addPath(path)
+        self.reload_timer.start()
+
+    def reload_changed_workbook(self):
+        if not self.current_file or not os.path.exists(self.current_file):
+            return
+        if self.load_thread is not None or self.reload_thread is not None:
+            # Lettura già in corso: si riprova più tardi
+            self.reload_timer.start()
+            return
+        
+        self.reload_thread = QThread(self)
+        self.reload_worker = WorkbookReloader(self.current_file)
+        self.reload_worker.moveToThread(self.reload_thread)
+        self.reload_thread.started.connect(self.reload_worker.run)
+        self.reload_worker.loaded.connect(self.on_workbook_reloaded)
+        self.reload_worker.failed.connect(self.on_workbook_reload_failed)
+        self.reload_worker.finished.connect(self.on_workbook_reload_finished)
+        self.reload_worker.finished.connect(self.reload_thread.quit)
+        self.reload_worker.finished.connect(self.reload_worker.deleteLater)
+        self.reload_thread.finished.connect(self.reload_thread.deleteLater)
+        self.reload_thread.start()
+
+    def on_workbook_reloaded(self, data):
+        """Apply a re-read of the watched workbook, updating only what changed"""
+        updated_entries = 0
+        if data[DATI_GENERALI] is not None:
+            self.sheet_data[DATI_GENERALI] = data[DATI_GENERALI]
+            updated_entries = self.dati_generali_model.update_entries(data[DATI_GENERALI])
+        
+        # Solo i campi il cui valore nel foglio è cambiato: le modifiche manuali agli altri restano
+        updated_fields = 0
+        for field_name, value in data['field_values'].items():
+            if self.autofill_values.get(field_name) != value and field_name in self.document_form:
+                self.document_form.set_value(field_name, value)
+                updated_fields += 1
+        self.autofill_values = dict(data['field_values'])
+        
+        rows_message = ""
+        if data[GENERAZIONI_OFFERTE] is not None:
+            selection = self.generazioni_offerte_list.selectionModel()
+            selected_idx = {self.offerte_model.store.row_idx(index.row()) for index in selection.selectedRows()}
+            result = self.offerte_model.update_rows(data[GENERAZIONI_OFFERTE])
+            self.sheet_data[GENERAZIONI_OFFERTE] = self.offerte_model.store
+            if result is None:
+                # Colonne cambiate: modello ricostruito, si ripristina la selezione per riga
+                store = self.offerte_model.store
+                for pos in range(len(store)):
+                    if store.row_idx(pos) in selected_idx:
+                        selection.select(self.offerte_model.index(pos),
+                                         QItemSelectionModel.SelectionFlag.Select)
+                rows_message = "righe offerte ricaricate (colonne modificate)"
+            else:
+                changed, added, removed = result
+                rows_message = f"righe offerte: {changed} modificate, {added} aggiunte, {removed} rimosse"
+        
+        self.results_display.append(
+            f"File modificato: {updated_entries} voci dati procedura, "
+            f"{updated_fields} campi aggiornati, {rows_message or 'nessun foglio offerte'}")
+
+    def on_workbook_reload_failed(self, message):
+        # Il file può essere a metà salvataggio: nessun popup, si attende il prossimo salvataggio
+        self.results_display.append(f"Rilettura del file non riuscita: {message}")
+
+    def on_workbook_reload_finished(self):
+        self.reload_thread = None
+        self.reload_worker = None
+
+    def show_variable_value(self, index, sheet_name):
         if not self.current_file or sheet_name not in self.sheet_data or not self.sheet_data[sheet_name]:
             return
             
-        item_data = item.data(Qt.ItemDataRole.UserRole)
+        item_data = index.data(Qt.ItemDataRole.UserRole)
         
         try:
             if sheet_name == 'generazioni_offerte' and item_data['type'] == 'row':
@@ -573,8 +582,6 @@ class ExcelReaderWindow(QMainWindow):
                     f"----------------------------")
             else:
                 # Show details for dati_generali_procedura or single cells
-                sheet = self.sheet_data[sheet_name]
-                
                 if item_data['type'] == 'value':
                     self.results_display.append(
                         f"\nDettaglio variabile (valore):\n"
@@ -664,9 +671,9 @@ class ExcelReaderWindow(QMainWindow):
         buttons_frame.setLayout(buttons_layout)
         
         # Button for dati_generali_procedura
-        generate_dati_btn = QPushButton("Genera Documenti Dati Generali")
-        generate_dati_btn.setIcon(QIcon.fromTheme("document-save-as"))
-        generate_dati_btn.setStyleSheet("""
+        self.generate_dati_btn = QPushButton("Genera Documenti Dati Generali")
+        self.generate_dati_btn.setIcon(QIcon.fromTheme("document-save-as"))
+        self.generate_dati_btn.setStyleSheet("""
             QPushButton {
                 padding: 8px;
                 background-color: #2980b9;
@@ -677,12 +684,12 @@ class ExcelReaderWindow(QMainWindow):
                 background-color: #3498db;
             }
         """)
-        generate_dati_btn.clicked.connect(lambda: self.generate_document('dati_generali_procedura'))
+        self.generate_dati_btn.clicked.connect(lambda: self.generate_document('dati_generali_procedura'))
         
         # Button for generazioni_offerte
-        generate_offerte_btn = QPushButton("Genera Documenti Offerte")
-        generate_offerte_btn.setIcon(QIcon.fromTheme("document-save-as"))
-        generate_offerte_btn.setStyleSheet("""
+        self.generate_offerte_btn = QPushButton("Genera Documenti Offerte")
+        self.generate_offerte_btn.setIcon(QIcon.fromTheme("document-save-as"))
+        self.generate_offerte_btn.setStyleSheet("""
             QPushButton {
                 padding: 8px;
                 background-color: #27ae60;
@@ -693,254 +700,60 @@ class ExcelReaderWindow(QMainWindow):
                 background-color: #2ecc71;
             }
         """)
-        generate_offerte_btn.clicked.connect(lambda: self.generate_document('generazioni_offerte'))
+        self.generate_offerte_btn.clicked.connect(lambda: self.generate_document('generazioni_offerte'))
         
-        buttons_layout.addWidget(generate_dati_btn)
-        buttons_layout.addWidget(generate_offerte_btn)
-        container_layout.addWidget(buttons_frame)
+        # Profilo cProfile di una generazione (eseguita in sequenza per catturare il rendering)
+        self.profile_checkbox = QCheckBox("Profila (cProfile)")
         
-        # Document fields
-        self.doc_fields = {
-            # Date
-            'data_oggi': QLineEdit(),
-            'data_rda': QLineEdit(),
-            'data_scadenza': QLineEdit(),
-            'data_scadenza_offerta': QLineEdit(),
-            
-            # Informazioni generali
-            
-            'servizio_fornitura': QLineEdit(),
-            'descrizione_servizio_fornitura': QLineEdit(),
-            'descrizione_caratteristiche_prestazioni': QLineEdit(),
-            'descrizione_motivazione_acquisizione': QLineEdit(),
-            'oggetto_fornitura_servizio': QLineEdit(),
-            'oggetto_esteso_fornitura_servizio': QLineEdit(),
-            
-            # Valori economici
-            'importo_massimo': QLineEdit(),
-            'quantita': QLineEdit(),
-            'importo_oneri_sicurezza': QLineEdit(),
-            'importo_oneri_personale': QLineEdit(),
-            
-            # Codici e numeri
-            'acronimo_progetto': QLineEdit(),
-            'numero_CUP': QLineEdit(),
-            'numero_CIG': QLineEdit(),
-            'numero_COAN': QLineEdit(),
-            'voce_piano_dei_conti': QLineEdit(),
-            'voce_costo_COAN': QLineEdit(),
-            'codice_CPV': QLineEdit(),
-            'codice_ateco_OE': QLineEdit(),
-            'codice_ateco_OE_sec': QLineEdit(),
-            'codice_ateco_OE_dich': QLineEdit(),
-            'codice_CNEL': QLineEdit(),
-            'estratti_CNEL': QLineEdit(),
-            
-            # Informazioni OE
-            'piattaforma_scelta': QLineEdit(),
-            'bando_MEPA': QLineEdit(),
-            'riferimento_PAD': QLineEdit(),
-            'dichiarazione_individuazione_OE': QLineEdit(),
-            'nome_OE_scelta': QLineEdit(),
-            'indirizzo_OE_scelta': QLineEdit(),
-            'legale_rap_OE_scelta': QLineEdit(),
-            'sede_OE_scelta': QLineEdit(),
-            'piva_OE_scelta': QLineEdit(),
-            
-            # Clausole e dichiarazioni
-            'clausola_cam': QLineEdit(),
-            'clausola_servizi_fornitura': QLineEdit(),
-            'dichiarazione_deroga_MEPA': QLineEdit(),
-            'dichiarazione_mancata_consip_informatica': QLineEdit(),
-            'dichiarazione_valore_affidamento': QLineEdit(),
-            'dichiarazione_motivo_deroga_principio_rotazione': QLineEdit(),
-            'dichiarazione_individuazione_OE': QLineEdit(),
-            'dichiarazione_individuazione_preventiva_OE': QLineEdit(),
-             'dichiarazione_non_imponibile': QLineEdit(),
-            # Richiedente
-            'nome_cognome_richiedente': QLineEdit(),
-            'data_nascita_richiedente': QLineEdit(),
-            'luogo_nascita_richiedente': QLineEdit(),
-            'CF_richiedente': QLineEdit(),
-            'sede_richiedente': QLineEdit(),
-            'firma_richiedente': QLineEdit(),
-            'img_documento_richiedente': QLineEdit(),
-            'dichiarazioni_comunicazione_incarichi_richiedente': QLineEdit(),
-            'dichiarazioni_partecipazione_associazioni_organizzazioni_richiedente': QLineEdit(),
-            'mail_contatto_richiedente': QLineEdit(),
-            'qualifica_richiedente': QLineEdit(),
-            
-            # RUP
-            'nome_cognome_RUP': QLineEdit(),
-            'data_nascita_RUP': QLineEdit(),
-            'luogo_nascita_RUP': QLineEdit(),
-            'CF_RUP': QLineEdit(),
-            'sede_RUP': QLineEdit(),
-            'firma_RUP': QLineEdit(),
-            'img_documento_RUP': QLineEdit(),
-            'dichiarazioni_comunicazione_incarichi_RUP': QLineEdit(),
-            'dichiarazioni_partecipazione_associazioni_organizzazioni_RUP': QLineEdit(),
-            'mail_contatto_RUP': QLineEdit(),
-            # RUP
-            'nome_cognome_supportoRUP': QLineEdit(),
-            'data_nascita_supportoRUP': QLineEdit(),
-            'luogo_nascita_supportoRUP': QLineEdit(),
-            'CF_supportoRUP': QLineEdit(),
-            'sede_supportoRUP': QLineEdit(),
-            'firma_supportoRUP': QLineEdit(),
-            'img_documento_supportoRUP': QLineEdit(),
-            'dichiarazioni_comunicazione_incarichi_supportoRUP': QLineEdit(),
-            'dichiarazioni_partecipazione_associazioni_organizzazioni_supportoRUP': QLineEdit(),
-            'mail_contatto_supportoRUP': QLineEdit(),
-            
-            # Direttore
-            'nome_cognome_direttore': QLineEdit(),
-            'data_nascita_direttore': QLineEdit(),
-            'luogo_nascita_direttore': QLineEdit(),
-            'CF_direttore': QLineEdit(),
-            'sede_direttore': QLineEdit(),
-            'firma_direttore': QLineEdit(),
-            'img_documento_direttore': QLineEdit(),
-            'dichiarazioni_comunicazione_incarichi_direttore': QLineEdit(),
-            'dichiarazioni_partecipazione_associazioni_organizzazioni_direttore': QLineEdit(),
-            'mail_contatto_direttore': QLineEdit(),
-            
-            # RSS
-            'nome_cognome_RSS': QLineEdit(),
-            'data_nascita_RSS': QLineEdit(),
-            'luogo_nascita_RSS': QLineEdit(),
-            'CF_RSS': QLineEdit(),
-            'sede_RSS': QLineEdit(),
-            'firma_RSS': QLineEdit(),
-            'img_documento_RSS': QLineEdit(),
-            'dichiarazioni_comunicazione_incarichi_RSS': QLineEdit(),
-            'dichiarazioni_partecipazione_associazioni_organizzazioni_RSS': QLineEdit(),
-            'mail_contatto_RSS': QLineEdit(),
-            
-            # Protocolli e riferimenti
-            'ulteriori_riferimenti_normativi_attuativi_operativi': QLineEdit(),
-            'url_gara': QLineEdit(),
-            'protocollo_RDA': QLineEdit(),
-            'protocollo_richiesta_url': QLineEdit(),
-            'protocollo_nomina_RUP': QLineEdit(),
-            'protocollo_conflittoint_richiedente': QLineEdit(),
-            'protocollo_conflittoint_RUP': QLineEdit(),
-            'protocollo_conflittoint_direttore': QLineEdit(),
-            'protocollo_allegato2_CIG': QLineEdit(),
-            'protocollo_istruttoria_RUP': QLineEdit(),
-            'protocollo_DAC': QLineEdit(),
-            'protocollo_ordine': QLineEdit()
-        }
+        # Manifest nella cartella di output: i documenti con gli stessi dati non vengono rigenerati
+        self.incremental_checkbox = QCheckBox("Solo documenti modificati")
+        self.incremental_checkbox.setChecked(True)
         
-        # Organizza i campi in gruppi logici
-        groups = [
-            ("Informazioni Generali", [
-                'data_oggi', 'data_rda', 'data_scadenza','data_scadenza_offerta',
-                'descrizione_servizio_fornitura',
-                'descrizione_caratteristiche_prestazioni',
-                'descrizione_motivazione_acquisizione'
-            ]),
-            
-            ("Clausole e Dichiarazioni", [
-                'clausola_cam', 'clausola_servizi_fornitura',
-                'dichiarazione_deroga_MEPA', 'dichiarazione_mancata_consip_informatica',
-                'dichiarazione_valore_affidamento', 'dichiarazione_motivo_deroga_principio_rotazione',
-                'dichiarazione_individuazione_OE',
-                'dichiarazione_individuazione_preventiva_OE',
-                'dichiarazione_non_imponibile'
-
-         
-                
-            ]),
-            
-            ("Valori Economici", [
-                'importo_massimo', 'quantita',
-                'importo_oneri_sicurezza', 'importo_oneri_personale'
-            ]),
-            
-            ("Codici e Numeri", [
-                'acronimo_progetto', 'numero_CUP', 'numero_CIG',
-                'numero_COAN', 'voce_piano_dei_conti', 'voce_costo_COAN',
-                'codice_CPV', 'codice_ateco_OE', 'codice_ateco_OE_sec',
-                'codice_ateco_OE_dich', 'codice_CNEL', 'estratti_CNEL'
-            ]),
-            
-            ("Informazioni Operatore Economico", [
-                'piattaforma_scelta', 'bando_MEPA','riferimento_PAD',
-                'dichiarazione_individuazione_OE','nome_OE_scelta', 'indirizzo_OE_scelta',
-                'legale_rap_OE_scelta', 'sede_OE_scelta', 'piva_OE_scelta'
-            ]),
-            
-            ("Richiedente", [
-                'nome_cognome_richiedente', 'data_nascita_richiedente',
-                'luogo_nascita_richiedente', 'CF_richiedente', 'sede_richiedente',
-                'dichiarazioni_comunicazione_incarichi_richiedente',
-                'dichiarazioni_partecipazione_associazioni_organizzazioni_richiedente',
-                'mail_contatto_richiedente', 'qualifica_richiedente'
-            ]),
-            
-            ("RUP", [
-                'nome_cognome_RUP', 'data_nascita_RUP',
-                'luogo_nascita_RUP', 'CF_RUP', 'sede_RUP',
-                'dichiarazioni_comunicazione_incarichi_RUP',
-                'dichiarazioni_partecipazione_associazioni_organizzazioni_RUP',
-                'mail_contatto_RUP'
-            ]),
-            ("supportoRUP", [
-                'nome_cognome_supportoRUP', 'data_nascita_supportoRUP',
-                'luogo_nascita_supportoRUP', 'CF_supportoRUP', 'sede_supportoRUP',
-                'dichiarazioni_comunicazione_incarichi_supportoRUP',
-                'dichiarazioni_partecipazione_associazioni_organizzazioni_supportoRUP',
-                'mail_contatto_supportoRUP'
-            ]),
-            ("Direttore", [
-                'nome_cognome_direttore', 'data_nascita_direttore',
-                'luogo_nascita_direttore', 'CF_direttore', 'sede_direttore',
-                'dichiarazioni_comunicazione_incarichi_direttore',
-                'dichiarazioni_partecipazione_associazioni_organizzazioni_direttore',
-                'mail_contatto_direttore'
-            ]),
-            
-            ("RSS", [
-                'nome_cognome_RSS', 'data_nascita_RSS',
-                'luogo_nascita_RSS', 'CF_RSS', 'sede_RSS',
-                'dichiarazioni_comunicazione_incarichi_RSS',
-                'dichiarazioni_partecipazione_associazioni_organizzazioni_RSS',
-                'mail_contatto_RSS'
-            ]),
-            
-            ("Protocolli e Riferimenti", [
-                'ulteriori_riferimenti_normativi_attuativi_operativi',
-                'url_gara', 'protocollo_RDA', 'protocollo_richiesta_url',
-                'protocollo_nomina_RUP', 'protocollo_conflittoint_richiedente',
-                'protocollo_conflittoint_RUP', 'protocollo_conflittoint_direttore',
-                'protocollo_allegato2_CIG', 'protocollo_istruttoria_RUP',
-                'protocollo_DAC', 'protocollo_ordine'
-            ]),
-            
-            ("Generazione Offerte - Campi Principali", [
-                'servizio_fornitura', 
-                'acronimo_progetto',
-                'numero_CUP',
-                'oggetto_fornitura_servizio',
-                'oggetto_esteso_fornitura_servizio',                                
-                'nome_cognome_richiedente', 
-                'mail_contatto_richiedente'
-            ])
-        ]
-        
-        # Aggiungi i gruppi al layout
-        for group_name, fields in groups:
-            group_box = QGroupBox(group_name)
-            group_layout = QFormLayout()
-            
-            for field_name in fields:
-                label = field_name.replace('_', ' ').title() + ":"
-                self.doc_fields[field_name].setPlaceholderText(f"Inserisci {label.lower()}")
-                group_layout.addRow(label, self.doc_fields[field_name])
-            
-            group_box.setLayout(group_layout)
-            container_layout.addWidget(group_box)
+        # Rendering affidato al servizio locale (python -m rup_fill.service) con i template già in memoria
+        self.service_checkbox = QCheckBox("Usa servizio di rendering")
+        self.service_checkbox.setToolTip(f"Invia i documenti al servizio in ascolto su {service_url()}")
+        
+        buttons_layout.addWidget(self.generate_dati_btn)
+        buttons_layout.addWidget(self.generate_offerte_btn)
+        buttons_layout.addWidget(self.incremental_checkbox)
+        buttons_layout.addWidget(self.service_checkbox)
+        buttons_layout.addWidget(self.profile_checkbox)
+        container_layout.addWidget(buttons_frame)
+        
+        # Avanzamento della generazione in background
+        progress_frame = QFrame()
+        progress_layout = QHBoxLayout()
+        progress_layout.setContentsMargins(0, 0, 0, 0)
+        progress_frame.setLayout(progress_layout)
+        
+        self.generation_progress = QProgressBar()
+        self.generation_progress.setFormat("%v/%m documenti")
+        self.generation_status = QLabel("")
+        self.generation_status.setStyleSheet("font-size: 12px; color: #7f8c8d;")
+        self.cancel_generation_btn = QPushButton("Annulla")
+        self.cancel_generation_btn.setIcon(QIcon.fromTheme("process-stop"))
+        self.cancel_generation_btn.clicked.connect(self.cancel_generation)
+        self.retry_failed_btn = QPushButton("Riprova falliti")
+        self.retry_failed_btn.setIcon(QIcon.fromTheme("view-refresh"))
+        self.retry_failed_btn.setToolTip("Rigenera solo i documenti non riusciti nell'ultima generazione")
+        self.retry_failed_btn.setEnabled(False)
+        self.retry_failed_btn.clicked.connect(self.retry_failed)
+        
+        progress_layout.addWidget(self.generation_progress, stretch=1)
+        progress_layout.addWidget(self.generation_status)
+        progress_layout.addWidget(self.cancel_generation_btn)
+        progress_layout.addWidget(self.retry_failed_btn)
+        progress_frame.setVisible(False)
+        self.generation_progress_frame = progress_frame
+        container_layout.addWidget(progress_frame)
+        
+        # Document fields: i campi di un gruppo vengono creati alla prima apertura.
+        # Senza la cache dello schema si parte dai campi predefiniti: variabili_testo.xlsx
+        # (e openpyxl) si leggono in background e le altre variabili si aggiungono dopo
+        schema = load_schema(cached_only=True)
+        self.schema_pending = schema is None
+        self.document_form = FieldForm(schema or build_schema())
+        container_layout.addWidget(self.document_form)
         
         # Set the container as the scroll area's widget
         scroll_area.setWidget(container)
@@ -971,7 +784,7 @@ class ExcelReaderWindow(QMainWindow):
     def generate_document(self, source_sheet):
         """Generate Word documents from multiple templates using data from specified sheet"""
         # Get current date in the desired format
-        current_date = datetime.now().strftime('%d/%m/%Y')
+        current_date = today()
         
         template_paths = [path.strip() for path in self.template_path.text().split(";") if path.strip()]
         output_dir = self.output_dir.text()
@@ -984,106 +797,47 @@ class ExcelReaderWindow(QMainWindow):
             output_dir = "doc_generati"
             self.output_dir.setText(output_dir)
         
-        if source_sheet not in self.sheet_data or not self.sheet_data[source_sheet]:
+        if self.generation_thread is not None:
+            QMessageBox.warning(self, "Attenzione", "Generazione documenti già in corso.")
+            return
+        
+        if source_sheet not in self.sheet_data or self.sheet_data[source_sheet] is None:
             QMessageBox.warning(self, "Attenzione", f"Nessun dato disponibile dal foglio {source_sheet}")
             return
         
+        timings = None
+        if self.timing_checkbox.isChecked():
+            timings = Timings()
+            if self.load_timings is not None:
+                # La prima generazione dopo una lettura ne riporta anche i tempi
+                timings.extend(self.load_timings.records)
+                self.load_timings = None
+        
         try:
             # Create output directory if not exists
             if not os.path.exists(output_dir):
                 os.makedirs(output_dir)
             
             # Prepare base context (dati_generali + form fields)
-            context = {
-                'data_oggi': current_date,
-                'data_corrente': current_date
-            }
-            
-            # Add all form fields to context
-            for field_name, widget in self.doc_fields.items():
-                context[field_name] = widget.text()
-            
-            # Add data from dati_generali_procedura sheet
-            for i in range(self.dati_generali_list.count()):
-                item = self.dati_generali_list.item(i)
-                item_data = item.data(Qt.ItemDataRole.UserRole)
-                context[item_data['name']] = item_data['value']
+            form_values = self.document_form.form_values()
+            with collect(timings) if timings is not None else nullcontext(), span('build_context'):
+                context = build_context(form_values, self.sheet_data[DATI_GENERALI], current_date)
             
+            rows = None
             # Special processing for generazioni_offerte sheet
-            if source_sheet == 'generazioni_offerte':
+            if source_sheet == GENERAZIONI_OFFERTE:
                 # Genera un documento per ogni riga selezionata
-                selected_items = self.generazioni_offerte_list.selectedItems()
-                if not selected_items:
+                selected_rows = sorted(index.row() for index in
+                                       self.generazioni_offerte_list.selectionModel().selectedRows())
+                if not selected_rows:
                     QMessageBox.warning(self, "Attenzione", "Seleziona almeno una riga dal foglio generazioni_offerte.")
                     return
-                
-                generated_files = []
-                for item in selected_items:
-                    item_data = item.data(Qt.ItemDataRole.UserRole)
-                    row_context = context.copy()
-                    row_context.update(item_data['data'])
-                    
-                    # Generate documents for each template
-                    for template_path in template_paths:
-                        try:
-                            # Generate filename with current date
-                            cognome = row_context['nome_cognome_richiedente'].split()[-1] if row_context['nome_cognome_richiedente'] else 'documento'
-                            progetto = row_context['acronimo_progetto']
-                            template_name = os.path.splitext(os.path.basename(template_path))[0]
-                            output_filename = f"Richiesta_Offerta_{cognome}_{progetto}_OE_{item_data['row_idx']}_{current_date.replace('/', '-')}.docx"
-                            output_path = os.path.join(output_dir, output_filename)
-                            
-                            # Render and save document
-                            doc = DocxTemplate(template_path)
-                            doc.render(row_context)
-                            doc.save(output_path)
-                            generated_files.append(output_path)
-                            
-                        except Exception as e:
-                            QMessageBox.warning(
-                                self, 
-                                "Attenzione", 
-                                f"Errore durante la generazione del documento {template_path}:\n{str(e)}"
-                            )
-                            continue
-                
-                if generated_files:
-                    success_message = f"Documenti generati con successo il {current_date}:\n\n" + "\n".join(generated_files)
-                    QMessageBox.information(self, "Successo", success_message)
-                else:
-                    QMessageBox.warning(self, "Attenzione", "Nessun documento è stato generato.")
+                store = self.offerte_model.store
+                rows = [store[pos] for pos in selected_rows]
             
-            else:
-                # Original processing for dati_generali_procedura
-                generated_files = []
-                for template_path in template_paths:
-                    try:
-                        # Generate filename with current date
-                        cognome = context['nome_cognome_richiedente'].split()[-1] if context['nome_cognome_richiedente'] else 'documento'
-                        progetto = context['acronimo_progetto']
-                        template_name = os.path.splitext(os.path.basename(template_path))[0]
-                        output_filename = f"{template_name}_{cognome}_{progetto}_{current_date.replace('/', '-')}.docx"
-                        output_path = os.path.join(output_dir, output_filename)
-                        
-                        # Render and save document
-                        doc = DocxTemplate(template_path)
-                        doc.render(context)
-                        doc.save(output_path)
-                        generated_files.append(output_path)
-                        
-                    except Exception as e:
-                        QMessageBox.warning(
-                            self, 
-                            "Attenzione", 
-                            f"Errore durante la generazione del documento {template_path}:\n{str(e)}"
-                        )
-                        continue
-                
-                if generated_files:
-                    success_message = f"Documenti generati con successo il {current_date}:\n\n" + "\n".join(generated_files)
-                    QMessageBox.information(self, "Successo", success_message)
-                else:
-                    QMessageBox.warning(self, "Attenzione", "Nessun documento è stato generato.")
+            with collect(timings) if timings is not None else nullcontext(), span('build_jobs'):
+                jobs = list(iter_jobs(source_sheet, context, template_paths, output_dir, current_date, rows))
+            self.start_generation(jobs, current_date, timings, output_dir)
                     
         except Exception as e:
             QMessageBox.critical(
@@ -1092,6 +846,164 @@ class ExcelReaderWindow(QMainWindow):
                 f"Errore durante la generazione dei documenti il {current_date}:\n{str(e)}"
             )
 
+    def start_generation(self, jobs, current_date, timings=None, report_dir=None, workers=None):
+        """Render jobs in a background thread, keeping the window responsive"""
+        self.generation_jobs = jobs
+        self.generation_report_dir = report_dir
+        self.failure_report = None
+        self.retry_failed_btn.setEnabled(False)
+        self.generation_date = current_date
+        self.generation_started = time.perf_counter()
+        self.generation_progress.setRange(0, len(jobs))
+        self.generation_progress.setValue(0)
+        self.generation_status.setText("Avvio generazione...")
+        self.cancel_generation_btn.setEnabled(True)
+        self.generation_progress_frame.setVisible(True)
+        self.generate_dati_btn.setEnabled(False)
+        self.generate_offerte_btn.setEnabled(False)
+        
+        self.generation_thread = QThread(self)
+        profile = self.profile_checkbox.isChecked()
+        manifest_dir = report_dir if self.incremental_checkbox.isChecked() else None
+        # La raggiungibilità del servizio viene verificata dal worker, fuori dal thread della GUI
+        service = service_url() if self.service_checkbox.isChecked() and not profile else None
+        workers = 1 if profile else workers
+        executor = None
+        if workers != 1:
+            # Anche con il servizio: serve se non risponde (i processi partono solo al primo uso)
+            executor = self.render_pool()
+        self.generation_worker = GenerationWorker(jobs, workers=workers, timings=timings,
+                                                  report_dir=report_dir, profile=profile,
+                                                  manifest_dir=manifest_dir, service=service,
+                                                  templates=dict.fromkeys(job[1] for job in jobs),
+                                                  executor=executor)
+        self.generation_worker.moveToThread(self.generation_thread)
+        self.generation_thread.started.connect(self.generation_worker.run)
+        self.generation_worker.progress.connect(self.on_generation_progress)
+        self.generation_worker.report.connect(self.on_generation_report)
+        self.generation_worker.log_started.connect(self.on_generation_log)
+        self.generation_worker.failures_saved.connect(self.on_failures_saved)
+        self.generation_worker.service_unavailable.connect(self.on_service_unavailable)
+        self.generation_worker.finished.connect(self.on_generation_finished)
+        self.generation_worker.finished.connect(self.generation_thread.quit)
+        self.generation_worker.finished.connect(self.generation_worker.deleteLater)
+        self.generation_thread.finished.connect(self.generation_thread.deleteLater)
+        self.generation_thread.start()
+
+    def render_pool(self):
+        """Worker processes shared by the generations of this window, started on first use"""
+        if self.render_executor is None:
+            self.render_executor = new_executor(default_workers())
+        return self.render_executor
+
+    def cancel_generation(self):
+        if self.generation_worker is not None:
+            self.generation_worker.cancel()
+            self.cancel_generation_btn.setEnabled(False)
+            self.generation_status.setText("Annullamento in corso...")
+
+    def retry_failed(self):
+        """Generate again only the documents that failed in the last generation"""
+        if self.generation_thread is not None or not self.last_failures:
+            return
+        jobs = retry_jobs(self.generation_jobs, self.last_failures)
+        if not jobs:
+            QMessageBox.warning(self, "Attenzione", "Nessun documento fallito da rigenerare.")
+            return
+        self.results_display.append(f"Nuovo tentativo per {len(jobs)} documenti non riusciti")
+        # Nel processo dell'interfaccia i template falliti sono già in cache (letti per il rapporto)
+        self.start_generation(jobs, self.generation_date, report_dir=self.generation_report_dir, workers=1)
+
+    def on_generation_progress(self, done, total, output_path, error):
+        """Update progress bar, documents per second and ETA"""
+        self.generation_progress.setValue(done)
+        elapsed = time.perf_counter() - self.generation_started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = int((total - done) / rate) if rate > 0 else 0
+        if self.cancel_generation_btn.isEnabled():
+            self.generation_status.setText(
+                f"{rate:.1f} doc/s - tempo residuo {eta // 60:02d}:{eta % 60:02d}")
+
+    def on_generation_report(self, report):
+        self.results_display.append(report)
+
+    def on_generation_log(self, log_path):
+        self.generation_log = log_path
+        self.results_display.append(f"Esito dei documenti registrato in: {log_path}")
+
+    def on_service_unavailable(self, url):
+        self.results_display.append(f"Servizio di rendering non raggiungibile su {url}: generazione locale")
+
+    def on_failures_saved(self, report_path):
+        self.failure_report = report_path
+        self.results_display.append(f"Rapporto degli errori salvato in: {report_path}")
+
+    def on_generation_finished(self, generated_files, failures, cancelled, skipped=0):
+        current_date = self.generation_date
+        if self.generation_worker.pool_broken and self.render_executor is not None:
+            # Alla prossima generazione si riparte con processi nuovi
+            self.render_executor.shutdown(wait=False, cancel_futures=True)
+            self.render_executor = None
+        self.generation_thread = None
+        self.generation_worker = None
+        self.generate_dati_btn.setEnabled(True)
+        self.generate_offerte_btn.setEnabled(True)
+        self.cancel_generation_btn.setEnabled(False)
+        elapsed = time.perf_counter() - self.generation_started
+        rebuilt = len(generated_files) - skipped
+        self.generation_status.setText(
+            f"{'Annullata' if cancelled else 'Completata'}: {rebuilt} documenti generati, "
+            f"{skipped} invariati in {elapsed:.1f} s")
+        if skipped:
+            self.results_display.append(
+                f"Generazione: {rebuilt} documenti rigenerati, {skipped} già aggiornati e non rigenerati")
+        
+        log_note = f"\n\nElenco completo in: {self.generation_log}" if self.generation_log else ""
+        self.generation_log = None
+        self.last_failures = failures
+        self.retry_failed_btn.setEnabled(bool(retry_jobs(self.generation_jobs, failures)))
+        if failures:
+            details = "\n".join(failure_text(failure) for failure in failures[:MAX_LISTED_DOCUMENTS])
+            if len(failures) > MAX_LISTED_DOCUMENTS:
+                details += f"\n... e altri {len(failures) - MAX_LISTED_DOCUMENTS}"
+            report_note = f"\n\nRapporto degli errori: {self.failure_report}" if self.failure_report else ""
+            QMessageBox.warning(
+                self, 
+                "Attenzione", 
+                f"Errore durante la generazione di {len(failures)} documenti:\n{details}{report_note}{log_note}"
+            )
+        
+        if generated_files:
+            listed = "\n".join(generated_files[:MAX_LISTED_DOCUMENTS])
+            if len(generated_files) > MAX_LISTED_DOCUMENTS:
+                listed += f"\n... e altri {len(generated_files) - MAX_LISTED_DOCUMENTS} documenti"
+            success_message = f"Documenti generati con successo il {current_date}:\n\n{listed}{log_note}"
+            QMessageBox.information(self, "Successo", success_message)
+        elif not cancelled:
+            QMessageBox.warning(self, "Attenzione", "Nessun documento è stato generato.")
+
+    def closeEvent(self, event):
+        # Non lasciare thread orfani alla chiusura
+        self.reload_timer.stop()
+        if self.schema_thread is not None:
+            self.schema_thread.quit()
+            self.schema_thread.wait()
+        if self.reload_thread is not None:
+            self.reload_thread.quit()
+            self.reload_thread.wait()
+        if self.load_thread is not None:
+            self.load_worker.cancel()
+            self.load_thread.quit()
+            self.load_thread.wait()
+        if self.generation_thread is not None:
+            self.generation_worker.cancel()
+            self.generation_thread.quit()
+            self.generation_thread.wait()
+        if self.render_executor is not None:
+            self.render_executor.shutdown(wait=False, cancel_futures=True)
+            self.render_executor = None
+        super().closeEvent(event)
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
@@ -0,0 +1,120 @@
+import os
+
+from PyQt6.QtWidgets import (QFileDialog, QFormLayout, QGroupBox, QHBoxLayout, QLineEdit, QPushButton,
+                             QVBoxLayout, QWidget)
+
+DATE_PLACEHOLDER = "gg/mm/aaaa"
+IMAGE_FILTER = "Immagini (*.png *.jpg *.jpeg *.bmp *.gif *.tif *.tiff)"
+
+
+class LazyFieldGroup(QGroupBox):
+    """Collapsible group of the document form whose editors are created when first expanded"""
+
+    def __init__(self, title, names, form):
+        super().__init__(title)
+        self.names = names
+        self.form = form
+        self.content = None
+        self.setCheckable(True)
+        self.setChecked(False)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(5, 5, 5, 5)
+        self.setLayout(layout)
+        self.toggled.connect(self.on_toggled)
+
+    def on_toggled(self, expanded):
+        if expanded and self.content is None:
+            self.build()
+        if self.content is not None:
+            self.content.setVisible(expanded)
+
+    def build(self):
+        self.content = QWidget()
+        layout = QFormLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        for name in self.names:
+            spec = self.form.schema.fields[name]
+            layout.addRow(spec.label, self.form.create_editor(spec))
+        self.content.setLayout(layout)
+        self.layout().addWidget(self.content)
+
+
+class FieldForm(QWidget):
+    """Document form backed by a value store instead of one QLineEdit per field.
+
+    Values live in a dict keyed by field name; editors exist only for the
+    groups that have been expanded and are kept in sync with the store (a
+    field shown in two groups has one editor per group).
+    """
+
+    def __init__(self, schema, parent=None):
+        super().__init__(parent)
+        self.schema = schema
+        self.values = {name: "" for name in schema.names}
+        self.editors = {}
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.groups = [LazyFieldGroup(title, names, self) for title, names in schema.groups]
+        for group in self.groups:
+            layout.addWidget(group)
+        self.setLayout(layout)
+
+    def __contains__(self, name):
+        return name in self.values
+
+    def extend(self, schema):
+        """Switch to schema, a superset of the current one, adding the fields and groups it introduces"""
+        titles = {group.title() for group in self.groups}
+        self.schema = schema
+        for name in schema.names:
+            self.values.setdefault(name, "")
+        for title, names in schema.groups:
+            if title not in titles:
+                group = LazyFieldGroup(title, names, self)
+                self.groups.append(group)
+                self.layout().addWidget(group)
+
+    def create_editor(self, spec):
+        editor = QLineEdit(self.values.get(spec.name, ""))
+        if spec.kind == 'date':
+            editor.setPlaceholderText(DATE_PLACEHOLDER)
+        else:
+            editor.setPlaceholderText(f"Inserisci {spec.label.lower()}")
+        editor.textEdited.connect(lambda text, name=spec.name, source=editor: self.on_edited(name, text, source))
+        self.editors.setdefault(spec.name, []).append(editor)
+        if spec.kind != 'image':
+            return editor
+
+        # Percorso dell'immagine con il pulsante per sceglierla
+        row = QWidget()
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        browse = QPushButton("Sfoglia...")
+        browse.clicked.connect(lambda checked=False, name=spec.name: self.browse_image(name))
+        layout.addWidget(editor, stretch=1)
+        layout.addWidget(browse)
+        row.setLayout(layout)
+        return row
+
+    def browse_image(self, name):
+        current = self.values.get(name, "")
+        file_name, _ = QFileDialog.getOpenFileName(
+            self, "Seleziona immagine", os.path.dirname(current) if current else os.path.expanduser("~"),
+            IMAGE_FILTER)
+        if file_name:
+            self.set_value(name, file_name)
+
+    def on_edited(self, name, text, source):
+        self.values[name] = text
+        for editor in self.editors.get(name, ()):
+            if editor is not source:
+                editor.setText(text)
+
+    def set_value(self, name, value):
+        """Store value for name, updating its editors if they have been built"""
+        self.values[name] = value
+        for editor in self.editors.get(name, ()):
+            editor.setText(value)
+
+    def form_values(self):
+        return dict(self.values)
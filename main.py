@@ -1,13 +1,23 @@
+import multiprocessing
 import sys
-from PyQt6.QtWidgets import QApplication
-from excel_reader_window import ExcelReaderWindow
 
 
 def main():
+    # Import Qt qui dentro: i processi di rendering (spawn) reimportano questo
+    # modulo e non devono caricare PyQt6
+    from PyQt6.QtCore import QTimer
+    from PyQt6.QtWidgets import QApplication
+    from excel_reader_window import ExcelReaderWindow
+    from rup_fill.warmup import start_warmup
+
     app = QApplication(sys.argv)
     window = ExcelReaderWindow()
     window.show()
+    # openpyxl e docxtpl si caricano solo dopo che la finestra è visibile
+    QTimer.singleShot(0, start_warmup)
     sys.exit(app.exec())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Necessario per i processi di rendering nell'eseguibile compilato
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,111 @@
+from PyQt6.QtCore import QAbstractListModel, QModelIndex, Qt
+
+from rup_fill.store import RowStore
+
+
+class DatiGeneraliModel(QAbstractListModel):
+    """Variables and flags read from dati_generali_procedura"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.entries = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self.entries[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f"{entry['name']}: {entry['value']}"
+        if role == Qt.ItemDataRole.UserRole:
+            return entry
+        return None
+
+    def set_entries(self, entries):
+        self.beginResetModel()
+        self.entries = list(entries)
+        self.endResetModel()
+
+    def update_entries(self, entries):
+        """Replace only the entries that changed; return how many were updated"""
+        entries = list(entries)
+        if len(entries) != len(self.entries):
+            self.set_entries(entries)
+            return len(entries)
+        changed = 0
+        for pos, entry in enumerate(entries):
+            if entry != self.entries[pos]:
+                self.entries[pos] = entry
+                index = self.index(pos)
+                self.dataChanged.emit(index, index)
+                changed += 1
+        return changed
+
+    def clear(self):
+        self.set_entries([])
+
+
+class OfferteModel(QAbstractListModel):
+    """generazioni_offerte rows backed by a RowStore; display text is built lazily"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = RowStore()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.store)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.store.display_text(index.row())
+        if role == Qt.ItemDataRole.UserRole:
+            return self.store[index.row()]
+        return None
+
+    def append_rows(self, rows):
+        if not rows:
+            return
+        first = len(self.store)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.store.extend(rows)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.store = RowStore()
+        self.endResetModel()
+
+    def update_rows(self, rows):
+        """Apply a re-read of the sheet touching only changed rows.
+
+        Returns (changed, added, removed), or None when the columns changed
+        and the whole model had to be rebuilt.
+        """
+        store = self.store
+        headers = list(max((row['data'] for row in rows), key=len)) if rows else store.headers
+        if len(store) and headers != store.headers:
+            self.clear()
+            self.append_rows(rows)
+            return None
+
+        common = min(len(store), len(rows))
+        changed = 0
+        for pos in range(common):
+            if not store.matches(pos, rows[pos]):
+                store.set_row(pos, rows[pos])
+                index = self.index(pos)
+                self.dataChanged.emit(index, index)
+                changed += 1
+
+        removed = len(store) - common
+        if removed:
+            self.beginRemoveRows(QModelIndex(), common, len(store) - 1)
+            store.truncate(common)
+            self.endRemoveRows()
+        added = len(rows) - common
+        self.append_rows(rows[common:])
+        return changed, added, removed
@@ -0,0 +1 @@
+"""Qt-free core of RUP IBE helper: workbook reading and document rendering"""
@@ -0,0 +1,84 @@
+"""Procedure workbooks of a batch run: discovery, output folders and concurrent loading"""
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .snapshot import read_workbook_cached
+from .timing import active, collect, span
+from .workbook import read_workbook
+
+WORKBOOK_PATTERNS = ('*.xlsx', '*.xlsm')
+
+
+def collect_workbooks(paths):
+    """Expand directories and glob patterns into the list of procedure workbooks, without duplicates"""
+    workbooks = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = [p for pattern in WORKBOOK_PATTERNS for p in glob.glob(os.path.join(path, pattern))]
+        else:
+            found = glob.glob(path) or [path]
+        # Ignora i file di lock di Excel (~$nome.xlsx)
+        for workbook in sorted(p for p in found if not os.path.basename(p).startswith('~$')):
+            if os.path.abspath(workbook) not in map(os.path.abspath, workbooks):
+                workbooks.append(workbook)
+    return workbooks
+
+
+def procedure_dirs(workbook_paths, output_dir):
+    """{workbook: output folder}, one sub-folder of output_dir per procedure named after its file"""
+    dirs = {}
+    used = set()
+    for path in workbook_paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name = stem
+        counter = 2
+        # Procedure con lo stesso nome in cartelle diverse non si sovrascrivono
+        while name.lower() in used:
+            name = f"{stem}_{counter}"
+            counter += 1
+        used.add(name.lower())
+        dirs[path] = os.path.join(output_dir, name)
+    return dirs
+
+
+def read_procedure(path, use_cache=True):
+    """Read one workbook, returning (data, error) instead of raising"""
+    try:
+        with span('load_workbook', os.path.basename(path)):
+            data = read_workbook_cached(path) if use_cache else read_workbook(path)
+        return data, None
+    except Exception as e:
+        return None, str(e)
+
+
+def _load_workbook_timed(path, use_cache=True):
+    """read_procedure in a worker process, also returning its timing records"""
+    with collect() as timings:
+        data, error = read_procedure(path, use_cache)
+    return data, error, timings.records
+
+
+def load_workbooks(paths, workers=1, use_cache=True):
+    """Read workbooks over up to workers processes, yielding (path, data, error) in order of paths.
+
+    Each workbook goes through the snapshot cache unless use_cache is
+    False; a file that cannot be read is reported with its error instead of
+    stopping the batch.
+    """
+    workers = min(workers, len(paths))
+    if workers <= 1:
+        for path in paths:
+            data, error = read_procedure(path, use_cache)
+            yield path, data, error
+        return
+
+    timings = active()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(_load_workbook_timed, path, use_cache) for path in paths]
+        for path, future in zip(paths, futures):
+            data, error, records = future.result()
+            if timings is not None:
+                timings.extend(records)
+            yield path, data, error
@@ -0,0 +1,490 @@
+"""Headless batch generator: python -m rup_fill --workbook X.xlsx (or --workbooks DIR) --templates DIR ..."""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+from .batch import collect_workbooks, load_workbooks, procedure_dirs
+from .client import ServiceClient, ServiceError
+from .failures import describe_failure, failure_text, load_report, retry_jobs, save_report
+from .package import DEFAULT_COMPRESSLEVEL
+from .manifest import Manifest, ManifestSet
+from .parallel import default_workers, new_executor, render_jobs
+from .render import build_context, iter_jobs, today
+from .templates import TemplateCache
+from .timing import Timings, collect, profile_summary, profiled, span
+from .snapshot import read_workbook_cached
+from .stream import (DEFAULT_CHUNK_ROWS, GenerationLog, MemoryGuard, MemoryLimitExceeded, memory_trend,
+                     stream_generate, tracemalloc_report)
+from .workbook import DATI_GENERALI, GENERAZIONI_OFFERTE, read_workbook
+
+
+def parse_rows(spec):
+    """Parse an Excel row selection such as "2-500,510,600-" into (start, end) ranges"""
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start, end = part.split('-', 1)
+                start, end = int(start) if start else 2, int(end) if end else None
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"selezione righe non valida: {part!r}")
+        if end is not None and end < start:
+            raise argparse.ArgumentTypeError(f"selezione righe non valida: {part!r} (fine prima dell'inizio)")
+        ranges.append((start, end))
+    return ranges
+
+
+def row_selected(excel_row, ranges):
+    return any(start <= excel_row and (end is None or excel_row <= end) for start, end in ranges)
+
+
+def collect_templates(paths):
+    """Expand directories (and glob patterns) into a sorted list of .docx templates"""
+    templates = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = glob.glob(os.path.join(path, '*.docx'))
+        else:
+            found = glob.glob(path) or [path]
+        # Ignora i file di lock di Word (~$nome.docx)
+        templates.extend(sorted(p for p in found if not os.path.basename(p).startswith('~$')))
+    return templates
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m rup_fill',
+        description="Genera documenti Word dai template usando i dati di un file Excel della procedura.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--workbook', help="file Excel derivato da template.xlsx")
+    source.add_argument('--workbooks', nargs='+', metavar='PERCORSO',
+                        help="cartelle o pattern glob di file Excel delle procedure (es. procedure/*.xlsx): "
+                             "ogni procedura viene generata in una sottocartella di --out con il nome del file")
+    source.add_argument('--retry-failed', metavar='RAPPORTO',
+                        help="rigenera solo i documenti (riga, template) non riusciti elencati in un rapporto "
+                             "errori_*.json, con file Excel, foglio, template e cartella di output della "
+                             "generazione originale")
+    parser.add_argument('--templates', nargs='+',
+                        help="template .docx o cartelle di template (es. template_doc/B_RDA); "
+                             "obbligatorio tranne che con --retry-failed")
+    parser.add_argument('--sheet', default=GENERAZIONI_OFFERTE, choices=[GENERAZIONI_OFFERTE, DATI_GENERALI],
+                        help="foglio sorgente (default: %(default)s)")
+    parser.add_argument('--rows', type=parse_rows, default=None,
+                        help="righe Excel di generazioni_offerte da usare, es. 2-500,510 (default: tutte)")
+    parser.add_argument('--out', default='doc_generati',
+                        help="cartella di output; con --workbooks contiene una cartella per procedura e il "
+                             "rapporto complessivo (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="rilegge sempre il file Excel senza usare gli snapshot in cache")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="processi di rendering in parallelo (default: uno per CPU, 1 = sequenziale)")
+    parser.add_argument('--template-cache-mb', type=int, default=256,
+                        help="memoria massima per la cache dei template in MB (default: %(default)s)")
+    parser.add_argument('--compress-level', type=int, default=DEFAULT_COMPRESSLEVEL, choices=range(10),
+                        metavar='0-9',
+                        help="livello di compressione delle sole parti modificate dal rendering; "
+                             "immagini e altre parti invariate sono copiate già compresse dal template "
+                             "(default: %(default)s)")
+    parser.add_argument('--hardlink', action='store_true',
+                        help="i documenti identici (stesso template e stessi dati) sono creati come hard link "
+                             "del primo invece che come copie")
+    parser.add_argument('--force', action='store_true',
+                        help="rigenera tutti i documenti, anche quelli che secondo il manifest della cartella "
+                             "di output sono già aggiornati")
+    parser.add_argument('--service', nargs='?', const='', default=None, metavar='URL',
+                        help="invia i documenti al servizio locale di rendering (python -m rup_fill.service) "
+                             "invece di renderli in questo processo (default URL: RUP_FILL_SERVICE o "
+                             "http://127.0.0.1:8765)")
+    parser.add_argument('--stream', action='store_true',
+                        help="modalità a memoria limitata per selezioni molto grandi di generazioni_offerte: "
+                             "le righe vengono lette, rese e rilasciate a blocchi e gli esiti scritti in un log "
+                             "(senza snapshot in cache né manifest)")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help="righe per blocco con --stream (default: %(default)s)")
+    parser.add_argument('--memory-limit-mb', type=int, default=None,
+                        help="con --stream: limite di memoria del processo principale (i processi di rendering "
+                             "non sono inclusi); oltre vengono svuotate le cache e ridotti i blocchi, e se non "
+                             "basta la generazione si interrompe")
+    parser.add_argument('--log', metavar='FILE',
+                        help="con --stream: log JSON lines con l'esito di ogni documento e la memoria dopo ogni "
+                             "blocco (default: generazione_<data>_<ora>.jsonl nella cartella di output)")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="con --stream: misura la memoria con tracemalloc e riporta i principali siti di "
+                             "allocazione e l'andamento della memoria fra i blocchi")
+    parser.add_argument('--timings', metavar='FILE',
+                        help="salva i tempi per fase (lettura, contesto, template, rendering, salvataggio) "
+                             "in FILE, in formato CSV se termina in .csv, altrimenti JSON")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="profila l'esecuzione con cProfile salvando le statistiche in FILE "
+                             "(usare con --workers 1 per includere il rendering)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.templates and not args.retry_failed:
+        parser.error("l'argomento --templates è obbligatorio")
+    # Opzioni che una modalità non supporterebbe: meglio un errore che ignorarle in silenzio
+    if args.workbooks and args.service is not None:
+        parser.error("--service non è supportato con --workbooks")
+    if args.workbooks and args.stream:
+        parser.error("--stream non è supportato con --workbooks")
+    if args.stream and args.service is not None:
+        parser.error("--service non è supportato con --stream")
+    if args.stream and args.force:
+        parser.error("--force non ha effetto con --stream, che non usa il manifest")
+    timings = Timings() if args.timings else None
+    with collect(timings) if timings is not None else nullcontext(), \
+            profiled(args.profile) if args.profile else nullcontext() as profiler:
+        status = run(args, timings)
+    if profiler is not None:
+        print(profile_summary(profiler), file=sys.stderr)
+    return status
+
+
+def select_rows(args, data):
+    """generazioni_offerte rows selected by --rows, or None when generating from dati_generali_procedura"""
+    if args.sheet != GENERAZIONI_OFFERTE:
+        return None
+    rows = data[GENERAZIONI_OFFERTE]
+    if args.rows is not None:
+        # row_idx conta le righe dati: la riga Excel è row_idx + 1
+        rows = [row for row in rows if row_selected(row['row_idx'] + 1, args.rows)]
+    return rows
+
+
+def load_retry(args):
+    """Failures of the --retry-failed report, setting workbook, sheet, templates and output folder from it"""
+    report = load_report(args.retry_failed)
+    if not report.get('workbook'):
+        raise ValueError("il rapporto non indica il file Excel della generazione (rapporto della GUI: "
+                         "usare \"Riprova falliti\")")
+    # Stessa generazione del rapporto, limitata alle coppie (riga, template) non riuscite
+    args.workbook, args.sheet, args.out = report['workbook'], report['sheet'], report['output_dir']
+    args.templates, args.rows = report['templates'], None
+    return report['failures']
+
+
+def run(args, timings=None):
+    retry = None
+    if args.retry_failed:
+        try:
+            retry = load_retry(args)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Rapporto degli errori non utilizzabile {args.retry_failed}: {e}", file=sys.stderr)
+            return 2
+    if args.workbooks:
+        return run_batch(args, timings)
+    if args.stream:
+        return run_stream(args, timings, retry)
+    started = time.perf_counter()
+
+    template_paths = collect_templates(args.templates)
+    if not template_paths:
+        print("Nessun template Word trovato.", file=sys.stderr)
+        return 2
+
+    data = read_workbook(args.workbook) if args.no_cache else read_workbook_cached(args.workbook)
+    if data[args.sheet] is None:
+        print(f"Nessun dato disponibile dal foglio {args.sheet}", file=sys.stderr)
+        return 2
+
+    rows = select_rows(args, data)
+    if retry is not None and rows is not None:
+        failed_rows = {failure['row_idx'] for failure in retry}
+        rows = [row for row in rows if row['row_idx'] in failed_rows]
+
+    os.makedirs(args.out, exist_ok=True)
+    current_date = today()
+    with span('build_context'):
+        context = build_context(data['field_values'], data[DATI_GENERALI], current_date)
+    max_cache_bytes = args.template_cache_mb * 1024 * 1024
+    cache = TemplateCache(max_cache_bytes, compresslevel=args.compress_level)
+    workers = default_workers(args.workers)
+    loaded = time.perf_counter()
+
+    generated = []
+    failures = []
+    jobs = iter_jobs(args.sheet, context, template_paths, args.out, current_date, rows)
+    if retry is not None:
+        jobs = retry_jobs(jobs, retry)
+    client = None
+    if args.service is not None:
+        # Il servizio usa lo stesso manifest nella cartella di output e ne restituisce i conteggi
+        client = ServiceClient(args.service or None)
+        counts = client
+        results = client.render_jobs(jobs, manifest=not args.force, link=args.hardlink)
+    else:
+        # Il manifest nella cartella di output evita di rigenerare i documenti con gli stessi dati
+        counts = None if args.force else Manifest(args.out)
+        results = render_jobs(jobs, workers, max_cache_bytes, cache, compresslevel=args.compress_level,
+                              link=args.hardlink, manifest=counts)
+    try:
+        for job, error in results:
+            if error is None:
+                generated.append(job[3])
+            else:
+                # Gli errori si raccolgono senza fermare la generazione; il rapporto si salva alla fine
+                failures.append(describe_failure(job, error, cache))
+                print(f"Errore durante la generazione del documento {failure_text(failures[-1])}",
+                      file=sys.stderr)
+    except ServiceError as e:
+        print(f"Errore del servizio di rendering: {e}", file=sys.stderr)
+        return 2
+    failure_report = None
+    if failures:
+        failure_report = save_report(args.out, failures, args.workbook, args.sheet, template_paths)
+
+    finished = time.perf_counter()
+    render_seconds = finished - loaded
+    summary = {
+        'workbook': args.workbook,
+        'sheet': args.sheet,
+        'templates': len(template_paths),
+        'rows': len(rows) if rows is not None else None,
+        'documents': len(generated),
+        'rebuilt': counts.rebuilt if counts is not None else len(generated),
+        'skipped': counts.skipped if counts is not None else 0,
+        'failed': len(failures),
+        'failures': failures,
+        'failure_report': failure_report,
+        'retry_of': os.path.abspath(args.retry_failed) if args.retry_failed else None,
+        'load_seconds': round(loaded - started, 4),
+        'render_seconds': round(render_seconds, 4),
+        'elapsed_seconds': round(finished - started, 4),
+        'docs_per_second': round(len(generated) / render_seconds, 3) if render_seconds > 0 else None,
+        'workers': workers,
+        'template_cache': cache.stats() if workers == 1 and client is None else None,
+        'service': client.url if client is not None else None,
+        'output_dir': os.path.abspath(args.out)
+    }
+    save_timings(args, timings, summary)
+    print(json.dumps(summary, ensure_ascii=False))
+    return 1 if failures else 0
+
+
+def save_timings(args, timings, summary):
+    """Add the timing summary to summary and save the records to --timings"""
+    if timings is None:
+        return
+    summary['timings'] = timings.summary()
+    if args.timings.lower().endswith('.csv'):
+        timings.to_csv(args.timings)
+    else:
+        timings.to_json(args.timings)
+
+
+def run_batch(args, timings=None):
+    """Generate the documents of every workbook of --workbooks, each in its own folder of --out.
+
+    Workbooks are read concurrently and the documents of all procedures go
+    through a single render_jobs pool, so small procedures do not leave
+    cores idle. A consolidated report with the outcome of each procedure is
+    printed and saved in --out.
+    """
+    started = time.perf_counter()
+
+    template_paths = collect_templates(args.templates)
+    if not template_paths:
+        print("Nessun template Word trovato.", file=sys.stderr)
+        return 2
+    workbook_paths = collect_workbooks(args.workbooks)
+    if not workbook_paths:
+        print("Nessun file Excel trovato.", file=sys.stderr)
+        return 2
+
+    workers = default_workers(args.workers)
+    output_dirs = procedure_dirs(workbook_paths, args.out)
+    current_date = today()
+    procedures = []
+    jobs = []
+    # Procedura di appartenenza di ogni job, nello stesso ordine
+    owners = []
+    for path, data, error in load_workbooks(workbook_paths, workers, use_cache=not args.no_cache):
+        procedure = {
+            'workbook': path,
+            'output_dir': os.path.abspath(output_dirs[path]),
+            'rows': None,
+            'documents': 0,
+            'failed': 0,
+            'failures': [],
+            'error': error
+        }
+        procedures.append(procedure)
+        if error is None and data[args.sheet] is None:
+            procedure['error'] = f"Nessun dato disponibile dal foglio {args.sheet}"
+        if procedure['error'] is not None:
+            print(f"Errore nella lettura della procedura {path}: {procedure['error']}", file=sys.stderr)
+            continue
+
+        rows = select_rows(args, data)
+        procedure['rows'] = len(rows) if rows is not None else None
+        os.makedirs(output_dirs[path], exist_ok=True)
+        with span('build_context', os.path.basename(path)):
+            context = build_context(data['field_values'], data[DATI_GENERALI], current_date)
+        for job in iter_jobs(args.sheet, context, template_paths, output_dirs[path], current_date, rows):
+            jobs.append(job)
+            owners.append(procedure)
+
+    max_cache_bytes = args.template_cache_mb * 1024 * 1024
+    cache = TemplateCache(max_cache_bytes, compresslevel=args.compress_level)
+    loaded = time.perf_counter()
+
+    # Un manifest per cartella di procedura, come nelle generazioni singole
+    manifest = None if args.force else ManifestSet()
+    # Senza annullamento render_jobs restituisce i job nel loro ordine
+    for procedure, (job, error) in zip(owners, render_jobs(
+            jobs, workers, max_cache_bytes, cache, compresslevel=args.compress_level, link=args.hardlink,
+            manifest=manifest)):
+        if error is None:
+            procedure['documents'] += 1
+        else:
+            procedure['failed'] += 1
+            procedure['failures'].append(describe_failure(job, error, cache))
+            print(f"Errore durante la generazione del documento {failure_text(procedure['failures'][-1])} "
+                  f"({os.path.basename(procedure['workbook'])})", file=sys.stderr)
+    for procedure in procedures:
+        if procedure['failures']:
+            # Rapporto per procedura, da usare con --retry-failed
+            procedure['failure_report'] = save_report(procedure['output_dir'], procedure['failures'],
+                                                      procedure['workbook'], args.sheet, template_paths)
+
+    finished = time.perf_counter()
+    render_seconds = finished - loaded
+    documents = sum(procedure['documents'] for procedure in procedures)
+    failed = sum(procedure['failed'] for procedure in procedures)
+    unreadable = sum(1 for procedure in procedures if procedure['error'] is not None)
+    summary = {
+        'workbooks': len(workbook_paths),
+        'sheet': args.sheet,
+        'templates': len(template_paths),
+        'documents': documents,
+        'rebuilt': manifest.rebuilt if manifest is not None else documents,
+        'skipped': manifest.skipped if manifest is not None else 0,
+        'failed': failed,
+        'failed_workbooks': unreadable,
+        'procedures': procedures,
+        'load_seconds': round(loaded - started, 4),
+        'render_seconds': round(render_seconds, 4),
+        'elapsed_seconds': round(finished - started, 4),
+        'docs_per_second': round(documents / render_seconds, 3) if render_seconds > 0 else None,
+        'workers': workers,
+        'output_dir': os.path.abspath(args.out)
+    }
+    save_timings(args, timings, summary)
+    os.makedirs(args.out, exist_ok=True)
+    report_path = os.path.join(args.out, f"rapporto_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    summary['report'] = os.path.abspath(report_path)
+    print(json.dumps(summary, ensure_ascii=False))
+    return 1 if failed or unreadable else 0
+
+
+def run_stream(args, timings=None, retry=None):
+    """Generate generazioni_offerte documents with memory bounded by the chunk size (see rup_fill.stream).
+
+    With retry (the failures of a --retry-failed report) only the failed
+    (row, template) pairs are rendered.
+    """
+    import tracemalloc
+    from functools import partial
+
+    started = time.perf_counter()
+    if args.sheet != GENERAZIONI_OFFERTE:
+        print("--stream vale solo per il foglio generazioni_offerte", file=sys.stderr)
+        return 2
+    template_paths = collect_templates(args.templates)
+    if not template_paths:
+        print("Nessun template Word trovato.", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.out, exist_ok=True)
+    log_path = args.log or os.path.join(args.out, f"generazione_{datetime.now():%Y%m%d_%H%M%S}.jsonl")
+    limit = args.memory_limit_mb * 1024 * 1024 if args.memory_limit_mb else None
+    guard = MemoryGuard(limit)
+    workers = default_workers(args.workers)
+    max_cache_bytes = args.template_cache_mb * 1024 * 1024
+    cache = TemplateCache(max_cache_bytes, compresslevel=args.compress_level)
+    executor = new_executor(workers, max_cache_bytes, args.compress_level) if workers > 1 else None
+    render = partial(render_jobs, workers=workers, max_cache_bytes=max_cache_bytes, cache=cache,
+                     compresslevel=args.compress_level, link=args.hardlink, executor=executor)
+    if retry is not None:
+        failed_rows = {failure['row_idx'] for failure in retry}
+        render_all = render
+
+        def selected(excel_row):
+            return excel_row - 1 in failed_rows
+
+        def render(jobs):
+            return render_all(retry_jobs(jobs, retry))
+    else:
+        selected = partial(row_selected, ranges=args.rows) if args.rows is not None else None
+
+    # Solo i documenti falliti restano in memoria, per il rapporto degli errori
+    failures = []
+
+    def on_failure(job, error):
+        failures.append(describe_failure(job, error, cache))
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    error = None
+    try:
+        with GenerationLog(log_path) as log:
+            try:
+                stream_generate(args.workbook, template_paths, args.out, today(), log, render, selected,
+                                max(1, args.chunk_rows), guard, relieve=cache.invalidate, on_failure=on_failure)
+            except MemoryLimitExceeded as e:
+                error = str(e)
+                log.write('error', error=error)
+                print(f"Generazione interrotta: {error}", file=sys.stderr)
+            rows, documents, failed, run_id = log.rows, log.documents, log.failed, log.run
+        snapshot = tracemalloc.take_snapshot() if args.tracemalloc else None
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if args.tracemalloc:
+            tracemalloc.stop()
+    failure_report = None
+    if failures:
+        failure_report = save_report(args.out, failures, args.workbook, args.sheet, template_paths)
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        'workbook': args.workbook,
+        'sheet': args.sheet,
+        'templates': len(template_paths),
+        'rows': rows,
+        'documents': documents,
+        'failed': failed,
+        'failure_report': failure_report,
+        'retry_of': os.path.abspath(args.retry_failed) if args.retry_failed else None,
+        'error': error,
+        'elapsed_seconds': round(elapsed, 4),
+        'docs_per_second': round(documents / elapsed, 3) if elapsed > 0 else None,
+        'workers': workers,
+        'chunk_rows': args.chunk_rows,
+        'memory_limit_bytes': limit,
+        'memory_peak_bytes': guard.peak or None,
+        'memory_trend': memory_trend(log_path, run_id),
+        'log': os.path.abspath(log_path),
+        'output_dir': os.path.abspath(args.out)
+    }
+    if snapshot is not None:
+        summary['tracemalloc'] = {'peak_bytes': traced_peak, 'top': tracemalloc_report(snapshot)}
+    save_timings(args, timings, summary)
+    print(json.dumps(summary, ensure_ascii=False))
+    return 1 if failed or error else 0
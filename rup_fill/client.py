@@ -0,0 +1,127 @@
+"""Client of the local render service (see rup_fill.service)"""
+import json
+import os
+import urllib.error
+import urllib.request
+
+from .failures import RenderError
+from .service import DEFAULT_HOST, DEFAULT_PORT
+
+DEFAULT_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+# Timeout predefinito del client; None (nessun timeout) è un valore valido per le singole richieste
+_DEFAULT_TIMEOUT = object()
+
+
+def service_url():
+    """Address of the render service (RUP_FILL_SERVICE overrides the default)"""
+    return os.environ.get('RUP_FILL_SERVICE') or DEFAULT_URL
+
+
+class ServiceError(Exception):
+    """The render service is unreachable or rejected a request"""
+
+
+class ServiceClient:
+    """Thin client sending render requests to a running service"""
+
+    def __init__(self, url=None, timeout=10):
+        self.url = (url or service_url()).rstrip('/')
+        self.timeout = timeout
+        self.rebuilt = 0
+        self.skipped = 0
+
+    def _request(self, path, payload=None, timeout=_DEFAULT_TIMEOUT):
+        data = None
+        headers = {}
+        if payload is not None:
+            data = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+            headers['Content-Type'] = 'application/json; charset=utf-8'
+        request = urllib.request.Request(self.url + path, data=data, headers=headers)
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout if timeout is _DEFAULT_TIMEOUT else timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8')).get('error')
+            except Exception:
+                message = None
+            raise ServiceError(message or f"errore HTTP {e.code}")
+        except (urllib.error.URLError, OSError) as e:
+            raise ServiceError(f"servizio non raggiungibile su {self.url}: {getattr(e, 'reason', e)}")
+
+    def _get_json(self, path):
+        with self._request(path) as response:
+            try:
+                return json.loads(response.read().decode('utf-8'))
+            except OSError as e:
+                raise ServiceError(f"connessione al servizio interrotta ({self.url}): {e}")
+
+    def health(self):
+        return self._get_json('/health')
+
+    def available(self):
+        try:
+            return self.health().get('status') == 'ok'
+        except ServiceError:
+            return False
+
+    def schema(self):
+        return self._get_json('/schema')
+
+    def render_jobs(self, jobs, cancelled=None, manifest=False, link=False):
+        """Render (row_idx, template_path, context, output_path) jobs on the service, yielding (job, error).
+
+        Works like rup_fill.parallel.render_jobs: documents are reported as
+        the service writes them and cancelled is checked between documents;
+        once it returns True the connection is closed and the service stops
+        starting new documents. With manifest the service skips the
+        documents already current in the manifests of their folders; the
+        counts of the last call are left in rebuilt and skipped.
+        """
+        jobs = list(jobs)
+        cancelled = cancelled or (lambda: False)
+        self.rebuilt = self.skipped = 0
+        payload = {
+            'jobs': [{'row_idx': row_idx, 'template': os.path.abspath(template_path), 'context': context,
+                      'output_path': os.path.abspath(output_path)}
+                     for row_idx, template_path, context, output_path in jobs],
+            'incremental': bool(manifest),
+            'link': link
+        }
+        # Nessun timeout di lettura: la richiesta può attendere il proprio turno e un documento
+        # può richiedere più del timeout di connessione
+        with self._request('/render', payload, timeout=None) as response:
+            for line in self._lines(response):
+                item = json.loads(line.decode('utf-8'))
+                if item.get('done'):
+                    if item.get('error'):
+                        raise ServiceError(item['error'])
+                    self.rebuilt = item.get('rebuilt', 0)
+                    self.skipped = item.get('skipped', 0)
+                    return
+                error = item['error']
+                if error is not None:
+                    error = RenderError(error, item.get('exception'))
+                yield jobs[item['index']], error
+                if cancelled():
+                    return
+
+    def _lines(self, response):
+        """Non-empty lines of a streamed response; connection errors become ServiceError"""
+        while True:
+            try:
+                line = response.readline()
+            except OSError as e:
+                raise ServiceError(f"connessione al servizio interrotta ({self.url}): {e}")
+            if not line:
+                return
+            if line.strip():
+                yield line
+
+    def render_document(self, template_path, context):
+        """Bytes of template_path rendered with context"""
+        payload = {'template': os.path.abspath(template_path), 'context': context}
+        with self._request('/document', payload, timeout=None) as response:
+            try:
+                return response.read()
+            except OSError as e:
+                raise ServiceError(f"connessione al servizio interrotta ({self.url}): {e}")
@@ -0,0 +1,89 @@
+"""docxtpl-backed pieces of the template cache, imported on first use"""
+import io
+
+from docx.shared import Mm
+from docxtpl import DocxTemplate, InlineImage
+from jinja2 import Environment, TemplateSyntaxError, meta
+
+from .images import default_images, image_width_mm
+from .package import save_package
+from .templates import CORE_PROPERTIES
+
+# Sostituzioni di immagini/zip di docxtpl che riscrivono il file dopo il salvataggio
+DOCXTPL_REPLACEMENTS = ('pics_to_replace', 'crc_to_new_media', 'crc_to_new_embedded', 'zipname_to_replace')
+
+
+class CachingEnvironment(Environment):
+    """Jinja environment that compiles each distinct template source only once"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compiled = {}
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals is not None or template_class is not None:
+            return super().from_string(source, globals, template_class)
+        template = self.compiled.get(source)
+        if template is None:
+            template = super().from_string(source)
+            self.compiled[source] = template
+        return template
+
+
+class CachedDocxTemplate(DocxTemplate):
+    """DocxTemplate that reuses the patched XML and compiled jinja templates of a CompiledTemplate"""
+
+    def __init__(self, compiled, compresslevel=None):
+        super().__init__(io.BytesIO(compiled.data))
+        self._compiled = compiled
+        self.compresslevel = compresslevel
+
+    def patch_xml(self, src_xml):
+        return self._compiled.patch(src_xml, super().patch_xml)
+
+    def render(self, context, jinja_env=None, autoescape=False):
+        # Con autoescape il codice compilato è diverso: niente riuso
+        if jinja_env is None and not autoescape:
+            jinja_env = self._compiled.jinja_env
+        super().render(context, jinja_env, autoescape)
+
+    def save(self, filename, *args, **kwargs):
+        if (self.compresslevel is None or not self.is_rendered
+                or any(getattr(self, name, None) for name in DOCXTPL_REPLACEMENTS)):
+            return super().save(filename, *args, **kwargs)
+        save_package(self.docx.part.package, filename, self._compiled.archive, self.compresslevel)
+        self.is_saved = True
+
+
+def inline_images(doc, context, names, images=None):
+    """Context with the image paths of names replaced by InlineImages bound to doc"""
+    images = images if images is not None else default_images()
+    context = dict(context)
+    for name in names:
+        path = context[name].strip()
+        width = image_width_mm(name)
+        try:
+            data = images.get(path, width)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"immagine non trovata per {name}: {path}")
+        context[name] = InlineImage(doc, io.BytesIO(data), width=Mm(width))
+    return context
+
+
+def template_variables(compiled):
+    """Variables referenced by a CompiledTemplate.
+
+    Covers body, headers and footers (docxtpl's undeclared-variable
+    analysis) plus the document properties that docxtpl also renders.
+    """
+    names = set(compiled.new_document().get_undeclared_template_variables(compiled.jinja_env))
+    doc = compiled.new_document()
+    doc.init_docx()
+    for prop in CORE_PROPERTIES:
+        value = getattr(doc.docx.core_properties, prop, None)
+        if isinstance(value, str) and ('{{' in value or '{%' in value):
+            try:
+                names.update(meta.find_undeclared_variables(compiled.jinja_env.parse(value)))
+            except TemplateSyntaxError:
+                pass
+    return frozenset(names)
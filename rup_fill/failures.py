@@ -0,0 +1,114 @@
+"""Structured report of the documents that could not be generated.
+
+Failures are collected while a batch runs instead of interrupting it and
+saved next to the outputs as errori_<date>_<time>.json: template, row,
+output path, exception type and message, and the variables of the
+template missing from the row's data. The report also keeps what is
+needed to re-run only the failed (row, template) pairs.
+"""
+import json
+import os
+import re
+from datetime import datetime
+
+from .templates import default_cache
+
+REPORT_PREFIX = 'errori'
+# Messaggi di jinja ("'nome' is undefined") e delle immagini (engine.inline_images)
+UNDEFINED = re.compile(r"'([A-Za-z_][A-Za-z0-9_]*)' is undefined")
+MISSING_IMAGE = re.compile(r"immagine non trovata per ([A-Za-z_][A-Za-z0-9_]*):")
+
+
+class RenderError(str):
+    """Error message of a failed document that also remembers the exception type.
+
+    It is a str, so callers that only show the message are unaffected, and
+    it survives the trip back from the worker processes.
+    """
+
+    def __new__(cls, message, exception=None):
+        self = super().__new__(cls, message)
+        self.exception = exception
+        return self
+
+    @classmethod
+    def from_exception(cls, e):
+        return cls(str(e), type(e).__name__)
+
+    def __reduce__(self):
+        return RenderError, (str(self), self.exception)
+
+
+def missing_variables(template_path, context, error='', cache=None):
+    """Variables named by error or used by the template that have no value in context"""
+    names = UNDEFINED.findall(error) + MISSING_IMAGE.findall(error)
+    try:
+        variables = (cache if cache is not None else default_cache()).get(template_path).variables
+    except Exception:
+        # Template illeggibile o con errori di sintassi: restano le variabili citate nel messaggio
+        variables = ()
+    for name in sorted(variables):
+        value = context.get(name)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            names.append(name)
+    return list(dict.fromkeys(names))
+
+
+def describe_failure(job, error, cache=None):
+    """Report entry for a (row_idx, template_path, context, output_path) job that failed with error"""
+    row_idx, template_path, context, output_path = job
+    return {
+        'template': os.path.abspath(template_path) if template_path else template_path,
+        'row_idx': row_idx,
+        'output_path': os.path.abspath(output_path) if output_path else output_path,
+        'exception': getattr(error, 'exception', None),
+        'error': str(error),
+        'missing_variables': missing_variables(template_path, context or {}, str(error), cache)
+        if template_path else []
+    }
+
+
+def failure_text(failure):
+    """One line describing a report entry, for message boxes and logs"""
+    where = os.path.basename(failure['template'] or '')
+    if failure['row_idx'] is not None:
+        where += f" (riga {failure['row_idx']})"
+    text = f"{where}: {failure['error']}"
+    if failure['exception']:
+        text += f" [{failure['exception']}]"
+    if failure['missing_variables']:
+        text += f" - variabili senza valore: {', '.join(failure['missing_variables'])}"
+    return text
+
+
+def save_report(directory, failures, workbook=None, sheet=None, templates=()):
+    """Write the failures of a run to errori_<date>_<time>.json in directory and return its path"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{REPORT_PREFIX}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'workbook': os.path.abspath(workbook) if workbook else None,
+            'sheet': sheet,
+            'templates': [os.path.abspath(template) for template in templates],
+            'output_dir': os.path.abspath(directory),
+            'failures': failures
+        }, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def load_report(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def failed_pairs(failures):
+    """{(row_idx, absolute template path)} of report entries, to select the jobs to retry"""
+    return {(failure['row_idx'], os.path.abspath(failure['template']))
+            for failure in failures if failure.get('template')}
+
+
+def retry_jobs(jobs, failures):
+    """Jobs whose (row_idx, template) pair failed"""
+    pairs = failed_pairs(failures)
+    return [job for job in jobs if (job[0], os.path.abspath(job[1])) in pairs]
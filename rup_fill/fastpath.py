@@ -0,0 +1,224 @@
+"""Fast rendering of templates that only use plain {{ variable }} substitutions.
+
+Such a template is rendered once through docxtpl with a sentinel string in
+place of every variable; the saved package is then split at the sentinels
+into fixed byte segments and slots. Later documents are produced by joining
+the segments with the escaped values, skipping XML patching, jinja and the
+re-serialization of the document. Because the segments come out of
+docxtpl itself, every zip member matches what docxtpl would write; only the
+archive timestamps differ, as they do between two docxtpl runs. An element
+whose whole text is made of variables that are all empty is written
+self-closing, as lxml serializes it.
+"""
+import io
+import re
+import zipfile
+
+from jinja2 import nodes
+
+from .package import PassthroughWriter
+from .templates import CORE_PROPERTIES
+from .timing import span
+
+# Caratteri dell'area privata Unicode: non compaiono nei template e lxml li lascia intatti
+SENTINEL_START = '\ue000'
+SENTINEL_END = '\ue001'
+SLOT = re.compile(f'{SENTINEL_START}(\\w+){SENTINEL_END}'.encode('utf-8'))
+# Tag di apertura alla fine di un segmento (non già autochiuso)
+OPENING_TAG = re.compile(rb'<([A-Za-z_][\w.:-]*)(?:\s[^<>]*)?(?<!/)>$')
+
+# Sequenze che docxtpl trasforma dopo il render (escape {_{ ... }_} e liste con \n, \t, \a, \f)
+DOCXTPL_ESCAPES = ('{_{', '}_}', '{_%', '%_}')
+HEADER_FOOTER_URIS = ('HEADER_URI', 'FOOTER_URI')
+
+
+def _template_sources(doc):
+    """Patched XML of body, headers and footers, as docxtpl feeds it to jinja"""
+    doc.init_docx()
+    sources = [doc.patch_xml(doc.get_xml())]
+    for uri in HEADER_FOOTER_URIS:
+        for rel_key, part in doc.get_headers_footers(getattr(doc, uri)):
+            sources.append(doc.patch_xml(doc.get_part_xml(part)))
+    for prop in CORE_PROPERTIES:
+        value = getattr(doc.docx.core_properties, prop, None)
+        if isinstance(value, str):
+            sources.append(value)
+    return sources
+
+
+def is_simple(env, source):
+    """True if source only contains literal text and {{ name }} expressions"""
+    for node in env.parse(source).body:
+        if not isinstance(node, nodes.Output):
+            return False
+        for child in node.nodes:
+            if isinstance(child, nodes.TemplateData):
+                continue
+            if isinstance(child, nodes.Name) and child.ctx == 'load':
+                continue
+            return False
+    return True
+
+
+def _text_value(value):
+    """XML text for a context value, or None if only docxtpl renders it faithfully"""
+    if value is None or isinstance(value, (bool, int, float)):
+        value = str(value)
+    elif type(value) is not str:
+        # RichText, InlineImage, date... passano da docxtpl
+        return None
+    if '&' in value or '<' in value or SENTINEL_START in value:
+        return None
+    if any(ord(c) < 0x20 or c in '\ufffe\uffff' for c in value):
+        return None
+    if any(escape in value for escape in DOCXTPL_ESCAPES):
+        return None
+    return value.replace('>', '&gt;').encode('utf-8')
+
+
+class FastTemplate:
+    """A template package split into static members and members with variable slots"""
+
+    def __init__(self, members):
+        # [(nome, dati, crc)] per le parti fisse, [(nome, [segmenti], [variabili], elementi)] per le altre;
+        # elementi: {prima variabile: ultima} dei gruppi di variabili che sono l'intero testo di un elemento
+        self.members = members
+
+    @property
+    def nbytes(self):
+        total = 0
+        for member in self.members:
+            data = member[1]
+            total += len(data) if isinstance(data, bytes) else sum(len(s) for s in data)
+        return total
+
+    def render(self, context, output, source=None, compresslevel=None):
+        """Write the document for context to output (path or file object).
+
+        source and compresslevel are those of PassthroughWriter; without them
+        the archive is written exactly as python-docx does. Returns False
+        without writing anything when a value needs docxtpl (markup
+        characters, line breaks, rich objects).
+        """
+        with span('render', 'fast'):
+            values = {}
+            for member in self.members:
+                if isinstance(member[1], bytes):
+                    continue
+                for name in member[2]:
+                    if name not in values:
+                        text = _text_value(context[name]) if name in context else b''
+                        if text is None:
+                            return False
+                        values[name] = text
+
+        # Membri nello stesso ordine in cui li scrive python-docx
+        with span('save', 'fast'), PassthroughWriter(output, source, compresslevel) as writer:
+            for member in self.members:
+                if isinstance(member[1], bytes):
+                    writer.write_member(*member)
+                    continue
+                name, segments, slots, elements = member
+                if elements:
+                    segments = _collapse_empty(segments, slots, elements, values)
+                parts = [segments[0]]
+                for slot, segment in zip(slots, segments[1:]):
+                    parts.append(values[slot])
+                    parts.append(segment)
+                writer.write_member(name, b''.join(parts))
+        return True
+
+
+def _element_slots(segments):
+    """{first: last} slot indexes of the runs of slots forming the whole text of an element"""
+    elements = {}
+    first = 0
+    while first < len(segments) - 1:
+        last = first
+        while last + 1 < len(segments) - 1 and not segments[last + 1]:
+            last += 1
+        opening = OPENING_TAG.search(segments[first])
+        if opening and segments[last + 1].startswith(b'</' + opening.group(1) + b'>'):
+            elements[first] = last
+        first = last + 1
+    return elements
+
+
+def _collapse_empty(segments, slots, elements, values):
+    """Segments with the elements whose variables are all empty written self-closing"""
+    collapsed = None
+    for first, last in elements.items():
+        if any(values[slots[index]] for index in range(first, last + 1)):
+            continue
+        if collapsed is None:
+            collapsed = list(segments)
+        # <w:t xml:space="preserve"></w:t> -> <w:t xml:space="preserve"/>, come lo scrive lxml
+        closing = collapsed[last + 1]
+        collapsed[first] = collapsed[first][:-1] + b'/>'
+        collapsed[last + 1] = closing[closing.index(b'>') + 1:]
+    return collapsed or segments
+
+
+def compile_fast(compiled):
+    """FastTemplate for a CompiledTemplate, or None if it needs the full docxtpl pipeline"""
+    with zipfile.ZipFile(io.BytesIO(compiled.data)) as zf:
+        # Senza core.xml python-docx ne crea uno con la data corrente a ogni render
+        if 'docProps/core.xml' not in zf.namelist():
+            return None
+
+    doc = compiled.new_document()
+    if not all(is_simple(compiled.jinja_env, source) for source in _template_sources(doc)):
+        return None
+
+    doc = compiled.new_document()
+    doc.render({name: f'{SENTINEL_START}{name}{SENTINEL_END}' for name in compiled.variables})
+    buffer = io.BytesIO()
+    doc.save(buffer)
+
+    members = []
+    with zipfile.ZipFile(buffer) as zf:
+        for info in zf.infolist():
+            data = zf.read(info)
+            if SENTINEL_START.encode('utf-8') not in data:
+                members.append((info.filename, data, info.CRC))
+                continue
+            segments = []
+            slots = []
+            pos = 0
+            for match in SLOT.finditer(data):
+                # Una variabile dentro un tag (attributo) avrebbe un escape diverso
+                if data.rfind(b'<', 0, match.start()) > data.rfind(b'>', 0, match.start()):
+                    return None
+                segments.append(data[pos:match.start()])
+                slots.append(match.group(1).decode('utf-8'))
+                pos = match.end()
+            segments.append(data[pos:])
+            if any(SENTINEL_START.encode('utf-8') in segment for segment in segments):
+                return None
+            members.append((info.filename, segments, slots, _element_slots(segments)))
+    return FastTemplate(members)
+
+
+def member_differences(first, second):
+    """Names of zip members whose content differs between two .docx files"""
+    with zipfile.ZipFile(first) as a, zipfile.ZipFile(second) as b:
+        names = a.namelist()
+        if names != b.namelist():
+            return sorted(set(names) ^ set(b.namelist())) or ['(ordine dei membri)']
+        return [name for name in names if a.read(name) != b.read(name)]
+
+
+def verify(compiled, context, compresslevel=None):
+    """Render context both ways and return the members that differ (None if not fast-renderable)"""
+    fast = compile_fast(compiled)
+    if fast is None:
+        return None
+    fast_output = io.BytesIO()
+    source = compiled.archive if compresslevel is not None else None
+    if not fast.render(context, fast_output, source, compresslevel):
+        return None
+    doc = compiled.new_document(compresslevel)
+    doc.render(compiled.project(context))
+    docxtpl_output = io.BytesIO()
+    doc.save(docxtpl_output)
+    return member_differences(fast_output, docxtpl_output)
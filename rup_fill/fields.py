@@ -0,0 +1,358 @@
+"""Field names shared by the GUI form and the headless generator"""
+
+# Campi data che richiedono la formattazione dd/mm/YYYY
+DATE_FIELDS = [
+    'data_nascita_richiedente',
+    'data_nascita_RUP',
+    'data_nascita_supportoRUP',
+    'data_nascita_direttore',
+    'data_nascita_RSS',
+    'data_rda',
+    'data_scadenza',
+    'data_scadenza_offerta',
+    'data_oggi'
+]
+
+# Campi il cui valore è il percorso di un'immagine (firma, documento d'identità)
+IMAGE_PREFIXES = ('firma_', 'img_documento_')
+
+# Importi, scritti nei documenti con il formato italiano 1.234,56
+AMOUNT_FIELDS = [
+    'importo_massimo',
+    'importo_spesa',
+    'importo_oneri_sicurezza',
+    'importo_oneri_personale'
+]
+
+# Codici da trattare come testo, con la lunghezza fissa (se c'è) per recuperare gli zeri iniziali
+# che Excel perde quando la cella è numerica
+CODE_FIELDS = {
+    'numero_CIG': 10,
+    'numero_CUP': None,
+    'numero_COAN': None,
+    'piva_OE_scelta': 11,
+    'piva_OE': 11,
+    'cap_OE': 5,
+    'codice_CPV': None,
+    'codice_CNEL': None,
+    'CNEL_OE': None,
+    'codice_ateco_OE': None,
+    'codice_ateco_OE_sec': None,
+    'codice_ateco_OE_dich': None
+}
+
+# Variabili di dati_generali_procedura che riempiono automaticamente il modulo
+AUTOFILL_FIELDS = [
+    'numero_CUP',
+    'servizio_fornitura',
+    'acronimo_progetto',
+    'oggetto_fornitura_servizio',
+    'oggetto_esteso_fornitura_servizio',
+    'nome_cognome_richiedente',
+    'mail_contatto_richiedente',
+    'data_oggi',
+    'data_rda',
+    'data_scadenza',
+    'data_scadenza_offerta',
+    'descrizione_servizio_fornitura',
+    'descrizione_caratteristiche_prestazioni',
+    'descrizione_motivazione_acquisizione',
+    'clausola_cam',
+    'clausola_servizi_fornitura',
+    'dichiarazione_deroga_MEPA',
+    'dichiarazione_mancata_consip_informatica',
+    'dichiarazione_valore_affidamento',
+    'dichiarazione_motivo_deroga_principio_rotazione',
+    'dichiarazione_individuazione_OE',
+    'dichiarazione_individuazione_preventiva_OE',
+    'dichiarazione_non_imponibile',
+    'importo_massimo',
+    'quantita',
+    'numero_CIG',
+    'numero_COAN',
+    'voce_piano_dei_conti',
+    'voce_costo_COAN',
+    'codice_CPV',
+    'piattaforma_scelta',
+    'bando_MEPA',
+    'riferimento_PAD',
+    'codice_ateco_OE',
+    'codice_ateco_OE_sec',
+    'codice_ateco_OE_dich',
+    'nome_OE_scelta',
+    'indirizzo_OE_scelta',
+    'legale_rap_OE_scelta',
+    'sede_OE_scelta',
+    'piva_OE_scelta',
+    'codice_CNEL',
+    'estratti_CNEL',
+    'data_nascita_richiedente',
+    'luogo_nascita_richiedente',
+    'CF_richiedente',
+    'sede_richiedente',
+    'dichiarazioni_comunicazione_incarichi_richiedente',
+    'dichiarazioni_partecipazione_associazioni_organizzazioni_richiedente',
+    'qualifica_richiedente',
+    'nome_cognome_RUP',
+    'data_nascita_RUP',
+    'luogo_nascita_RUP',
+    'CF_RUP',
+    'sede_RUP',
+    'mail_contatto_RUP',
+    'nome_cognome_direttore',
+    'data_nascita_direttore',
+    'luogo_nascita_direttore',
+    'CF_direttore',
+    'sede_direttore',
+    'mail_contatto_direttore',
+    'nome_cognome_RSS',
+    'data_nascita_RSS',
+    'luogo_nascita_RSS',
+    'CF_RSS',
+    'sede_RSS',
+    'mail_contatto_RSS',
+    'ulteriori_riferimenti_normativi_attuativi_operativi',
+    'url_gara',
+    'protocollo_RDA',
+    'protocollo_richiesta_url',
+    'protocollo_nomina_RUP',
+    'protocollo_conflittoint_richiedente',
+    'protocollo_conflittoint_RUP',
+    'protocollo_conflittoint_direttore',
+    'protocollo_allegato2_CIG',
+    'protocollo_istruttoria_RUP',
+    'protocollo_DAC',
+    'protocollo_ordine'
+]
+
+# Nomi alternativi usati nei fogli Excel per i campi del modulo
+FIELD_ALIASES = {
+    'cup_progetto': 'numero_CUP',
+    'prot_RDA': 'protocollo_RDA',
+    'prot_richiesta_url': 'protocollo_richiesta_url',
+    'prot_nomina_RUP': 'protocollo_nomina_RUP',
+}
+
+# Tutti i campi del modulo "Genera Documenti", nell'ordine del contesto
+FORM_FIELDS = [
+    # Date
+    'data_oggi', 'data_rda', 'data_scadenza', 'data_scadenza_offerta',
+
+    # Informazioni generali
+    'servizio_fornitura', 'descrizione_servizio_fornitura',
+    'descrizione_caratteristiche_prestazioni', 'descrizione_motivazione_acquisizione',
+    'oggetto_fornitura_servizio', 'oggetto_esteso_fornitura_servizio',
+
+    # Valori economici
+    'importo_massimo', 'quantita', 'importo_oneri_sicurezza', 'importo_oneri_personale',
+
+    # Codici e numeri
+    'acronimo_progetto', 'numero_CUP', 'numero_CIG', 'numero_COAN',
+    'voce_piano_dei_conti', 'voce_costo_COAN', 'codice_CPV', 'codice_ateco_OE',
+    'codice_ateco_OE_sec', 'codice_ateco_OE_dich', 'codice_CNEL', 'estratti_CNEL',
+
+    # Informazioni OE
+    'piattaforma_scelta', 'bando_MEPA', 'riferimento_PAD', 'dichiarazione_individuazione_OE',
+    'nome_OE_scelta', 'indirizzo_OE_scelta', 'legale_rap_OE_scelta', 'sede_OE_scelta',
+    'piva_OE_scelta',
+
+    # Clausole e dichiarazioni
+    'clausola_cam', 'clausola_servizi_fornitura', 'dichiarazione_deroga_MEPA',
+    'dichiarazione_mancata_consip_informatica', 'dichiarazione_valore_affidamento',
+    'dichiarazione_motivo_deroga_principio_rotazione',
+    'dichiarazione_individuazione_preventiva_OE', 'dichiarazione_non_imponibile',
+
+    # Richiedente
+    'nome_cognome_richiedente', 'data_nascita_richiedente', 'luogo_nascita_richiedente',
+    'CF_richiedente', 'sede_richiedente', 'firma_richiedente', 'img_documento_richiedente',
+    'dichiarazioni_comunicazione_incarichi_richiedente',
+    'dichiarazioni_partecipazione_associazioni_organizzazioni_richiedente',
+    'mail_contatto_richiedente', 'qualifica_richiedente',
+
+    # RUP
+    'nome_cognome_RUP', 'data_nascita_RUP', 'luogo_nascita_RUP', 'CF_RUP', 'sede_RUP',
+    'firma_RUP', 'img_documento_RUP', 'dichiarazioni_comunicazione_incarichi_RUP',
+    'dichiarazioni_partecipazione_associazioni_organizzazioni_RUP', 'mail_contatto_RUP',
+
+    # Supporto RUP
+    'nome_cognome_supportoRUP', 'data_nascita_supportoRUP', 'luogo_nascita_supportoRUP',
+    'CF_supportoRUP', 'sede_supportoRUP', 'firma_supportoRUP', 'img_documento_supportoRUP',
+    'dichiarazioni_comunicazione_incarichi_supportoRUP',
+    'dichiarazioni_partecipazione_associazioni_organizzazioni_supportoRUP',
+    'mail_contatto_supportoRUP',
+
+    # Direttore
+    'nome_cognome_direttore', 'data_nascita_direttore', 'luogo_nascita_direttore',
+    'CF_direttore', 'sede_direttore', 'firma_direttore', 'img_documento_direttore',
+    'dichiarazioni_comunicazione_incarichi_direttore',
+    'dichiarazioni_partecipazione_associazioni_organizzazioni_direttore',
+    'mail_contatto_direttore',
+
+    # RSS
+    'nome_cognome_RSS', 'data_nascita_RSS', 'luogo_nascita_RSS', 'CF_RSS', 'sede_RSS',
+    'firma_RSS', 'img_documento_RSS', 'dichiarazioni_comunicazione_incarichi_RSS',
+    'dichiarazioni_partecipazione_associazioni_organizzazioni_RSS', 'mail_contatto_RSS',
+
+    # Protocolli e riferimenti
+    'ulteriori_riferimenti_normativi_attuativi_operativi', 'url_gara', 'protocollo_RDA',
+    'protocollo_richiesta_url', 'protocollo_nomina_RUP', 'protocollo_conflittoint_richiedente',
+    'protocollo_conflittoint_RUP', 'protocollo_conflittoint_direttore',
+    'protocollo_allegato2_CIG', 'protocollo_istruttoria_RUP', 'protocollo_DAC',
+    'protocollo_ordine'
+]
+
+# Organizza i campi in gruppi logici
+FIELD_GROUPS = [
+    ("Informazioni Generali", [
+        'data_oggi', 'data_rda', 'data_scadenza', 'data_scadenza_offerta',
+        'descrizione_servizio_fornitura',
+        'descrizione_caratteristiche_prestazioni',
+        'descrizione_motivazione_acquisizione'
+    ]),
+
+    ("Clausole e Dichiarazioni", [
+        'clausola_cam', 'clausola_servizi_fornitura',
+        'dichiarazione_deroga_MEPA', 'dichiarazione_mancata_consip_informatica',
+        'dichiarazione_valore_affidamento', 'dichiarazione_motivo_deroga_principio_rotazione',
+        'dichiarazione_individuazione_OE',
+        'dichiarazione_individuazione_preventiva_OE',
+        'dichiarazione_non_imponibile'
+    ]),
+
+    ("Valori Economici", [
+        'importo_massimo', 'quantita',
+        'importo_oneri_sicurezza', 'importo_oneri_personale'
+    ]),
+
+    ("Codici e Numeri", [
+        'acronimo_progetto', 'numero_CUP', 'numero_CIG',
+        'numero_COAN', 'voce_piano_dei_conti', 'voce_costo_COAN',
+        'codice_CPV', 'codice_ateco_OE', 'codice_ateco_OE_sec',
+        'codice_ateco_OE_dich', 'codice_CNEL', 'estratti_CNEL'
+    ]),
+
+    ("Informazioni Operatore Economico", [
+        'piattaforma_scelta', 'bando_MEPA', 'riferimento_PAD',
+        'dichiarazione_individuazione_OE', 'nome_OE_scelta', 'indirizzo_OE_scelta',
+        'legale_rap_OE_scelta', 'sede_OE_scelta', 'piva_OE_scelta'
+    ]),
+
+    ("Richiedente", [
+        'nome_cognome_richiedente', 'data_nascita_richiedente',
+        'luogo_nascita_richiedente', 'CF_richiedente', 'sede_richiedente',
+        'dichiarazioni_comunicazione_incarichi_richiedente',
+        'dichiarazioni_partecipazione_associazioni_organizzazioni_richiedente',
+        'mail_contatto_richiedente', 'qualifica_richiedente'
+    ]),
+
+    ("RUP", [
+        'nome_cognome_RUP', 'data_nascita_RUP',
+        'luogo_nascita_RUP', 'CF_RUP', 'sede_RUP',
+        'dichiarazioni_comunicazione_incarichi_RUP',
+        'dichiarazioni_partecipazione_associazioni_organizzazioni_RUP',
+        'mail_contatto_RUP'
+    ]),
+    ("supportoRUP", [
+        'nome_cognome_supportoRUP', 'data_nascita_supportoRUP',
+        'luogo_nascita_supportoRUP', 'CF_supportoRUP', 'sede_supportoRUP',
+        'dichiarazioni_comunicazione_incarichi_supportoRUP',
+        'dichiarazioni_partecipazione_associazioni_organizzazioni_supportoRUP',
+        'mail_contatto_supportoRUP'
+    ]),
+    ("Direttore", [
+        'nome_cognome_direttore', 'data_nascita_direttore',
+        'luogo_nascita_direttore', 'CF_direttore', 'sede_direttore',
+        'dichiarazioni_comunicazione_incarichi_direttore',
+        'dichiarazioni_partecipazione_associazioni_organizzazioni_direttore',
+        'mail_contatto_direttore'
+    ]),
+
+    ("RSS", [
+        'nome_cognome_RSS', 'data_nascita_RSS',
+        'luogo_nascita_RSS', 'CF_RSS', 'sede_RSS',
+        'dichiarazioni_comunicazione_incarichi_RSS',
+        'dichiarazioni_partecipazione_associazioni_organizzazioni_RSS',
+        'mail_contatto_RSS'
+    ]),
+
+    ("Firme e Documenti d'Identità", [
+        'firma_richiedente', 'img_documento_richiedente',
+        'firma_RUP', 'img_documento_RUP',
+        'firma_supportoRUP', 'img_documento_supportoRUP',
+        'firma_direttore', 'img_documento_direttore',
+        'firma_RSS', 'img_documento_RSS'
+    ]),
+
+    ("Protocolli e Riferimenti", [
+        'ulteriori_riferimenti_normativi_attuativi_operativi',
+        'url_gara', 'protocollo_RDA', 'protocollo_richiesta_url',
+        'protocollo_nomina_RUP', 'protocollo_conflittoint_richiedente',
+        'protocollo_conflittoint_RUP', 'protocollo_conflittoint_direttore',
+        'protocollo_allegato2_CIG', 'protocollo_istruttoria_RUP',
+        'protocollo_DAC', 'protocollo_ordine'
+    ]),
+
+    ("Generazione Offerte - Campi Principali", [
+        'servizio_fornitura',
+        'acronimo_progetto',
+        'numero_CUP',
+        'oggetto_fornitura_servizio',
+        'oggetto_esteso_fornitura_servizio',
+        'nome_cognome_richiedente',
+        'mail_contatto_richiedente'
+    ])
+]
+
+
+def normalize_name(name):
+    """Canonical lookup key of a sheet variable or header name"""
+    return str(name).replace('\xa0', ' ').strip().lower()
+
+
+class FieldIndex:
+    """Exact-name lookup that classifies sheet variable and header names.
+
+    Names are matched case-insensitively after stripping blanks (the sheets
+    contain non-breaking spaces), either directly or through FIELD_ALIASES.
+    Each distinct name is classified once and then served from a dict.
+    """
+
+    def __init__(self, fields=AUTOFILL_FIELDS, date_fields=DATE_FIELDS, aliases=FIELD_ALIASES,
+                 amount_fields=AMOUNT_FIELDS, code_fields=CODE_FIELDS):
+        self._fields = {field_name.lower(): field_name for field_name in fields}
+        for alias, field_name in aliases.items():
+            self._fields[alias.lower()] = field_name
+        self._date_fields = {field_name.lower() for field_name in date_fields}
+        self._kinds = {field_name.lower(): ('amount', None) for field_name in amount_fields}
+        for field_name, width in code_fields.items():
+            self._kinds[field_name.lower()] = ('code', width)
+        for field_name in date_fields:
+            self._kinds[field_name.lower()] = ('date', None)
+        self._classified = {}
+        self._kind_of = {}
+
+    def classify(self, name):
+        """Return (form field name or None, is_date) for a sheet name"""
+        result = self._classified.get(name)
+        if result is None:
+            key = normalize_name(name)
+            field_name = self._fields.get(key)
+            is_date = key in self._date_fields or (
+                field_name is not None and field_name.lower() in self._date_fields)
+            result = self._classified[name] = (field_name, is_date)
+        return result
+
+    def kind(self, name):
+        """Return ('date' | 'amount' | 'code' | None, fixed width of a code) for a sheet name"""
+        result = self._kind_of.get(name)
+        if result is None:
+            key = normalize_name(name)
+            field_name = self._fields.get(key)
+            result = self._kinds.get(key)
+            if result is None and field_name is not None:
+                result = self._kinds.get(field_name.lower())
+            result = self._kind_of[name] = result or (None, None)
+        return result
+
+
+FIELD_INDEX = FieldIndex()
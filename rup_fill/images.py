@@ -0,0 +1,176 @@
+"""Prepared images for the firma_* and img_documento_* fields.
+
+A signature or ID scan is read, turned upright according to its EXIF
+orientation and downscaled to the width it is printed at only once. The
+prepared bytes are kept in memory for the following documents and in the
+user cache directory, keyed by the content hash of the file and bounded
+like the workbook snapshots, for the following batches. Pillow is optional: without it the file is embedded as
+it is.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from .fields import IMAGE_PREFIXES
+from .snapshot import default_cache_dir, evict_directory, remove_file
+from .timing import span
+
+# Da incrementare quando cambia il modo in cui le immagini vengono preparate
+PREPARE_VERSION = 1
+IMAGE_DPI = 200
+# Larghezza di stampa in mm per tipo di campo immagine
+IMAGE_WIDTHS_MM = {'firma_': 50, 'img_documento_': 120}
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_MAX_BYTES = 200 * 1024 * 1024
+# Orientamento EXIF: 1 = già dritta
+EXIF_ORIENTATION = 0x0112
+
+
+def is_image_field(name):
+    return name.startswith(IMAGE_PREFIXES)
+
+
+def image_width_mm(name):
+    """Printed width of an image field in mm"""
+    for prefix, width in IMAGE_WIDTHS_MM.items():
+        if name.startswith(prefix):
+            return width
+    return None
+
+
+def _pillow():
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    return Image, ImageOps
+
+
+def prepare_image(data, width_mm, dpi=IMAGE_DPI):
+    """Image bytes turned upright and downscaled to width_mm at dpi (as they are without Pillow)"""
+    pillow = _pillow()
+    if pillow is None:
+        return data
+    Image, ImageOps = pillow
+    with Image.open(io.BytesIO(data)) as image:
+        image_format = image.format
+        max_width = round(width_mm / 25.4 * dpi)
+        rotated = image.getexif().get(EXIF_ORIENTATION, 1) != 1
+        if not rotated and image.width <= max_width:
+            return data
+        image = ImageOps.exif_transpose(image)
+        if image.width > max_width:
+            height = max(1, round(image.height * max_width / image.width))
+            image = image.resize((max_width, height), Image.LANCZOS)
+        output = io.BytesIO()
+        if image_format == 'JPEG':
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            image.save(output, 'JPEG', quality=90, dpi=(dpi, dpi))
+        else:
+            image.save(output, 'PNG', dpi=(dpi, dpi))
+        return output.getvalue()
+
+
+class ImageCache:
+    """LRU cache of prepared image bytes keyed by file, backed by a directory keyed by content hash.
+
+    The memory cache holds at most max_bytes, the directory disk_max_bytes
+    (least recently used files are deleted first).
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=None, dpi=IMAGE_DPI,
+                 disk_max_bytes=DEFAULT_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.directory = os.path.join(directory or default_cache_dir(), 'images')
+        self.dpi = dpi
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def nbytes(self):
+        return sum(len(data) for data in self._entries.values())
+
+    def get(self, path, width_mm):
+        """Prepared bytes of the image at path for a printed width of width_mm"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size, width_mm)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        with span('images'):
+            with open(path, 'rb') as f:
+                source = f.read()
+            digest = hashlib.sha256(source).hexdigest()
+            disk_path = os.path.join(self.directory,
+                                     f"{digest}-{width_mm}mm-{self.dpi}dpi-v{PREPARE_VERSION}.img")
+            data = self._load(disk_path)
+            if data is None:
+                data = prepare_image(source, width_mm, self.dpi)
+                # Senza Pillow i byte non sono preparati: non vanno salvati come tali
+                if _pillow() is not None:
+                    self._store(disk_path, data)
+
+        with self._lock:
+            self._entries[key] = data
+            self.misses += 1
+            total = self.nbytes
+            while total > self.max_bytes and len(self._entries) > 1:
+                total -= len(self._entries.popitem(last=False)[1])
+        return data
+
+    def _load(self, disk_path):
+        try:
+            with open(disk_path, 'rb') as f:
+                data = f.read()
+            # Aggiorna l'istante di accesso usato per l'eviction LRU
+            os.utime(disk_path)
+        except OSError:
+            return None
+        return data
+
+    def _store(self, disk_path, data):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        except OSError:
+            # La cache su disco è solo un'ottimizzazione
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, disk_path)
+        except OSError:
+            remove_file(tmp_path)
+            return
+        evict_directory(self.directory, self.disk_max_bytes)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.nbytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+_default_images = None
+
+
+def default_images():
+    """Process-wide ImageCache shared by every render"""
+    global _default_images
+    if _default_images is None:
+        _default_images = ImageCache()
+    return _default_images
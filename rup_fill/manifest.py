@@ -0,0 +1,142 @@
+"""Manifest of generated documents for incremental regeneration.
+
+The output directory keeps, for each document, the content hash of its
+template and of the projected context it was rendered with, plus the size
+and mtime of the file written. A later run skips the documents whose
+inputs are unchanged and whose file is still the one it wrote.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from .images import is_image_field
+
+MANIFEST_NAME = '.rup_fill_manifest.json'
+# Da incrementare quando cambia il modo in cui si calcolano gli hash
+MANIFEST_VERSION = 1
+
+
+def context_digest(context):
+    """sha256 of a projected context; image fields also hash the size and mtime of the file"""
+    items = []
+    for name in sorted(context):
+        value = context[name]
+        if is_image_field(name) and isinstance(value, str) and value.strip():
+            try:
+                stat = os.stat(value.strip())
+                value = [value, stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                pass
+        items.append([name, value])
+    blob = json.dumps(items, default=repr, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+class Manifest:
+    """Inputs of the documents generated in one output directory"""
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        self.path = os.path.join(self.directory, MANIFEST_NAME)
+        self.documents = {}
+        self.rebuilt = 0
+        self.skipped = 0
+        self._changed = False
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                self.documents = manifest['documents']
+        except Exception:
+            # Manifest assente o illeggibile: si rigenera tutto
+            pass
+
+    def _key(self, output_path):
+        return os.path.relpath(os.path.abspath(output_path), self.directory).replace(os.sep, '/')
+
+    def is_current(self, output_path, template_digest, context_hash):
+        """True if output_path was written by this manifest from the same inputs and left untouched"""
+        entry = self.documents.get(self._key(output_path))
+        if entry is None or entry['template'] != template_digest or entry['context'] != context_hash:
+            return False
+        try:
+            stat = os.stat(output_path)
+        except OSError:
+            return False
+        return entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+    def update(self, output_path, template_digest, context_hash):
+        """Record the inputs of a document that has just been written"""
+        stat = os.stat(output_path)
+        self.documents[self._key(output_path)] = {
+            'template': template_digest,
+            'context': context_hash,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns
+        }
+        self._changed = True
+
+    def forget(self, output_path):
+        """Drop a document whose generation failed, so that the next run retries it"""
+        if self.documents.pop(self._key(output_path), None) is not None:
+            self._changed = True
+
+    def save(self):
+        """Write the manifest atomically if anything changed"""
+        if not self._changed:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': MANIFEST_VERSION, 'documents': self.documents}, f,
+                          indent=1, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._changed = False
+
+
+class ManifestSet:
+    """Manifests of several output directories, each document going to the one of its folder.
+
+    It offers the interface of Manifest used by render_jobs, so a batch over
+    many procedures keeps one manifest per procedure folder.
+    """
+
+    def __init__(self):
+        self.manifests = {}
+        self.rebuilt = 0
+        self.skipped = 0
+
+    def _manifest(self, output_path):
+        directory = os.path.dirname(os.path.abspath(output_path))
+        manifest = self.manifests.get(directory)
+        if manifest is None:
+            manifest = self.manifests[directory] = Manifest(directory)
+        return manifest
+
+    def is_current(self, output_path, template_digest, context_hash):
+        return self._manifest(output_path).is_current(output_path, template_digest, context_hash)
+
+    def update(self, output_path, template_digest, context_hash):
+        self._manifest(output_path).update(output_path, template_digest, context_hash)
+
+    def forget(self, output_path):
+        self._manifest(output_path).forget(output_path)
+
+    def save(self):
+        """Save every manifest, raising the first error after trying them all"""
+        error = None
+        for manifest in self.manifests.values():
+            try:
+                manifest.save()
+            except OSError as e:
+                error = error or e
+        if error is not None:
+            raise error
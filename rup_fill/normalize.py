@@ -0,0 +1,197 @@
+"""Normalization of sheet values: Italian dates, euro amounts and codes.
+
+Whole columns of generazioni_offerte are converted in one batched pass
+with pandas (imported on first use). Each column keeps a cache of the raw
+values it has already converted, so a value repeated across rows or
+chunks is formatted only once. The scalar functions give the same results
+one value at a time and are used for dati_generali_procedura.
+"""
+from datetime import date, datetime, timedelta
+
+DATE_FORMAT = '%d/%m/%Y'
+# Formati testuali riconosciuti come date, nell'ordine in cui vengono provati
+DATE_INPUT_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d', DATE_FORMAT]
+# Giorno zero dei numeri seriali di Excel (tiene conto del 29/02/1900 inesistente)
+EXCEL_EPOCH = datetime(1899, 12, 30)
+# Giorni dall'epoca di Excel rappresentabili da pandas (1677-2262)
+SERIAL_RANGE = 80000
+# Valori convertiti ricordati per colonna: oltre si ricomincia, così la memoria resta limitata
+MEMO_LIMIT = 20000
+
+
+def _is_number(value):
+    return type(value) in (int, float)
+
+
+def format_excel_date(value):
+    """Format Excel date value to dd/mm/YYYY string"""
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, str):
+        for fmt in DATE_INPUT_FORMATS:
+            try:
+                return datetime.strptime(value, fmt).strftime(DATE_FORMAT)
+            except ValueError:
+                continue
+        return value
+    try:
+        # Numero seriale di Excel
+        return (EXCEL_EPOCH + timedelta(days=int(value))).strftime(DATE_FORMAT)
+    except (ValueError, TypeError, OverflowError):
+        return str(value)
+
+
+def format_amount(value):
+    """Euro amount in Italian notation (1.234,56); non-numeric values are only stripped"""
+    if _is_number(value):
+        return f"{value:,.2f}".translate(str.maketrans(',.', '.,'))
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def format_code(value, width=None):
+    """Code as text, zero-padded to width when it is made of digits only"""
+    if _is_number(value):
+        if type(value) is float and not value.is_integer():
+            return str(value)
+        value = str(int(value))
+    elif isinstance(value, str):
+        value = value.strip()
+    else:
+        return value
+    if width and value.isdigit():
+        value = value.zfill(width)
+    return value
+
+
+def normalize_value(kind, value, width=None):
+    """Normalize one value of the given kind ('date', 'amount', 'code'; None leaves it as is)"""
+    if kind == 'date':
+        return format_excel_date(value)
+    if kind == 'amount':
+        return format_amount(value)
+    if kind == 'code':
+        return format_code(value, width)
+    return value
+
+
+def _scalar_fallback(series, mask, result, function):
+    """Fill result where mask holds by applying function value by value"""
+    if mask.any():
+        result[mask] = series[mask].map(function)
+
+
+def _dates(pd, series, width=None):
+    # object: una colonna di soli numeri seriali verrebbe altrimenti convertita in int64/float64
+    result = series.map(lambda value: "" if value is None else value).astype(object)
+    kinds = series.map(type)
+    is_text = kinds == str
+    is_number = kinds.isin([int, float])
+    is_date = series.map(lambda value: isinstance(value, (datetime, date)))
+
+    if is_text.any():
+        texts = series[is_text]
+        parsed = pd.Series(pd.NaT, index=texts.index)
+        for fmt in DATE_INPUT_FORMATS:
+            parsed = parsed.fillna(pd.to_datetime(texts, format=fmt, errors='coerce'))
+        result[is_text] = parsed.dt.strftime(DATE_FORMAT).where(parsed.notna(), texts)
+    if is_number.any():
+        days = series[is_number].astype('float64')
+        # Seriali entro l'intervallo di date di pandas; gli altri (e NaN) passano dal calcolo scalare
+        in_range = days.abs() < SERIAL_RANGE
+        if in_range.any():
+            # astype('int64') tronca verso lo zero come int()
+            parsed = pd.to_datetime(days[in_range].astype('int64'), unit='D', origin=EXCEL_EPOCH)
+            result[in_range[in_range].index] = parsed.dt.strftime(DATE_FORMAT)
+        _scalar_fallback(series, is_number & ~in_range.reindex(series.index, fill_value=False),
+                         result, format_excel_date)
+    if is_date.any():
+        parsed = pd.to_datetime(series[is_date], errors='coerce')
+        result[is_date] = parsed.dt.strftime(DATE_FORMAT)
+        # Date fuori dall'intervallo di pandas (anno < 1678 o > 2261)
+        _scalar_fallback(series, is_date & result.isna(), result, format_excel_date)
+    _scalar_fallback(series, ~(is_text | is_number | is_date) & series.notna(), result, format_excel_date)
+    return result
+
+
+def _amounts(pd, series, width=None):
+    result = series.copy()
+    kinds = series.map(type)
+    is_text = kinds == str
+    is_number = kinds.isin([int, float])
+    if is_text.any():
+        result[is_text] = series[is_text].str.strip()
+    if is_number.any():
+        text = series[is_number].map('{:,.2f}'.format)
+        result[is_number] = text.str.translate(str.maketrans(',.', '.,'))
+    return result
+
+
+def _codes(pd, series, width=None):
+    result = series.copy()
+    kinds = series.map(type)
+    is_text = kinds == str
+    is_number = kinds.isin([int, float])
+    if is_number.any():
+        numbers = series[is_number].astype('float64')
+        result[is_number] = series[is_number].map(str)
+        # Interi e float interi (1234.0) diventano "1234"; i valori enormi passano dal calcolo scalare
+        integral = numbers.mod(1) == 0
+        small = integral & (numbers.abs() < 1e18)
+        if small.any():
+            result[small[small].index] = series[small[small].index].astype('int64').astype(str)
+        _scalar_fallback(series, (integral & ~small).reindex(series.index, fill_value=False),
+                         result, format_code)
+    if is_text.any():
+        result[is_text] = series[is_text].str.strip()
+    if width:
+        candidates = result[is_text | is_number].astype(str)
+        digits = candidates.str.isdigit()
+        if digits.any():
+            result[digits[digits].index] = candidates[digits].str.zfill(width)
+    return result
+
+
+_COLUMN_FORMATTERS = {'date': _dates, 'amount': _amounts, 'code': _codes}
+
+
+def normalize_column(kind, values, width=None):
+    """Normalize a list of values of one kind in a single batched pass"""
+    try:
+        import pandas as pd
+    except ImportError:
+        return [normalize_value(kind, value, width) for value in values]
+    series = pd.Series(list(values), dtype=object)
+    return _COLUMN_FORMATTERS[kind](pd, series, width).tolist()
+
+
+class ColumnNormalizer:
+    """Column-wise normalization of generazioni_offerte rows, with a value cache per column"""
+
+    def __init__(self, index, memo_limit=MEMO_LIMIT):
+        self.index = index
+        self.memo_limit = memo_limit
+        self._converted = {}
+
+    def normalize_rows(self, rows):
+        """Normalize the date, amount and code columns of row payloads in place"""
+        if not rows:
+            return rows
+        for header in rows[0]['data']:
+            kind, width = self.index.kind(header)
+            if kind is None:
+                continue
+            converted = self._converted.setdefault(header, {})
+            if len(converted) > self.memo_limit:
+                # Colonna con molti valori distinti (es. importi): la cache non si ripaga
+                converted.clear()
+            values = [row['data'].get(header) for row in rows]
+            pending = list(dict.fromkeys(value for value in values if value not in converted))
+            if pending:
+                converted.update(zip(pending, normalize_column(kind, pending, width)))
+            for row, value in zip(rows, values):
+                row['data'][header] = converted[value]
+        return rows
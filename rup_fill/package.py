@@ -0,0 +1,156 @@
+"""Writing .docx packages that copy unchanged members from the template archive.
+
+python-docx recompresses every member on save, including media that the
+render never touches. Here a member whose content is the same as in the
+template is copied as the template's already-compressed bytes; only the
+parts that the render changed (document, headers, footers, properties...)
+go through deflate, at a configurable level.
+
+Copying writes the compressed bytes straight into the ZipFile, keeping its
+bookkeeping by hand (fp, start_dir, filelist, NameToInfo, _didModify).
+These attributes are not public API; they are the same from CPython 3.9
+to 3.13, which tests/test_package.py checks against the installed
+version. Members too large for plain zip headers and outputs that cannot
+seek go through ZipFile.writestr instead.
+"""
+import io
+import os
+import struct
+import time
+import zipfile
+import zlib
+
+DEFAULT_COMPRESSLEVEL = 6
+# Oltre questa dimensione servirebbero i campi zip64 nell'intestazione locale: si ricomprime
+MAX_COPY_SIZE = zipfile.ZIP64_LIMIT
+
+
+class _Recorder:
+    """PhysPkgWriter stand-in that only records the CRC and size of each member"""
+
+    def __init__(self):
+        self.members = {}
+
+    def write(self, pack_uri, blob):
+        self.members[pack_uri.membername] = (zlib.crc32(blob), len(blob))
+
+
+def _write_package_parts(writer, package):
+    """Same sequence of members as python-docx's OpcPackage.save"""
+    from docx.opc.pkgwriter import PackageWriter
+    parts = list(package.parts)
+    for part in parts:
+        part.before_marshal()
+    PackageWriter._write_content_types_stream(writer, parts)
+    PackageWriter._write_pkg_rels(writer, package.rels)
+    PackageWriter._write_parts(writer, parts)
+
+
+def _seekable(stream):
+    try:
+        return stream.seekable()
+    except (AttributeError, OSError, ValueError):
+        return False
+
+
+class SourceArchive:
+    """Compressed members of a template archive, and how python-docx serializes them untouched"""
+
+    def __init__(self, data):
+        from docx import Document
+        self.members = {}
+        view = memoryview(data)
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            for info in zf.infolist():
+                if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                    continue
+                header = struct.unpack(zipfile.structFileHeader,
+                                       data[info.header_offset:info.header_offset + zipfile.sizeFileHeader])
+                start = info.header_offset + zipfile.sizeFileHeader + header[10] + header[11]
+                self.members[info.filename] = (info, view[start:start + info.compress_size])
+
+        # Le parti XML vengono riserializzate da python-docx: si confronta con quella forma
+        recorder = _Recorder()
+        _write_package_parts(recorder, Document(io.BytesIO(data)).part.package)
+        self.baseline = recorder.members
+
+    def unchanged(self, name, crc, size):
+        """True if a member serialized as (crc, size) is the template's own content"""
+        return name in self.members and self.baseline.get(name) == (crc, size)
+
+    def read(self, name):
+        """Uncompressed content of a member"""
+        info, raw = self.members[name]
+        if info.compress_type == zipfile.ZIP_STORED:
+            return bytes(raw)
+        return zlib.decompress(raw, -zlib.MAX_WBITS)
+
+
+class PassthroughWriter:
+    """Zip writer for a .docx that copies unchanged members from a SourceArchive"""
+
+    def __init__(self, output, source, compresslevel=DEFAULT_COMPRESSLEVEL):
+        self.source = source
+        # Su uno stream non posizionabile ZipFile scrive i descrittori dei dati: niente copia diretta
+        self.raw_copy = isinstance(output, (str, os.PathLike)) or _seekable(output)
+        self.zf = zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED,
+                                  compresslevel=compresslevel)
+        self.copied = 0
+        self.compressed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.zf.close()
+
+    def write(self, pack_uri, blob):
+        """PhysPkgWriter interface used by python-docx's PackageWriter"""
+        self.write_member(pack_uri.membername, blob)
+
+    def write_member(self, name, blob, crc=None):
+        crc = zlib.crc32(blob) if crc is None else crc
+        if self.source is not None and self.source.unchanged(name, crc, len(blob)):
+            self.copy_member(name)
+        else:
+            self.zf.writestr(name, blob)
+            self.compressed += 1
+
+    def copy_member(self, name):
+        """Append the template's compressed bytes for name without inflating them.
+
+        Members over MAX_COPY_SIZE and outputs that cannot seek fall back to
+        a regular (recompressing) writestr.
+        """
+        source_info, raw = self.source.members[name]
+        if not self.raw_copy or max(source_info.file_size, len(raw)) > MAX_COPY_SIZE:
+            self.zf.writestr(name, self.source.read(name))
+            self.compressed += 1
+            return
+        zinfo = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+        zinfo.compress_type = source_info.compress_type
+        zinfo.CRC = source_info.CRC
+        zinfo.compress_size = len(raw)
+        zinfo.file_size = source_info.file_size
+        zinfo.external_attr = 0o600 << 16
+
+        # Stessa contabilità di ZipFile.writestr, ma senza passare dal compressore
+        zf = self.zf
+        zinfo.header_offset = zf.fp.tell()
+        zf.fp.write(zinfo.FileHeader())
+        zf.fp.write(raw)
+        zf.start_dir = zf.fp.tell()
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[name] = zinfo
+        zf._didModify = True
+        self.copied += 1
+
+
+def save_package(package, output, source, compresslevel=DEFAULT_COMPRESSLEVEL):
+    """Save a python-docx package, passing unchanged members through from source"""
+    with PassthroughWriter(output, source, compresslevel) as writer:
+        _write_package_parts(writer, package)
+    return writer
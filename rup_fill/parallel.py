@@ -0,0 +1,235 @@
+"""Render (row, template) jobs over a pool of worker processes"""
+import multiprocessing
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from .failures import RenderError
+from .manifest import context_digest
+from .render import plan_renders, render_document
+from .package import DEFAULT_COMPRESSLEVEL
+from .templates import DEFAULT_MAX_BYTES, TemplateCache, default_cache
+from .timing import active, collect, span
+
+# Cache dei template del processo worker, creata da _init_worker
+_worker_cache = None
+
+
+def default_workers(workers=None):
+    """Number of worker processes: workers if given, else one per CPU"""
+    if workers is None or workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def _init_worker(max_cache_bytes, compresslevel=DEFAULT_COMPRESSLEVEL, preload=()):
+    global _worker_cache
+    _worker_cache = TemplateCache(max_cache_bytes, compresslevel=compresslevel)
+    # Template caricati in anticipo dai worker di lunga durata (servizio di rendering)
+    for path in preload:
+        try:
+            _worker_cache.get(path)
+        except Exception:
+            pass
+    if preload:
+        from . import engine  # noqa: F401
+
+
+def new_executor(workers, max_cache_bytes=DEFAULT_MAX_BYTES, compresslevel=DEFAULT_COMPRESSLEVEL, preload=()):
+    """Pool of spawned worker processes, each with its own TemplateCache"""
+    return ProcessPoolExecutor(max_workers=workers,
+                               mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker,
+                               initargs=(max_cache_bytes, compresslevel, tuple(preload)))
+
+
+def _render_unit(template_path, context, output_path, cache=None):
+    """Render one document, returning None on success or the error message (a RenderError)"""
+    try:
+        render_document(template_path, context, output_path,
+                        cache if cache is not None else _worker_cache)
+        return None
+    except Exception as e:
+        return RenderError.from_exception(e)
+
+
+def _render_unit_timed(template_path, context, output_path):
+    """_render_unit in a worker process, also returning the timing records of the document"""
+    with collect() as timings:
+        error = _render_unit(template_path, context, output_path)
+    return error, timings.records
+
+
+def place_copy(source, destination, link=False):
+    """Write destination as a copy of source, or as a hard link to it when link is set"""
+    if link:
+        try:
+            if os.path.lexists(destination):
+                os.remove(destination)
+            os.link(source, destination)
+            return
+        except OSError:
+            # File system senza hard link (FAT, alcune cartelle di rete): si copia
+            pass
+    shutil.copyfile(source, destination)
+
+
+def _complete_unit(jobs, unit, error, results, link=False):
+    """Record the outcome of a rendered unit for each of its jobs, copying the shared document"""
+    template_path, context, indices = unit
+    first_output = jobs[indices[0]][3]
+    results[indices[0]] = error
+    for index in indices[1:]:
+        output_path = jobs[index][3]
+        if error is None and os.path.abspath(output_path) != os.path.abspath(first_output):
+            try:
+                with span('copy'):
+                    place_copy(first_output, output_path, link)
+            except OSError as e:
+                results[index] = RenderError.from_exception(e)
+                continue
+        results[index] = error
+
+
+def _skip_unchanged(jobs, units, cache, manifest, results, unit_inputs):
+    """Units whose documents are not all current in manifest; the others are reported as done"""
+    stale = []
+    for unit in units:
+        template_path, context, indices = unit
+        try:
+            inputs = (cache.get(template_path).digest, context_digest(context))
+        except Exception:
+            stale.append(unit)
+            continue
+        unit_inputs[indices[0]] = inputs
+        if all(manifest.is_current(jobs[index][3], *inputs) for index in indices):
+            for index in indices:
+                results[index] = None
+            manifest.skipped += len(indices)
+        else:
+            stale.append(unit)
+    return stale
+
+
+def _record_unit(jobs, unit, results, manifest, unit_inputs):
+    """Update manifest with the outcome of a rendered unit"""
+    indices = unit[2]
+    inputs = unit_inputs.get(indices[0])
+    for index in indices:
+        output_path = jobs[index][3]
+        if results[index] is None and inputs is not None:
+            try:
+                manifest.update(output_path, *inputs)
+            except OSError:
+                manifest.forget(output_path)
+            manifest.rebuilt += 1
+        else:
+            manifest.forget(output_path)
+
+
+def render_jobs(jobs, workers=None, max_cache_bytes=DEFAULT_MAX_BYTES, cache=None, cancelled=None,
+                compresslevel=DEFAULT_COMPRESSLEVEL, link=False, manifest=None, executor=None):
+    """Render (row_idx, template_path, context, output_path) jobs and yield (job, error).
+
+    Jobs are first grouped by plan_renders: each distinct (template
+    content, projected context) pair is rendered once and copied to the
+    other output paths that share it, or hard-linked with link where the
+    file system allows it. Results come back in the order of jobs whatever
+    the worker count. With a single worker everything runs in this process
+    using cache (or the process-wide one). Workers are started with the
+    "spawn" method so they only import rup_fill, never the Qt GUI of the
+    parent process.
+
+    With a Manifest, documents whose template and projected context are
+    unchanged since they were written are not rendered again (they are
+    reported as successful); the manifest counts rebuilt and skipped
+    documents and is saved when the generator ends.
+
+    cancelled is an optional callable checked between documents: once it
+    returns True no new document is started, documents already being
+    rendered are still reported and the generator ends.
+
+    compresslevel is used by the worker processes' caches; in-process
+    rendering keeps the setting of cache.
+
+    executor is an optional pool from new_executor kept by the caller
+    across calls (its workers keep their caches warm); it is used for
+    every document, workers then being its size, and is not shut down.
+    """
+    jobs = list(jobs)
+    cancelled = cancelled or (lambda: False)
+    cache = cache if cache is not None else default_cache()
+    results = {}
+    unit_inputs = {}
+    with span('plan'):
+        units = plan_renders(jobs, cache)
+        if manifest is not None:
+            units = _skip_unchanged(jobs, units, cache, manifest, results, unit_inputs)
+    next_index = 0
+
+    def ready():
+        nonlocal next_index
+        while next_index in results:
+            yield jobs[next_index], results.pop(next_index)
+            next_index += 1
+
+    def complete(unit, error):
+        _complete_unit(jobs, unit, error, results, link)
+        if manifest is not None:
+            _record_unit(jobs, unit, results, manifest, unit_inputs)
+
+    try:
+        yield from ready()
+        workers = min(default_workers(workers), len(units))
+        if executor is None and workers <= 1:
+            for unit in units:
+                if cancelled():
+                    break
+                template_path, context, indices = unit
+                error = _render_unit(template_path, context, jobs[indices[0]][3], cache)
+                complete(unit, error)
+                yield from ready()
+        else:
+            # I tempi misurati nei processi worker tornano insieme al risultato
+            timings = active()
+            task = _render_unit_timed if timings is not None else _render_unit
+            # Finestra limitata di documenti in volo: l'annullamento non attende tutta la coda
+            window = workers * 2
+            pending = deque()
+            remaining = iter(units)
+            with nullcontext(executor) if executor is not None else \
+                    new_executor(workers, max_cache_bytes, compresslevel) as executor:
+                while True:
+                    while len(pending) < window and not cancelled():
+                        unit = next(remaining, None)
+                        if unit is None:
+                            break
+                        template_path, context, indices = unit
+                        pending.append((unit, executor.submit(task, template_path, context,
+                                                              jobs[indices[0]][3])))
+                    if not pending:
+                        break
+                    if cancelled():
+                        for unit, future in pending:
+                            future.cancel()
+                    unit, future = pending.popleft()
+                    if not future.cancelled():
+                        error = future.result()
+                        if timings is not None:
+                            error, records = error
+                            timings.extend(records)
+                        complete(unit, error)
+                        yield from ready()
+
+        # Dopo un annullamento restano i job completati oltre il primo mancante
+        for index in sorted(results):
+            yield jobs[index], results[index]
+    finally:
+        if manifest is not None:
+            try:
+                manifest.save()
+            except OSError:
+                # Senza manifest la prossima generazione rifà tutto, ma questa è riuscita
+                pass
@@ -0,0 +1,121 @@
+"""Context building, output naming and rendering shared by GUI and CLI"""
+import os
+from datetime import datetime
+
+from .fields import FORM_FIELDS
+from .templates import default_cache
+from .workbook import GENERAZIONI_OFFERTE
+
+
+def today():
+    """Current date in the dd/mm/YYYY format used in documents and filenames"""
+    return datetime.now().strftime('%d/%m/%Y')
+
+
+def build_context(form_values, dati_generali, current_date):
+    """Merge form fields and dati_generali_procedura entries into a base context"""
+    context = {
+        'data_oggi': current_date,
+        'data_corrente': current_date
+    }
+
+    # Add all form fields to context
+    for field_name in FORM_FIELDS:
+        context[field_name] = form_values.get(field_name, "")
+    # Variabili dello schema che non fanno parte dei campi predefiniti
+    for field_name, value in form_values.items():
+        context.setdefault(field_name, value)
+
+    # Add data from dati_generali_procedura sheet
+    for entry in dati_generali or []:
+        context[entry['name']] = entry['value']
+    return context
+
+
+def output_filename(template_path, context, current_date, row_idx=None, single_template=True):
+    """Output filename for a template rendered with context.
+
+    Rows of generazioni_offerte keep the historical "Richiesta_Offerta_..."
+    name; when several templates are rendered per row the template name is
+    used instead so that the documents do not overwrite each other.
+    """
+    nome_cognome = context.get('nome_cognome_richiedente')
+    cognome = str(nome_cognome).split()[-1] if nome_cognome and str(nome_cognome).split() else 'documento'
+    progetto = context.get('acronimo_progetto')
+    template_name = os.path.splitext(os.path.basename(template_path))[0]
+    date_part = current_date.replace('/', '-')
+
+    if row_idx is None:
+        return f"{template_name}_{cognome}_{progetto}_{date_part}.docx"
+    prefix = "Richiesta_Offerta" if single_template else template_name
+    return f"{prefix}_{cognome}_{progetto}_OE_{row_idx}_{date_part}.docx"
+
+
+def iter_jobs(source_sheet, context, template_paths, output_dir, current_date, rows=None):
+    """Yield (row_idx, template_path, context, output_path) for every document to generate.
+
+    For generazioni_offerte every selected row is merged on top of the base
+    context; row_idx is None for dati_generali_procedura documents.
+    """
+    single_template = len(template_paths) == 1
+    if source_sheet == GENERAZIONI_OFFERTE:
+        for row in rows or []:
+            row_context = context.copy()
+            row_context.update(row['data'])
+            for template_path in template_paths:
+                filename = output_filename(template_path, row_context, current_date,
+                                           row['row_idx'], single_template)
+                yield row['row_idx'], template_path, row_context, os.path.join(output_dir, filename)
+    else:
+        for template_path in template_paths:
+            filename = output_filename(template_path, context, current_date)
+            yield None, template_path, context, os.path.join(output_dir, filename)
+
+
+def render_document(template_path, context, output_path, cache=None):
+    """Render template_path with context and save it to output_path.
+
+    Templates come from the process-wide TemplateCache unless another cache
+    is given, so each file is unzipped and pre-processed once per batch.
+    """
+    cache = cache if cache is not None else default_cache()
+    return cache.render(template_path, context, output_path)
+
+
+def _context_key(context):
+    try:
+        key = tuple(sorted(context.items()))
+        hash(key)
+        return key
+    except TypeError:
+        # Valori non hashabili: il documento non viene condiviso
+        return object()
+
+
+def plan_renders(jobs, cache=None):
+    """Group jobs that would produce the same document.
+
+    Each job's context is projected onto the variables its template actually
+    references; jobs sharing template and projected context (e.g. a template
+    that uses no generazioni_offerte column, rendered for many rows) form one
+    unit that is rendered once. Templates are compared by content hash, so
+    byte-identical files in different folders share their units. Returns
+    [(template_path, context, indices)] where indices point into jobs, in
+    order of first appearance.
+    """
+    cache = cache if cache is not None else default_cache()
+    units = {}
+    for index, (row_idx, template_path, context, output_path) in enumerate(jobs):
+        try:
+            compiled = cache.get(template_path)
+            context = compiled.project(context)
+            key = (compiled.digest, _context_key(context))
+        except Exception:
+            # Template illeggibile: l'errore emergerà al render del singolo job
+            key = (template_path, object())
+        unit = units.get(key)
+        if unit is None:
+            units[key] = (template_path, context, [index])
+        else:
+            unit[2].append(index)
+    return list(units.values())
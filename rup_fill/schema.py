@@ -0,0 +1,201 @@
+"""Field schema of the document form: names, groups, types and date formatting.
+
+Field names come from the built-in lists of rup_fill.fields plus the
+template variables listed in variabili_testo.xlsx (sheet "variabili",
+column A). Reading the workbook needs openpyxl, so the extracted names are
+cached on disk by content hash and later start-ups only read a small JSON
+file.
+"""
+import json
+import os
+import re
+import tempfile
+
+from .fields import (AMOUNT_FIELDS, CODE_FIELDS, DATE_FIELDS, FIELD_ALIASES, FIELD_GROUPS, FORM_FIELDS,
+                     IMAGE_PREFIXES)
+from .normalize import DATE_FORMAT
+from .snapshot import default_cache_dir, file_digest
+from .timing import span
+
+# Da incrementare quando cambia il modo in cui le variabili vengono estratte
+SCHEMA_VERSION = 1
+VARIABLES_SHEET = 'variabili'
+DEFAULT_VARIABLES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                      'variabili_testo.xlsx')
+EXTRA_GROUP = "Altre variabili"
+
+# Il foglio contiene anche "{{ codice_CPV}" e spazi dentro i nomi
+VARIABLE = re.compile(r'\{\{([^{}]+)\}')
+
+
+def field_kind(name):
+    """'date', 'image', 'amount', 'code' or 'text'"""
+    if name in DATE_FIELDS:
+        return 'date'
+    if name.startswith(IMAGE_PREFIXES):
+        return 'image'
+    if name in AMOUNT_FIELDS:
+        return 'amount'
+    if name in CODE_FIELDS:
+        return 'code'
+    return 'text'
+
+
+class FieldSpec:
+    """One form field: name, first group showing it (None if hidden) and value type"""
+    __slots__ = ('name', 'group', 'kind', 'date_format')
+
+    def __init__(self, name, group=None, kind='text'):
+        self.name = name
+        self.group = group
+        self.kind = kind
+        self.date_format = DATE_FORMAT if kind == 'date' else None
+
+    @property
+    def label(self):
+        return self.name.replace('_', ' ').title() + ":"
+
+
+class FieldSchema:
+    """Ordered field specs and the groups they are shown in"""
+
+    def __init__(self, groups, hidden=()):
+        # Un campo può comparire in più gruppi: la specifica resta una sola
+        self.groups = [(title, list(names)) for title, names in groups]
+        self.fields = {}
+        for title, names in self.groups:
+            for name in names:
+                if name not in self.fields:
+                    self.fields[name] = FieldSpec(name, title, field_kind(name))
+        for name in hidden:
+            if name not in self.fields:
+                self.fields[name] = FieldSpec(name, None, field_kind(name))
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def __len__(self):
+        return len(self.fields)
+
+    @property
+    def names(self):
+        return list(self.fields)
+
+    def names_of_kind(self, kind):
+        return [name for name, spec in self.fields.items() if spec.kind == kind]
+
+
+def canonical_name(raw, known=None):
+    """Form field name for a variable as written in the sheet (blanks, case and aliases ignored)"""
+    name = re.sub(r'\s+', '', raw)
+    if known is None:
+        known = _known_names()
+    return known.get(name.lower(), name)
+
+
+def _known_names():
+    known = {name.lower(): name for name in FORM_FIELDS}
+    for alias, name in FIELD_ALIASES.items():
+        known[alias.lower()] = name
+    return known
+
+
+def build_schema(variables=()):
+    """FieldSchema of the built-in groups plus the variables not already known"""
+    known = _known_names()
+    extra = []
+    for raw in variables:
+        name = canonical_name(raw, known)
+        if name and name not in FORM_FIELDS and name not in extra and name.isidentifier():
+            extra.append(name)
+    groups = list(FIELD_GROUPS)
+    if extra:
+        groups.append((EXTRA_GROUP, extra))
+    return FieldSchema(groups, hidden=FORM_FIELDS)
+
+
+def read_variables(path):
+    """Variable names written as {{ name }} in column A of the "variabili" sheet"""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        variables = []
+        for (value,) in wb[VARIABLES_SHEET].iter_rows(min_col=1, max_col=1, values_only=True):
+            if isinstance(value, str):
+                variables.extend(VARIABLE.findall(value))
+        return variables
+    finally:
+        wb.close()
+
+
+class SchemaCache:
+    """Directory of variable lists extracted from variabili_testo.xlsx, keyed by content hash"""
+
+    def __init__(self, directory=None):
+        self.directory = os.path.join(directory or default_cache_dir(), 'schema')
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}-v{SCHEMA_VERSION}.json")
+
+    def load(self, digest):
+        try:
+            with open(self._path(digest), encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def store(self, digest, variables):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(variables, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(digest))
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+_schemas = {}
+
+
+def load_schema(path=DEFAULT_VARIABLES_PATH, cache=None, cached_only=False):
+    """FieldSchema for a variables workbook, built once per file version.
+
+    A missing or unreadable workbook yields the schema of the built-in
+    fields alone, so the form is always available. With cached_only the
+    workbook is never opened: None is returned when its variables are not
+    in the on-disk cache yet, so callers on the GUI thread can read it later
+    in the background.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return build_schema()
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    schema = _schemas.get(key)
+    if schema is not None:
+        return schema
+
+    with span('load_schema'):
+        cache = cache if cache is not None else SchemaCache()
+        variables = None
+        try:
+            digest = file_digest(path)
+            variables = cache.load(digest)
+            if variables is None:
+                if cached_only:
+                    return None
+                variables = read_variables(path)
+                try:
+                    cache.store(digest, variables)
+                except OSError:
+                    pass
+        except Exception:
+            variables = variables or []
+        schema = _schemas[key] = build_schema(variables)
+    return schema
@@ -0,0 +1,295 @@
+"""Local render service: python -m rup_fill.service --templates template_doc
+
+A long-running process listening on localhost that keeps the imports, the
+field schema and the templates warm, in itself and in a pool of worker
+processes that lives as long as the service. Desktop instances send it
+render requests instead of paying the cold start every time.
+
+Endpoints (JSON bodies):
+
+GET  /health    state of the service and of its caches
+GET  /schema    field schema of the document form
+POST /render    {"jobs": [{"row_idx", "template", "context", "output_path"}],
+                 "incremental": bool, "link": bool}
+                streams one JSON line per document as it is written,
+                {"index", "output_path", "error", "exception"}, then a last line
+                {"done": true, "documents", "failed", "rebuilt", "skipped"}
+POST /document  {"template", "context"}: the rendered .docx itself
+
+Paths are those of the machine running the service, which only listens
+on the loopback interface: there is no authentication and any template
+and output path is accepted, so other hosts must not reach it.
+"""
+import argparse
+import ipaddress
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .manifest import ManifestSet
+from .package import DEFAULT_COMPRESSLEVEL
+from .parallel import default_workers, new_executor, render_jobs
+from .schema import load_schema
+from .templates import TemplateCache
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DOCX_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+# Dimensione massima di una richiesta (i contesti di molte righe possono essere grandi)
+MAX_REQUEST_BYTES = 256 * 1024 * 1024
+
+
+class RenderService:
+    """Warm caches and the bounded worker pool shared by every request"""
+
+    def __init__(self, workers=None, max_cache_bytes=256 * 1024 * 1024, compresslevel=DEFAULT_COMPRESSLEVEL,
+                 preload=(), max_requests=None):
+        self.workers = default_workers(workers)
+        self.max_cache_bytes = max_cache_bytes
+        self.compresslevel = compresslevel
+        self.cache = TemplateCache(max_cache_bytes, compresslevel=compresslevel)
+        self.schema = load_schema()
+        for path in preload:
+            try:
+                self.cache.get(path)
+            except Exception as e:
+                print(f"Template non caricato {path}: {e}", file=sys.stderr)
+        self.executor = new_executor(self.workers, max_cache_bytes, compresslevel, preload)
+        # Richieste di rendering servite insieme; le altre attendono il proprio turno
+        self.slots = threading.BoundedSemaphore(max_requests or self.workers)
+        self.started = time.time()
+        self.requests = 0
+        self.documents = 0
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'pid': os.getpid(),
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'workers': self.workers,
+            'requests': self.requests,
+            'documents': self.documents,
+            'fields': len(self.schema),
+            'template_cache': self.cache.stats()
+        }
+
+    def schema_payload(self):
+        return {
+            'groups': self.schema.groups,
+            'fields': {name: {'group': spec.group, 'kind': spec.kind, 'date_format': spec.date_format}
+                       for name, spec in self.schema.fields.items()}
+        }
+
+    def render(self, jobs, incremental=False, link=False, cancelled=None):
+        """Yield (index, output_path, error) for jobs, then the summary of the request"""
+        jobs = [(job.get('row_idx'), job['template'], job['context'], job['output_path']) for job in jobs]
+        positions = {id(job): index for index, job in enumerate(jobs)}
+        manifest = ManifestSet() if incremental else None
+        documents = failed = 0
+        with self.slots:
+            with self._lock:
+                self.requests += 1
+            for directory in {os.path.dirname(job[3]) for job in jobs}:
+                os.makedirs(directory or '.', exist_ok=True)
+            for job, error in render_jobs(jobs, self.workers, self.max_cache_bytes, self.cache, cancelled,
+                                          self.compresslevel, link=link, manifest=manifest,
+                                          executor=self.executor):
+                if error is None:
+                    documents += 1
+                else:
+                    failed += 1
+                yield positions[id(job)], job[3], error
+        with self._lock:
+            self.documents += documents
+        yield {
+            'done': True,
+            'documents': documents,
+            'failed': failed,
+            'rebuilt': manifest.rebuilt if manifest is not None else documents,
+            'skipped': manifest.skipped if manifest is not None else 0
+        }
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = 'rup_fill'
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0 or length > MAX_REQUEST_BYTES:
+            raise ValueError("richiesta vuota o troppo grande")
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(self.service.health())
+        elif self.path == '/schema':
+            self.send_json(self.service.schema_payload())
+        else:
+            self.send_json({'error': f"percorso sconosciuto: {self.path}"}, 404)
+
+    def do_POST(self):
+        try:
+            request = self.read_json()
+        except Exception as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        if self.path == '/render':
+            self.stream_render(request)
+        elif self.path == '/document':
+            self.send_document(request)
+        else:
+            self.send_json({'error': f"percorso sconosciuto: {self.path}"}, 404)
+
+    def stream_render(self, request):
+        if not isinstance(request.get('jobs'), list):
+            self.send_json({'error': "manca l'elenco dei documenti (jobs)"}, 400)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.end_headers()
+        # Client disconnesso (annullamento): i documenti in corso terminano, i successivi non partono
+        disconnected = threading.Event()
+        try:
+            for item in self.service.render(request['jobs'], bool(request.get('incremental')),
+                                            bool(request.get('link')), disconnected.is_set):
+                if isinstance(item, dict):
+                    line = item
+                else:
+                    index, output_path, error = item
+                    line = {'index': index, 'output_path': output_path, 'error': error,
+                            'exception': getattr(error, 'exception', None)}
+                if disconnected.is_set():
+                    continue
+                try:
+                    self.wfile.write(json.dumps(line, ensure_ascii=False).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+                except OSError:
+                    disconnected.set()
+        except Exception as e:
+            if not disconnected.is_set():
+                try:
+                    self.wfile.write(json.dumps({'done': True, 'error': str(e)}).encode('utf-8') + b'\n')
+                except OSError:
+                    pass
+
+    def send_document(self, request):
+        template = request.get('template')
+        if not template:
+            self.send_json({'error': "manca il template"}, 400)
+            return
+        with tempfile.TemporaryDirectory(prefix='rup_fill_') as directory:
+            output_path = os.path.join(directory, os.path.basename(template))
+            job = {'template': template, 'context': request.get('context') or {}, 'output_path': output_path}
+            error = None
+            for item in self.service.render([job]):
+                if not isinstance(item, dict):
+                    error = item[2]
+            if error is not None:
+                self.send_json({'error': error}, 422)
+                return
+            with open(output_path, 'rb') as f:
+                body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', DOCX_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(template)}"')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def check_host(host):
+    """Raise ValueError unless host is an IPv4 loopback address (or localhost)"""
+    if host.lower() == 'localhost':
+        return
+    try:
+        loopback = ipaddress.IPv4Address(host).is_loopback
+    except ValueError:
+        loopback = False
+    if not loopback:
+        raise ValueError(f"indirizzo di ascolto non locale: {host} (il servizio non ha autenticazione e scrive "
+                         f"nei percorsi indicati nelle richieste; usare 127.0.0.1 o localhost)")
+
+
+def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT, verbose=False):
+    """Run the HTTP server until interrupted; host must be a loopback address"""
+    check_host(host)
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    print(f"Servizio di rendering su http://{host}:{server.server_address[1]} "
+          f"({service.workers} processi)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m rup_fill.service',
+        description="Servizio locale di rendering che mantiene in memoria template e schema dei campi.")
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help="indirizzo di ascolto, solo di loopback (127.x.x.x o localhost; "
+                             "default: %(default)s)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="porta (default: %(default)s)")
+    parser.add_argument('--templates', nargs='*', default=[],
+                        help="template .docx o cartelle da caricare all'avvio (es. template_doc/B_RDA)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="processi di rendering (default: uno per CPU)")
+    parser.add_argument('--max-requests', type=int, default=None,
+                        help="richieste di rendering servite contemporaneamente (default: come --workers)")
+    parser.add_argument('--template-cache-mb', type=int, default=256,
+                        help="memoria massima per la cache dei template in MB (default: %(default)s)")
+    parser.add_argument('--compress-level', type=int, default=DEFAULT_COMPRESSLEVEL, choices=range(10),
+                        metavar='0-9', help="livello di compressione delle parti modificate (default: %(default)s)")
+    parser.add_argument('--verbose', action='store_true', help="registra ogni richiesta su stderr")
+    return parser
+
+
+def main(argv=None):
+    # Import locale: rup_fill.cli importa il client, che importa questo modulo
+    from .cli import collect_templates
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        check_host(args.host)
+    except ValueError as e:
+        parser.error(str(e))
+    preload = [os.path.abspath(path) for path in collect_templates(args.templates)]
+    service = RenderService(args.workers, args.template_cache_mb * 1024 * 1024, args.compress_level,
+                            preload, args.max_requests)
+    serve(service, args.host, args.port, args.verbose)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
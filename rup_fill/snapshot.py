@@ -0,0 +1,221 @@
+"""On-disk snapshots of parsed workbooks, keyed by content hash and format version.
+
+Snapshots are zlib-compressed JSON: the cache directory is writable by the
+user, so its files are only ever parsed as data (never unpickled). Cell
+values json has no type for (dates, times, durations) are stored as
+single-key tagged objects.
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import zlib
+from datetime import date, datetime, time, timedelta
+
+from .workbook import (DATI_GENERALI, GENERAZIONI_OFFERTE, add_workbook_event,
+                       new_workbook_data, stream_workbook)
+from .timing import span
+
+# Da incrementare quando cambia il modo in cui i fogli vengono letti o formattati
+FORMAT_VERSION = 4
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+CHUNK_SIZE = 5000
+
+
+def default_cache_dir():
+    """Per-user cache directory (RUP_FILL_CACHE_DIR overrides it)"""
+    if os.environ.get('RUP_FILL_CACHE_DIR'):
+        return os.environ['RUP_FILL_CACHE_DIR']
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'rup_fill')
+
+
+def file_digest(path):
+    """sha256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _encode(value):
+    """Tagged JSON form of the cell values json cannot represent"""
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, time):
+        return {'$time': value.isoformat()}
+    if isinstance(value, timedelta):
+        return {'$timedelta': [value.days, value.seconds, value.microseconds]}
+    raise TypeError(f"valore non salvabile nello snapshot: {type(value).__name__}")
+
+
+_DECODERS = {
+    '$datetime': datetime.fromisoformat,
+    '$date': date.fromisoformat,
+    '$time': time.fromisoformat,
+    '$timedelta': lambda parts: timedelta(*parts)
+}
+
+
+def _decode(obj):
+    if len(obj) == 1:
+        tag, value = next(iter(obj.items()))
+        decoder = _DECODERS.get(tag)
+        if decoder is not None:
+            return decoder(value)
+    return obj
+
+
+def remove_file(path):
+    """Delete path, ignoring errors"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def evict_directory(directory, max_bytes):
+    """Delete the least recently used files of a cache directory until it fits max_bytes.
+
+    Recency is the file mtime, which the caches refresh on every hit.
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    files = []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        remove_file(path)
+        total -= size
+
+
+class SnapshotCache:
+    """Directory of compressed workbook snapshots with size-bounded LRU eviction"""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = os.path.join(directory or default_cache_dir(), 'workbooks')
+        self.max_bytes = max_bytes
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}-v{FORMAT_VERSION}.snapshot")
+
+    def load(self, digest):
+        """Return the snapshot stored for digest, or None"""
+        path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                snapshot = json.loads(zlib.decompress(f.read()).decode('utf-8'), object_hook=_decode)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Snapshot illeggibile: lo si scarta e si rilegge il file Excel
+            self._remove(path)
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get('format') != FORMAT_VERSION:
+            return None
+        # Aggiorna l'istante di accesso usato per l'eviction LRU
+        os.utime(path)
+        return snapshot
+
+    def store(self, digest, data):
+        """Save read_workbook-shaped data under digest and evict old snapshots"""
+        rows = data[GENERAZIONI_OFFERTE]
+        headers = list(max((row['data'] for row in rows), key=len)) if rows else []
+        snapshot = {
+            'format': FORMAT_VERSION,
+            DATI_GENERALI: data[DATI_GENERALI],
+            'field_values': data['field_values'],
+            # Tabella compatta: intestazioni una volta, poi solo tuple di valori
+            GENERAZIONI_OFFERTE: None if rows is None else {
+                'headers': headers,
+                'rows': [(row['row_idx'], tuple(row['data'].get(h) for h in headers)) for row in rows]
+            }
+        }
+        blob = zlib.compress(json.dumps(snapshot, default=_encode, ensure_ascii=False,
+                                        separators=(',', ':')).encode('utf-8'), 6)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp_path, self._path(digest))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used snapshots until the directory fits max_bytes"""
+        evict_directory(self.directory, self.max_bytes)
+
+    def _remove(self, path):
+        remove_file(path)
+
+
+def snapshot_rows(snapshot):
+    """Rebuild the row payloads of a snapshot's generazioni_offerte table"""
+    table = snapshot[GENERAZIONI_OFFERTE]
+    headers = table['headers']
+    return [{'type': 'row', 'row_idx': row_idx, 'data': dict(zip(headers, values))}
+            for row_idx, values in table['rows']]
+
+
+def stream_workbook_cached(path, cancelled=None, cache=None):
+    """stream_workbook backed by a SnapshotCache.
+
+    An unchanged workbook is served from its snapshot without opening it
+    with openpyxl; otherwise it is streamed as usual and, unless reading was
+    cancelled, the result is saved for the next time.
+    """
+    cache = cache if cache is not None else SnapshotCache()
+    cancelled = cancelled or (lambda: False)
+    with span('load_snapshot'):
+        digest = file_digest(path)
+        snapshot = cache.load(digest)
+    if snapshot is not None:
+        if snapshot[DATI_GENERALI] is not None:
+            yield DATI_GENERALI, (snapshot[DATI_GENERALI], snapshot['field_values'])
+        if snapshot[GENERAZIONI_OFFERTE] is not None:
+            rows = snapshot_rows(snapshot)
+            for start in range(0, max(len(rows), 1), CHUNK_SIZE):
+                if cancelled():
+                    return
+                yield GENERAZIONI_OFFERTE, rows[start:start + CHUNK_SIZE]
+        return
+
+    data = new_workbook_data()
+    for sheet_name, payload in stream_workbook(path, cancelled):
+        add_workbook_event(data, sheet_name, payload)
+        yield sheet_name, payload
+    if not cancelled():
+        try:
+            with span('save_snapshot'):
+                cache.store(digest, data)
+        except (OSError, TypeError, ValueError):
+            # La cache è solo un'ottimizzazione: un disco pieno o un valore non salvabile non blocca la lettura
+            pass
+
+
+def read_workbook_cached(path, cache=None):
+    """read_workbook going through the snapshot cache"""
+    data = new_workbook_data()
+    for sheet_name, payload in stream_workbook_cached(path, cache=cache):
+        add_workbook_event(data, sheet_name, payload)
+    return data
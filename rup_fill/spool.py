@@ -0,0 +1,397 @@
+"""Spool directory daemon: python -m rup_fill.spool --inbox DIR --templates template_doc/B_RDA
+
+Procedure workbooks dropped (or updated) in the inbox folder are picked up
+once their size and modification time have stayed the same for the
+debounce interval, so files still being copied are left alone. Stable
+workbooks go through a bounded queue to a few concurrent handlers that
+read them and render the configured templates on a shared pool of worker
+processes, each procedure into its own folder of the output directory.
+The workbook is then moved to done/ or failed/ with a JSON report beside
+it. Queue depth, documents and processing latency are kept in
+stato_spool.json in the output directory.
+"""
+import argparse
+import json
+import os
+import queue
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from .batch import WORKBOOK_PATTERNS, procedure_dirs, read_procedure
+from .failures import describe_failure, save_report
+from .manifest import Manifest
+from .parallel import default_workers, new_executor, render_jobs
+from .render import build_context, iter_jobs, today
+from .templates import TemplateCache
+from .workbook import DATI_GENERALI, GENERAZIONI_OFFERTE
+
+METRICS_NAME = 'stato_spool.json'
+# Latenze conservate per le statistiche (le più recenti)
+LATENCY_WINDOW = 200
+
+
+def _is_workbook(name):
+    # Ignora i file di lock di Excel (~$nome.xlsx)
+    return not name.startswith('~$') and name.lower().endswith(tuple(pattern[1:] for pattern in WORKBOOK_PATTERNS))
+
+
+def _move(path, directory):
+    """Move path into directory, replacing a file with the same name; returns the new path"""
+    os.makedirs(directory, exist_ok=True)
+    destination = os.path.join(directory, os.path.basename(path))
+    try:
+        os.replace(path, destination)
+    except OSError:
+        # Cartelle su dischi diversi
+        shutil.move(path, destination)
+    return destination
+
+
+class SpoolMetrics:
+    """Counters and latencies of the spool, safe to update from several threads"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.processed = 0
+        self.failed = 0
+        self.documents = 0
+        self.active = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.last = None
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            self.active += 1
+
+    def end(self, report):
+        with self._lock:
+            self.active -= 1
+            self.processed += 1
+            if report['status'] == 'failed':
+                self.failed += 1
+            self.documents += report['documents']
+            self.latencies.append(report['latency_seconds'])
+            self.last = {key: report[key] for key in ('workbook', 'status', 'documents', 'latency_seconds')}
+
+    def snapshot(self, queue_depth=0, waiting=0):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {
+                'updated': datetime.now().isoformat(timespec='seconds'),
+                'uptime_seconds': round(time.time() - self.started, 1),
+                'queue_depth': queue_depth,
+                'waiting': waiting,
+                'active': self.active,
+                'processed': self.processed,
+                'failed': self.failed,
+                'documents': self.documents,
+                'latency_seconds': {
+                    'last': self.last['latency_seconds'] if self.last else None,
+                    'mean': round(sum(latencies) / len(latencies), 3) if latencies else None,
+                    'p95': latencies[int(len(latencies) * 0.95)] if latencies else None,
+                    'max': latencies[-1] if latencies else None
+                },
+                'last': self.last
+            }
+
+
+class Spool:
+    """Watch an inbox folder and generate the documents of every workbook that lands in it"""
+
+    def __init__(self, inbox, templates, output_dir, sheet=GENERAZIONI_OFFERTE, done_dir=None, failed_dir=None,
+                 debounce=2.0, interval=1.0, parallel=2, workers=None, queue_size=8, incremental=True,
+                 max_cache_bytes=256 * 1024 * 1024):
+        self.inbox = inbox
+        self.templates = templates
+        self.output_dir = output_dir
+        self.sheet = sheet
+        self.done_dir = done_dir or os.path.join(inbox, 'done')
+        self.failed_dir = failed_dir or os.path.join(inbox, 'failed')
+        self.debounce = debounce
+        self.interval = interval
+        self.parallel = max(1, parallel)
+        self.workers = default_workers(workers)
+        self.incremental = incremental
+        self.max_cache_bytes = max_cache_bytes
+        self.metrics = SpoolMetrics()
+        self.metrics_path = os.path.join(output_dir, METRICS_NAME)
+        # Coda limitata: a coda piena i file restano nella cartella e vengono ripresi alla scansione successiva
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.stop = threading.Event()
+        # percorso -> (dimensione, mtime_ns, primo istante in cui è stato visto così)
+        self._seen = {}
+        # File in coda o in lavorazione, con l'istante in cui sono stati visti per la prima volta
+        self._claimed = {}
+        # File che non è stato possibile spostare: ignorati finché non cambiano
+        self._stuck = {}
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.cache = TemplateCache(max_cache_bytes)
+        self.executor = None
+
+    def scan(self, now=None):
+        """Workbooks of the inbox that have not changed for the debounce interval"""
+        now = time.monotonic() if now is None else now
+        try:
+            names = os.listdir(self.inbox)
+        except OSError:
+            return []
+        stable = []
+        present = set()
+        for name in sorted(names):
+            path = os.path.join(self.inbox, name)
+            if not _is_workbook(name):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if not os.path.isfile(path):
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            with self._lock:
+                if path in self._claimed:
+                    present.add(path)
+                    continue
+                if self._stuck.get(path) == signature:
+                    continue
+                self._stuck.pop(path, None)
+            present.add(path)
+            seen = self._seen.get(path)
+            if seen is None or seen[:2] != signature:
+                # Nuovo o ancora in scrittura: si riparte da adesso
+                self._seen[path] = signature + (now,)
+            elif now - seen[2] >= self.debounce:
+                # Anche un file rimasto vuoto viene preso in carico (e finisce in failed/)
+                stable.append(path)
+        for path in set(self._seen) - present:
+            del self._seen[path]
+        return stable
+
+    def enqueue(self, paths):
+        """Queue stable workbooks while there is room; returns how many were queued"""
+        queued = 0
+        for path in paths:
+            first_seen = self._seen[path][2]
+            # Prenotato prima di entrare in coda, così la scansione non lo accoda due volte
+            with self._lock:
+                self._claimed[path] = first_seen
+            try:
+                self.queue.put_nowait((path, self._seen[path][:2], first_seen))
+            except queue.Full:
+                with self._lock:
+                    self._claimed.pop(path, None)
+                break
+            queued += 1
+        return queued
+
+    def process(self, path, signature, first_seen):
+        """Generate the documents of one workbook and move it to done/ or failed/"""
+        started = time.perf_counter()
+        report = {
+            'workbook': os.path.basename(path),
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'sheet': self.sheet,
+            'output_dir': None,
+            'documents': 0,
+            'rebuilt': 0,
+            'skipped': 0,
+            'failures': [],
+            'error': None
+        }
+        try:
+            if not signature[0]:
+                raise ValueError("file vuoto")
+            data, error = self.executor.submit(read_procedure, path).result()
+            if error is None and data[self.sheet] is None:
+                error = f"Nessun dato disponibile dal foglio {self.sheet}"
+            if error is not None:
+                raise ValueError(error)
+
+            output_dir = procedure_dirs([path], self.output_dir)[path]
+            os.makedirs(output_dir, exist_ok=True)
+            report['output_dir'] = os.path.abspath(output_dir)
+            current_date = today()
+            context = build_context(data['field_values'], data[DATI_GENERALI], current_date)
+            rows = data[GENERAZIONI_OFFERTE] if self.sheet == GENERAZIONI_OFFERTE else None
+            jobs = iter_jobs(self.sheet, context, self.templates, output_dir, current_date, rows)
+            manifest = Manifest(output_dir) if self.incremental else None
+            for job, error in render_jobs(jobs, self.workers, self.max_cache_bytes, self.cache, manifest=manifest,
+                                          executor=self.executor):
+                if error is None:
+                    report['documents'] += 1
+                else:
+                    report['failures'].append(describe_failure(job, error, self.cache))
+            report['rebuilt'] = manifest.rebuilt if manifest is not None else report['documents']
+            report['skipped'] = manifest.skipped if manifest is not None else 0
+        except Exception as e:
+            report['error'] = str(e)
+
+        failed = report['error'] is not None or bool(report['failures'])
+        report['status'] = 'failed' if failed else 'done'
+        report['render_seconds'] = round(time.perf_counter() - started, 3)
+        # Dall'arrivo del file (prima volta visto) alla fine della generazione
+        report['latency_seconds'] = round(time.monotonic() - first_seen, 3)
+        try:
+            stat = os.stat(path)
+            changed = (stat.st_size, stat.st_mtime_ns) != signature
+        except OSError:
+            changed = False
+        if changed:
+            # Aggiornato durante la generazione: resta nella cartella e verrà rielaborato
+            report['status'] = 'requeued'
+        else:
+            try:
+                moved = _move(path, self.failed_dir if failed else self.done_dir)
+                if report['failures']:
+                    # Rapporto nella cartella dei documenti, da usare con python -m rup_fill --retry-failed
+                    report['failure_report'] = save_report(report['output_dir'], report['failures'], moved,
+                                                           self.sheet, self.templates)
+                self._write_json(os.path.splitext(moved)[0] + '.json', report)
+            except OSError as e:
+                report['error'] = report['error'] or f"spostamento non riuscito: {e}"
+                with self._lock:
+                    self._stuck[path] = signature
+        return report
+
+    def _handler(self):
+        while not self.stop.is_set():
+            try:
+                path, signature, first_seen = self.queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            self.metrics.begin()
+            try:
+                report = self.process(path, signature, first_seen)
+            finally:
+                with self._lock:
+                    self._claimed.pop(path, None)
+                self.queue.task_done()
+            self.metrics.end(report)
+            self._log(report)
+            self.save_metrics()
+
+    def _log(self, report):
+        message = (f"{report['workbook']}: {report['status']} - {report['documents']} documenti "
+                   f"({report['skipped']} invariati), {len(report['failures'])} errori, "
+                   f"latenza {report['latency_seconds']:.1f} s")
+        if report['error']:
+            message += f" - {report['error']}"
+        print(message, file=sys.stderr)
+
+    def _write_json(self, path, payload):
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def status(self):
+        with self._lock:
+            waiting = len(set(self._seen) - set(self._claimed))
+        return self.metrics.snapshot(self.queue.qsize(), waiting)
+
+    def save_metrics(self):
+        with self._metrics_lock:
+            try:
+                self._write_json(self.metrics_path, self.status())
+            except OSError:
+                pass
+
+    def run(self, once=False):
+        """Watch the inbox until stop is set (or, with once, until it has been emptied)"""
+        os.makedirs(self.inbox, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.executor = new_executor(self.workers, self.max_cache_bytes, preload=self.templates)
+        handlers = [threading.Thread(target=self._handler, name=f'rup_fill-spool-{index}', daemon=True)
+                    for index in range(self.parallel)]
+        for handler in handlers:
+            handler.start()
+        try:
+            while not self.stop.is_set():
+                self.enqueue(self.scan())
+                self.save_metrics()
+                if once and not self._seen and self.queue.empty():
+                    with self._lock:
+                        if not self._claimed:
+                            break
+                self.stop.wait(self.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop.set()
+            for handler in handlers:
+                handler.join()
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.save_metrics()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m rup_fill.spool',
+        description="Genera i documenti dei file Excel delle procedure depositati in una cartella.")
+    parser.add_argument('--inbox', required=True, help="cartella sorvegliata in cui depositare i file Excel")
+    parser.add_argument('--templates', required=True, nargs='+',
+                        help="template .docx o cartelle di template della fase (es. template_doc/B_RDA)")
+    parser.add_argument('--out', default='doc_generati',
+                        help="cartella di output, con una sottocartella per procedura (default: %(default)s)")
+    parser.add_argument('--sheet', default=GENERAZIONI_OFFERTE, choices=[GENERAZIONI_OFFERTE, DATI_GENERALI],
+                        help="foglio sorgente (default: %(default)s)")
+    parser.add_argument('--done', default=None, help="cartella dei file elaborati (default: INBOX/done)")
+    parser.add_argument('--failed', default=None,
+                        help="cartella dei file con errori (default: INBOX/failed)")
+    parser.add_argument('--debounce', type=float, default=2.0,
+                        help="secondi senza modifiche prima di considerare completa la copia di un file "
+                             "(default: %(default)s)")
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help="intervallo fra due scansioni della cartella in secondi (default: %(default)s)")
+    parser.add_argument('--parallel', type=int, default=2,
+                        help="file Excel elaborati contemporaneamente (default: %(default)s)")
+    parser.add_argument('--queue-size', type=int, default=8,
+                        help="file pronti in attesa di elaborazione; oltre restano nella cartella "
+                             "(default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="processi di rendering condivisi (default: uno per CPU)")
+    parser.add_argument('--force', action='store_true',
+                        help="rigenera tutti i documenti anche se il manifest li indica come aggiornati")
+    parser.add_argument('--once', action='store_true',
+                        help="elabora i file presenti e termina invece di restare in ascolto")
+    return parser
+
+
+def main(argv=None):
+    # Import locale come in rup_fill.service: rup_fill.cli importa il client del servizio
+    from .cli import collect_templates
+
+    args = build_parser().parse_args(argv)
+    templates = [os.path.abspath(path) for path in collect_templates(args.templates)]
+    if not templates:
+        print("Nessun template Word trovato.", file=sys.stderr)
+        return 2
+    spool = Spool(args.inbox, templates, args.out, args.sheet, args.done, args.failed, args.debounce,
+                  args.interval, args.parallel, args.workers, args.queue_size, incremental=not args.force)
+    # Arresto ordinato anche quando il servizio viene fermato dal sistema: i file in corso vengono completati
+    signal.signal(signal.SIGTERM, lambda signum, frame: spool.stop.set())
+    print(f"In attesa di file Excel in {os.path.abspath(args.inbox)} "
+          f"(stato in {os.path.abspath(spool.metrics_path)})", file=sys.stderr)
+    spool.run(once=args.once)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Compact columnar storage for the generazioni_offerte table"""
+import sys
+from array import array
+
+
+class RowRecord:
+    """Lightweight view of one stored row.
+
+    Behaves like the row payloads returned by read_workbook
+    ({'type': 'row', 'row_idx': ..., 'data': {...}}), but the values stay in
+    the store columns until they are asked for.
+    """
+
+    __slots__ = ('store', 'pos')
+
+    def __init__(self, store, pos):
+        self.store = store
+        self.pos = pos
+
+    @property
+    def row_idx(self):
+        return self.store.row_idx(self.pos)
+
+    @property
+    def data(self):
+        return self.store.data(self.pos)
+
+    def __getitem__(self, key):
+        if key == 'type':
+            return 'row'
+        if key == 'row_idx':
+            return self.row_idx
+        if key == 'data':
+            return self.data
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class RowStore:
+    """Rows kept as one array per column, with repeated strings interned"""
+
+    def __init__(self, headers=None):
+        self.headers = list(headers or [])
+        self._columns = [[] for _ in self.headers]
+        self._row_idx = array('l')
+
+    def __len__(self):
+        return len(self._row_idx)
+
+    def __getitem__(self, pos):
+        if not -len(self) <= pos < len(self):
+            raise IndexError(pos)
+        return RowRecord(self, pos % len(self))
+
+    def __iter__(self):
+        for pos in range(len(self)):
+            yield RowRecord(self, pos)
+
+    def append(self, row):
+        """Store a row payload as produced by iter_generazioni_offerte"""
+        data = row['data']
+        if not self.headers and not self._row_idx:
+            self.headers = list(data)
+            self._columns = [[] for _ in self.headers]
+        for header, column in zip(self.headers, self._columns):
+            value = data.get(header)
+            column.append(sys.intern(value) if type(value) is str else value)
+        self._row_idx.append(row['row_idx'])
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def set_row(self, pos, row):
+        """Replace the values stored at pos with a new row payload"""
+        data = row['data']
+        for header, column in zip(self.headers, self._columns):
+            value = data.get(header)
+            column[pos] = sys.intern(value) if type(value) is str else value
+        self._row_idx[pos] = row['row_idx']
+
+    def truncate(self, length):
+        """Drop every row from position length onwards"""
+        for column in self._columns:
+            del column[length:]
+        del self._row_idx[length:]
+
+    def matches(self, pos, row):
+        """True if the row stored at pos holds exactly the given row payload"""
+        return self._row_idx[pos] == row['row_idx'] and self.data(pos) == row['data']
+
+    def row_idx(self, pos):
+        return self._row_idx[pos]
+
+    def data(self, pos):
+        """Row values as a {header: value} dict, built on demand"""
+        return {header: column[pos] for header, column in zip(self.headers, self._columns)}
+
+    def display_text(self, pos):
+        """Text shown for the row in the generazioni_offerte list"""
+        return f" {', '.join(f' {column[pos]}' for column in self._columns if column[pos])}"
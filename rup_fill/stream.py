@@ -0,0 +1,240 @@
+"""Bounded-memory generation for very large generazioni_offerte selections.
+
+Rows flow through the pipeline chunk by chunk: a chunk is read from the
+workbook (streamed with openpyxl, not via a snapshot), its documents are
+rendered and saved, each outcome is appended to a JSON-lines log and the
+chunk is released before the next one is read. Nothing grows with the row
+count, so peak memory is set by the chunk size, the template cache and the
+documents in flight.
+
+A MemoryGuard checks memory after every chunk against a ceiling: above it
+caches are emptied and chunks are split in smaller batches, and if memory
+is still above the ceiling with single-row batches generation stops with
+MemoryLimitExceeded. The guard measures the generating process only, not
+the worker processes of the render pool, whose memory is bounded by the
+template cache of each worker and the documents in flight. With
+tracemalloc the log also records the traced memory after every chunk,
+which shows whether it stays flat.
+"""
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+
+from .render import build_context, iter_jobs
+from .workbook import DATI_GENERALI, GENERAZIONI_OFFERTE, stream_workbook
+
+DEFAULT_CHUNK_ROWS = 200
+# Siti di allocazione riportati nel riepilogo tracemalloc
+TOP_ALLOCATIONS = 10
+
+
+class MemoryLimitExceeded(Exception):
+    """Memory stayed above the ceiling even with single-row batches"""
+
+
+def process_memory():
+    """Resident memory of this process in bytes, or None where it cannot be read"""
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        try:
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+        except (AttributeError, OSError):
+            pass
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+
+        # Picco, non memoria corrente: in mancanza d'altro è una stima prudente (KB su Linux, byte su macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+class MemoryGuard:
+    """Ceiling on the memory of the generating process (traced memory when tracemalloc is on).
+
+    Worker processes of the render pool are not included.
+    """
+
+    def __init__(self, limit_bytes=None):
+        self.limit_bytes = limit_bytes
+        self.peak = 0
+
+    def usage(self):
+        if tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[0]
+        return process_memory()
+
+    def over(self):
+        usage = self.usage()
+        if usage is not None:
+            self.peak = max(self.peak, usage)
+        return self.limit_bytes is not None and usage is not None and usage > self.limit_bytes
+
+
+class GenerationLog:
+    """JSON-lines log written as documents are generated, instead of lists kept in memory.
+
+    The file is appended to, so every event carries the id of its run and
+    each run starts with a 'start' event.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self.run = uuid.uuid4().hex
+        self.rows = 0
+        self.documents = 0
+        self.failed = 0
+        self.write('start', pid=os.getpid(), time=round(time.time(), 3))
+
+    def write(self, event, **fields):
+        fields['event'] = event
+        fields['run'] = self.run
+        self._file.write(json.dumps(fields, ensure_ascii=False, default=str) + '\n')
+
+    def document(self, row_idx, template_path, output_path, error):
+        if error is None:
+            self.documents += 1
+        else:
+            self.failed += 1
+        self.write('document', row_idx=row_idx, template=template_path, output_path=output_path, error=error)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def _batches(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def stream_generate(workbook_path, template_paths, output_dir, current_date, log, render, selected=None,
+                    chunk_rows=DEFAULT_CHUNK_ROWS, guard=None, relieve=None, on_failure=None):
+    """Generate the generazioni_offerte documents of workbook_path chunk by chunk.
+
+    render(jobs) renders a list of jobs and yields (job, error), e.g. a
+    partial application of parallel.render_jobs; relieve() frees what the
+    caller can (template caches) when the guard reports memory above the
+    ceiling. selected(excel_row) filters rows. Every outcome goes to log,
+    whose rows attribute follows the rows processed, and on_failure(job,
+    error) is also called for the documents that failed; returns the
+    number of rows.
+    """
+    guard = guard or MemoryGuard()
+    relieve = relieve or (lambda: None)
+    batch_size = chunk_rows
+    context = build_context({}, [], current_date)
+    rows_done = 0
+    chunks = 0
+    for sheet_name, payload in stream_workbook(workbook_path, first_chunk=chunk_rows, chunk_size=chunk_rows):
+        if sheet_name == DATI_GENERALI:
+            dati_generali, field_values = payload
+            context = build_context(field_values, dati_generali, current_date)
+            continue
+        if selected is not None:
+            # row_idx conta le righe dati: la riga Excel è row_idx + 1
+            payload = [row for row in payload if selected(row['row_idx'] + 1)]
+        for rows in _batches(payload, batch_size):
+            jobs = list(iter_jobs(GENERAZIONI_OFFERTE, context, template_paths, output_dir, current_date, rows))
+            for job, error in render(jobs):
+                row_idx, template_path, job_context, output_path = job
+                log.document(row_idx, template_path, output_path, error)
+                if error is not None and on_failure is not None:
+                    on_failure(job, error)
+            rows_done += len(rows)
+            log.rows = rows_done
+            del jobs, rows
+        del payload
+        chunks += 1
+
+        if guard.over():
+            gc.collect()
+            relieve()
+            if guard.over():
+                if batch_size == 1:
+                    raise MemoryLimitExceeded(
+                        f"memoria oltre il limite di {guard.limit_bytes // (1024 * 1024)} MB "
+                        f"anche elaborando una riga alla volta")
+                # Meno documenti in volo per batch: contesti e risultati occupano meno memoria
+                batch_size = max(1, batch_size // 2)
+        log.write('chunk', chunk=chunks, rows=rows_done, documents=log.documents, failed=log.failed,
+                  batch_rows=batch_size, memory_bytes=guard.usage(),
+                  traced_bytes=tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+                  time=round(time.time(), 3))
+        log.flush()
+    return rows_done
+
+
+def tracemalloc_report(snapshot, limit=TOP_ALLOCATIONS):
+    """Top allocation sites of a tracemalloc snapshot as [{site, size_bytes, count}]"""
+    report = []
+    for stat in snapshot.statistics('lineno')[:limit]:
+        frame = stat.traceback[0]
+        report.append({'site': f"{frame.filename}:{frame.lineno}", 'size_bytes': stat.size, 'count': stat.count})
+    return report
+
+
+def memory_trend(log_path, run=None):
+    """Traced (or process) memory after each chunk of a run read back from a log: first, last, max and growth.
+
+    run is the id of GenerationLog.run; by default the last run of the log.
+    """
+    samples = []
+    with open(log_path, encoding='utf-8') as f:
+        for line in f:
+            event = json.loads(line)
+            if run is None and event.get('event') == 'start':
+                # Il log è aperto in aggiunta: conta solo l'ultima esecuzione
+                samples = []
+            elif event.get('event') == 'chunk' and (run is None or event.get('run') == run):
+                value = event.get('traced_bytes') or event.get('memory_bytes')
+                if value is not None:
+                    samples.append(value)
+    if not samples:
+        return None
+    # Il primo blocco comprende il riscaldamento (import, template): la crescita si misura dal secondo
+    baseline = samples[1] if len(samples) > 1 else samples[0]
+    return {
+        'chunks': len(samples),
+        'first_bytes': samples[0],
+        'last_bytes': samples[-1],
+        'max_bytes': max(samples),
+        'growth_bytes': samples[-1] - baseline
+    }
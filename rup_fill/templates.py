@@ -0,0 +1,295 @@
+"""In-memory cache of parsed and pre-processed .docx templates.
+
+docxtpl, jinja2 and python-docx are only imported (through rup_fill.engine)
+when a template is first parsed or rendered, keeping them out of the GUI
+start-up.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from .images import is_image_field
+from .package import DEFAULT_COMPRESSLEVEL, SourceArchive
+from .timing import span
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Proprietà del documento che docxtpl rende anch'esse come template jinja
+CORE_PROPERTIES = ['author', 'category', 'comments', 'content_status', 'identifier', 'keywords',
+                   'language', 'last_modified_by', 'subject', 'title', 'version']
+
+
+class CompiledTemplate:
+    """A template file held in memory together with its pre-processed XML and jinja code.
+
+    One instance can be shared by several threads (GUI workers, spool
+    handlers, service requests): the lazily built state, the render counter
+    and the additions to patched (through patch) are guarded by a lock, so
+    that nbytes never iterates a dict another thread is filling. The
+    compiled jinja templates are a plain dict cache where a duplicate
+    computation is harmless.
+    """
+
+    def __init__(self, path, data, digest, mtime_ns):
+        self.path = path
+        self.data = data
+        self.digest = digest
+        self.mtime_ns = mtime_ns
+        # Sorgente XML letto dal docx -> XML con i tag jinja già "ripuliti" da patch_xml
+        self.patched = {}
+        self._patched_bytes = 0
+        self._jinja_env = None
+        self.renders = 0
+        self._variables = None
+        self._image_fields = None
+        self._archive = None
+        # None: non ancora valutato, False: serve docxtpl, altrimenti FastTemplate
+        self._fast = None
+        # Rientrante: variables e fast_template usano jinja_env
+        self._lock = threading.RLock()
+
+    @property
+    def nbytes(self):
+        """Rough memory footprint: archive bytes plus patched XML and its compiled code"""
+        fast = self._fast.nbytes if self._fast else 0
+        return len(self.data) + fast + 3 * self._patched_bytes
+
+    def patch(self, src_xml, patch_xml):
+        """Patched form of src_xml, computed once with patch_xml and shared by every render"""
+        patched = self.patched.get(src_xml)
+        if patched is None:
+            patched = patch_xml(src_xml)
+            with self._lock:
+                if src_xml not in self.patched:
+                    self.patched[src_xml] = patched
+                    self._patched_bytes += len(src_xml) + len(patched)
+        return patched
+
+    @property
+    def jinja_env(self):
+        """CachingEnvironment shared by every render of this template"""
+        if self._jinja_env is None:
+            from .engine import CachingEnvironment
+            with self._lock:
+                if self._jinja_env is None:
+                    self._jinja_env = CachingEnvironment()
+        return self._jinja_env
+
+    @property
+    def variables(self):
+        """Names of the context variables the template references, computed once"""
+        if self._variables is None:
+            from .engine import template_variables
+            with self._lock:
+                if self._variables is None:
+                    self._variables = template_variables(self)
+        return self._variables
+
+    @property
+    def image_fields(self):
+        """Variables of the template that hold an image path (firma_*, img_documento_*)"""
+        if self._image_fields is None:
+            self._image_fields = frozenset(name for name in self.variables if is_image_field(name))
+        return self._image_fields
+
+    def images_in(self, context):
+        """Image fields of the template given a path in context"""
+        return [name for name in self.image_fields
+                if isinstance(context.get(name), str) and context[name].strip()]
+
+    @property
+    def archive(self):
+        """SourceArchive used to pass unchanged members through on save"""
+        if self._archive is None:
+            with self._lock:
+                if self._archive is None:
+                    self._archive = SourceArchive(self.data)
+        return self._archive
+
+    def project(self, context):
+        """Subset of context holding only the variables this template uses"""
+        return {name: context[name] for name in self.variables if name in context}
+
+    def fast_template(self):
+        """FastTemplate for plain-substitution templates, built from the second render on"""
+        if self._fast is None:
+            if not self.renders:
+                # Un documento singolo non ripaga la precompilazione
+                return None
+            from .fastpath import compile_fast
+            with self._lock:
+                if self._fast is None:
+                    try:
+                        with span('compile_fast'):
+                            self._fast = compile_fast(self) or False
+                    except Exception:
+                        self._fast = False
+        return self._fast or None
+
+    def render(self, context, output_path, fast_path=True, compresslevel=DEFAULT_COMPRESSLEVEL):
+        """Render context into output_path, through the fast path when possible.
+
+        With a compresslevel, members left unchanged by the render are copied
+        from the template archive and the others are deflated at that level;
+        None saves through python-docx as docxtpl does. Image fields holding a
+        file path are embedded through the process-wide ImageCache.
+        """
+        source = self.archive if compresslevel is not None else None
+        images = self.images_in(context)
+        # Le immagini passano da InlineImage di docxtpl
+        fast = self.fast_template() if fast_path and not images else None
+        if fast is None or not fast.render(context, output_path, source, compresslevel):
+            doc = self.new_document(compresslevel)
+            if images:
+                from .engine import inline_images
+                context = inline_images(doc, context, images)
+            with span('render', 'docxtpl'):
+                doc.render(context)
+            with span('save', 'docxtpl'):
+                doc.save(output_path)
+        with self._lock:
+            self.renders += 1
+        return output_path
+
+    def new_document(self, compresslevel=None):
+        """Fresh DocxTemplate for a single render, sharing the pre-processed state"""
+        from .engine import CachedDocxTemplate
+        return CachedDocxTemplate(self, compresslevel)
+
+
+class TemplateCache:
+    """LRU cache of CompiledTemplate keyed by content hash, validated by path mtime.
+
+    A template is re-read when its mtime or size changes on disk, and only
+    re-parsed when its content hash differs too. Paths whose files have the
+    same content (the same template copied into several phase folders)
+    share one CompiledTemplate. Least recently used paths are evicted once
+    the estimated footprint exceeds max_bytes. With fast_path, templates
+    made only of {{ variable }} substitutions are rendered by
+    rup_fill.fastpath instead of the full docxtpl pipeline. compresslevel
+    applies to the members changed by the render; the others are copied
+    compressed from the template (None: plain python-docx save).
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, fast_path=True, compresslevel=DEFAULT_COMPRESSLEVEL):
+        self.max_bytes = max_bytes
+        self.fast_path = fast_path
+        self.compresslevel = compresslevel
+        # percorso -> (mtime_ns, dimensione, digest), in ordine di utilizzo
+        self._paths = OrderedDict()
+        # digest -> CompiledTemplate
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def get(self, path):
+        """Return the CompiledTemplate for path, loading or refreshing it if needed"""
+        with span('load_template'):
+            return self._get(path)
+
+    def _get(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            known = self._paths.get(path)
+            if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+                entry = self._entries.get(known[2])
+                if entry is not None:
+                    self._paths.move_to_end(path)
+                    self.hits += 1
+                    return entry
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                # Contenuto già in cache: file toccato, oppure copia identica in un'altra cartella
+                self.hits += 1
+                if known is None or known[2] != digest:
+                    self.shared += 1
+            else:
+                entry = CompiledTemplate(path, data, digest, stat.st_mtime_ns)
+                self._entries[digest] = entry
+                self.misses += 1
+            self._paths[path] = (stat.st_mtime_ns, stat.st_size, digest)
+            self._paths.move_to_end(path)
+            self._evict(keep=digest)
+            return entry
+
+    def template(self, path):
+        """Fresh DocxTemplate for path, ready to be rendered once"""
+        return self.get(path).new_document()
+
+    def render(self, path, context, output_path):
+        """Render path with context into output_path using the cached template"""
+        entry = self.get(path)
+        entry.render(context, output_path, self.fast_path, self.compresslevel)
+        with self._lock:
+            # Il primo render riempie patched/compiled: ricontrolla il budget
+            self._evict(keep=entry.digest)
+        return output_path
+
+    def invalidate(self, path=None):
+        """Drop one template path (or every template) from the cache"""
+        with self._lock:
+            if path is None:
+                self._paths.clear()
+                self._entries.clear()
+            else:
+                self._paths.pop(os.path.abspath(path), None)
+                self._evict()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'paths': len(self._paths),
+            'bytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'shared': self.shared,
+            'evictions': self.evictions
+        }
+
+    def _evict(self, keep=None):
+        # Contenuti non più raggiungibili da nessun percorso (file modificati o rimossi)
+        referenced = {digest for _, _, digest in self._paths.values()}
+        for digest in list(self._entries):
+            if digest not in referenced and digest != keep:
+                del self._entries[digest]
+        total = self.nbytes
+        for path in list(self._paths):
+            if total <= self.max_bytes:
+                break
+            digest = self._paths[path][2]
+            if digest == keep:
+                continue
+            del self._paths[path]
+            if digest in self._entries and all(d != digest for _, _, d in self._paths.values()):
+                total -= self._entries.pop(digest).nbytes
+                self.evictions += 1
+
+
+_default_cache = None
+
+
+def default_cache():
+    """Process-wide TemplateCache shared by GUI runs and CLI batches"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = TemplateCache()
+    return _default_cache
@@ -0,0 +1,163 @@
+"""Named timing spans for the loading and generation hot paths.
+
+Spans are recorded only while a Timings collector is active in the current
+thread (see collect()); otherwise span() hands back a shared no-op context
+manager and record() returns at once, so instrumented code pays one
+thread-local lookup per span.
+"""
+import csv
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+_local = threading.local()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('timings', 'name', 'detail', 'started')
+
+    def __init__(self, timings, name, detail):
+        self.timings = timings
+        self.name = name
+        self.detail = detail
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.add(self.name, time.perf_counter() - self.started, self.detail)
+        return False
+
+
+class Timings:
+    """Collector of (span, seconds, detail) records for one run"""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, detail=''):
+        with self._lock:
+            self.records.append((name, seconds, detail))
+
+    def extend(self, records):
+        with self._lock:
+            self.records.extend(records)
+
+    def span(self, name, detail=''):
+        return _Span(self, name, detail)
+
+    def summary(self):
+        """{span: {count, total, mean, max}} in order of first appearance"""
+        result = {}
+        for name, seconds, detail in self.records:
+            stats = result.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+        for stats in result.values():
+            stats['mean'] = stats['total'] / stats['count']
+        return result
+
+    def summary_text(self):
+        """Human readable summary, one line per span"""
+        lines = []
+        for name, stats in self.summary().items():
+            lines.append(f"{name}: {stats['count']} × {stats['mean'] * 1000:.1f} ms "
+                         f"(totale {stats['total']:.3f} s, max {stats['max'] * 1000:.1f} ms)")
+        return "\n".join(lines)
+
+    def to_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'summary': self.summary(),
+                'records': [{'span': name, 'seconds': seconds, 'detail': detail}
+                            for name, seconds, detail in self.records]
+            }, f, indent=2, ensure_ascii=False)
+
+    def to_csv(self, path):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['span', 'seconds', 'detail'])
+            writer.writerows(self.records)
+
+
+def active():
+    """Timings collecting in the current thread, or None"""
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def collect(timings=None):
+    """Record spans of the current thread into timings (a new Timings if omitted)"""
+    previous = active()
+    _local.timings = timings = timings if timings is not None else Timings()
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+def span(name, detail=''):
+    """Context manager timing a block as name; free when nothing is collecting"""
+    timings = getattr(_local, 'timings', None)
+    if timings is None:
+        return _NULL_SPAN
+    return _Span(timings, name, detail)
+
+
+def record(name, seconds, detail=''):
+    """Add an already measured duration to the active collector, if any"""
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings.add(name, seconds, detail)
+
+
+def export(timings, directory, prefix='tempi'):
+    """Write timings to a timestamped JSON and CSV pair in directory, returning both paths"""
+    stem = os.path.join(directory, f"{prefix}_{datetime.now():%Y%m%d_%H%M%S}")
+    timings.to_json(stem + '.json')
+    timings.to_csv(stem + '.csv')
+    return [stem + '.json', stem + '.csv']
+
+
+def profile_summary(profiler, limit=15):
+    """Top functions of a cProfile.Profile by cumulative time, as text"""
+    import pstats
+
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
+
+
+@contextmanager
+def profiled(path=None):
+    """Run a block under cProfile (current thread only), dumping the stats to path if given"""
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
@@ -0,0 +1,25 @@
+"""Background import of the heavy libraries once the GUI is up"""
+import importlib
+import os
+import threading
+
+# openpyxl per la lettura, docxtpl (jinja2, lxml, python-docx) per la generazione
+HEAVY_MODULES = ['openpyxl', 'rup_fill.engine', 'rup_fill.fastpath']
+
+
+def warm_imports(modules=HEAVY_MODULES):
+    """Import modules, ignoring the ones that are not installed"""
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+def start_warmup(modules=HEAVY_MODULES):
+    """Import modules in a daemon thread, unless RUP_FILL_NO_WARMUP is set"""
+    if os.environ.get('RUP_FILL_NO_WARMUP'):
+        return None
+    thread = threading.Thread(target=warm_imports, args=(modules,), name='rup_fill-warmup', daemon=True)
+    thread.start()
+    return thread
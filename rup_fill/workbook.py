@@ -0,0 +1,162 @@
+"""Read the dati_generali_procedura and generazioni_offerte sheets without Qt.
+
+openpyxl is imported on the first read rather than with the module. Dates,
+amounts and codes are normalized by rup_fill.normalize: cell by cell for
+dati_generali_procedura, a whole chunk of columns at a time for
+generazioni_offerte.
+"""
+import time
+
+from .fields import FIELD_INDEX
+from .normalize import ColumnNormalizer, normalize_value
+from .timing import record, span
+
+DATI_GENERALI = 'dati_generali_procedura'
+GENERAZIONI_OFFERTE = 'generazioni_offerte'
+
+
+def read_dati_generali(sheet, index=FIELD_INDEX):
+    """Read values (C, named in E) and flags (D) from dati_generali_procedura.
+
+    Returns the list of entries shown in the "Dati Procedura" list and the
+    values used to auto-fill the document form. Columns C-E are read in a
+    single pass; flags are listed after the values as before.
+    """
+    entries = []
+    flags = []
+    field_values = {}
+
+    for row_idx, (value, flag, name) in enumerate(
+            sheet.iter_rows(min_row=2, min_col=3, max_col=5, values_only=True), start=2):
+        if flag is not None and str(flag).strip():
+            flags.append({
+                'type': 'flag',
+                'coord': f"D{row_idx}",
+                'name': f"flag_{row_idx}",
+                'value': flag
+            })
+
+        if value is None or not str(value).strip() or name is None or not str(name).strip():
+            continue
+
+        name = str(name)
+        field_name = index.classify(name)[0]
+        # Date, importi e codici nel formato dei documenti
+        kind, width = index.kind(name)
+        value = normalize_value(kind, value, width)
+
+        # Check if this value matches one of our fields
+        if field_name is not None:
+            field_values[field_name] = str(value) if value else ""
+
+        entries.append({
+            'type': 'value',
+            'coord': f"C{row_idx}",
+            'name': name,
+            'value': value
+        })
+
+    return entries + flags, field_values
+
+
+def iter_generazioni_offerte(sheet):
+    """Yield generazioni_offerte rows one by one (first row = column names).
+
+    Values are yielded as stored in the sheet; ColumnNormalizer formats the
+    date, amount and code columns.
+    """
+    from openpyxl.utils import get_column_letter
+
+    # Read first row as column names
+    headers = []
+    for col_idx, value in enumerate(next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ()), start=1):
+        header_name = str(value) if value else f"col_{get_column_letter(col_idx)}"
+        headers.append(header_name)
+
+    # Read data for each subsequent row
+    for row_idx, values in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
+        yield {
+            'type': 'row',
+            'row_idx': row_idx - 1,
+            'data': dict(zip(headers, values))
+        }
+
+
+def read_generazioni_offerte(sheet, index=FIELD_INDEX):
+    """Read generazioni_offerte as a normalized table (first row = column names)"""
+    return ColumnNormalizer(index).normalize_rows(list(iter_generazioni_offerte(sheet)))
+
+
+def stream_workbook(path, cancelled=None, first_chunk=50, chunk_size=500, index=FIELD_INDEX):
+    """Read the workbook incrementally, yielding (sheet_name, payload) events.
+
+    dati_generali_procedura is reported once as (entries, field_values);
+    generazioni_offerte rows follow in chunks, the first one kept small so
+    that callers can show something immediately. An empty first chunk is
+    still yielded when the sheet exists but has no rows. Reading stops as
+    soon as the optional cancelled callable returns True.
+    """
+    import openpyxl
+
+    cancelled = cancelled or (lambda: False)
+    with span('load_workbook'):
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        if DATI_GENERALI in workbook.sheetnames:
+            with span('parse_sheet', DATI_GENERALI):
+                payload = read_dati_generali(workbook[DATI_GENERALI], index)
+            yield DATI_GENERALI, payload
+        if GENERAZIONI_OFFERTE in workbook.sheetnames and not cancelled():
+            normalizer = ColumnNormalizer(index)
+            chunk = []
+            limit = first_chunk
+            started = False
+            # Il tempo di lettura si misura per blocco, escludendo chi consuma gli eventi
+            chunk_started = time.perf_counter()
+            for row in iter_generazioni_offerte(workbook[GENERAZIONI_OFFERTE]):
+                if cancelled():
+                    return
+                chunk.append(row)
+                if len(chunk) >= limit:
+                    record('parse_sheet', time.perf_counter() - chunk_started, GENERAZIONI_OFFERTE)
+                    with span('normalize', GENERAZIONI_OFFERTE):
+                        normalizer.normalize_rows(chunk)
+                    yield GENERAZIONI_OFFERTE, chunk
+                    chunk = []
+                    limit = chunk_size
+                    started = True
+                    chunk_started = time.perf_counter()
+            if chunk or not started:
+                record('parse_sheet', time.perf_counter() - chunk_started, GENERAZIONI_OFFERTE)
+                with span('normalize', GENERAZIONI_OFFERTE):
+                    normalizer.normalize_rows(chunk)
+                yield GENERAZIONI_OFFERTE, chunk
+    finally:
+        workbook.close()
+
+
+def new_workbook_data():
+    """Empty result of read_workbook; a missing sheet stays None"""
+    return {
+        DATI_GENERALI: None,
+        'field_values': {},
+        GENERAZIONI_OFFERTE: None
+    }
+
+
+def add_workbook_event(data, sheet_name, payload):
+    """Accumulate one stream_workbook event into read_workbook-shaped data"""
+    if sheet_name == DATI_GENERALI:
+        data[DATI_GENERALI], data['field_values'] = payload
+    else:
+        if data[GENERAZIONI_OFFERTE] is None:
+            data[GENERAZIONI_OFFERTE] = []
+        data[GENERAZIONI_OFFERTE].extend(payload)
+
+
+def read_workbook(path):
+    """Read both procedure sheets; a missing sheet is reported as None"""
+    data = new_workbook_data()
+    for sheet_name, payload in stream_workbook(path):
+        add_workbook_event(data, sheet_name, payload)
+    return data
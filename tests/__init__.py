@@ -0,0 +1,45 @@
+"""Behaviour checks against the shipped template.xlsx and template_doc files.
+
+Run from the repository root with python -m unittest (or pytest).
+"""
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_DIR = os.path.join(REPO_ROOT, 'template_doc')
+# Template con solo sostituzioni semplici e con un'immagine (firma_direttore)
+SIMPLE_TEMPLATE = os.path.join(TEMPLATE_DIR, 'B_RDA', 'AD_infra_40k_RDA.docx')
+IMAGE_TEMPLATE = os.path.join(TEMPLATE_DIR, 'B_RDA', 'AD_infra_40k_ConflittoDIR.docx')
+
+
+def shipped_templates():
+    """Every .docx of template_doc, sorted"""
+    return sorted(glob.glob(os.path.join(TEMPLATE_DIR, '**', '*.docx'), recursive=True))
+
+
+def usable_templates(cache):
+    """CompiledTemplates of the shipped templates that jinja can parse.
+
+    A few shipped templates have syntax errors (e.g. "unexpected '}'") and
+    fail in the GUI too: they are left out.
+    """
+    compiled = []
+    for path in shipped_templates():
+        try:
+            entry = cache.get(path)
+            entry.variables
+        except Exception:
+            continue
+        compiled.append(entry)
+    return compiled
+
+
+class TempDirTestCase(unittest.TestCase):
+    """TestCase with a scratch directory in self.tmp, removed afterwards"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='rup_fill_test_')
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
@@ -0,0 +1,75 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+
+from benchmarks.synthetic import workbook_for
+from rup_fill.cli import main, parse_rows, row_selected
+
+from . import SIMPLE_TEMPLATE, TempDirTestCase
+
+
+class ParseRowsTest(TempDirTestCase):
+
+    def test_ranges(self):
+        self.assertEqual(parse_rows("2-500,510, 600-"), [(2, 500), (510, 510), (600, None)])
+        self.assertEqual(parse_rows("-10"), [(2, 10)])
+        self.assertEqual(parse_rows("7,,"), [(7, 7)])
+        ranges = parse_rows("2-4,10-")
+        self.assertEqual([row for row in range(1, 13) if row_selected(row, ranges)], [2, 3, 4, 10, 11, 12])
+
+    def test_invalid_specs(self):
+        for spec in ("a", "2-x", "3-4-5", "1.5", "10-5"):
+            with self.subTest(spec=spec):
+                with self.assertRaises(argparse.ArgumentTypeError):
+                    parse_rows(spec)
+
+    def test_invalid_spec_is_a_usage_error(self):
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit) as raised:
+                main(['--workbook', 'x.xlsx', '--templates', SIMPLE_TEMPLATE, '--rows', '2-x'])
+        self.assertEqual(raised.exception.code, 2)
+        self.assertIn("selezione righe non valida", stderr.getvalue())
+
+
+class BatchRunTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Righe dati alle righe Excel 2-6
+        self.workbook = workbook_for(5, self.tmp)
+        self.out = os.path.join(self.tmp, 'out')
+
+    def generate(self, *argv):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(io.StringIO()):
+            status = main(['--workbook', self.workbook, '--templates', SIMPLE_TEMPLATE, '--out', self.out,
+                           '--workers', '1', '--no-cache', *argv])
+        return status, json.loads(stdout.getvalue())
+
+    def documents(self):
+        return sorted(name for name in os.listdir(self.out) if name.endswith('.docx'))
+
+    def test_selected_rows_only(self):
+        status, summary = self.generate('--rows', '3-4')
+        self.assertEqual(status, 0)
+        self.assertEqual((summary['rows'], summary['templates']), (2, 1))
+        self.assertEqual((summary['documents'], summary['rebuilt'], summary['failed']), (2, 2, 0))
+        self.assertEqual(summary['output_dir'], os.path.abspath(self.out))
+        self.assertEqual(len(self.documents()), 2)
+
+    def test_all_rows_by_default(self):
+        status, summary = self.generate()
+        self.assertEqual((status, summary['rows'], summary['documents']), (0, 5, 5))
+
+    def test_out_of_range_rows_generate_nothing(self):
+        status, summary = self.generate('--rows', '100-200')
+        self.assertEqual(status, 0)
+        self.assertEqual((summary['rows'], summary['documents'], summary['failed']), (0, 0, 0))
+        self.assertEqual(self.documents(), [])
+
+    def test_second_run_reports_skipped(self):
+        self.generate('--rows', '2-3')
+        status, summary = self.generate('--rows', '2-3')
+        self.assertEqual((status, summary['documents'], summary['rebuilt'], summary['skipped']), (0, 2, 0, 2))
@@ -0,0 +1,69 @@
+import filecmp
+import os
+import shutil
+
+from rup_fill.parallel import render_jobs
+from rup_fill.render import plan_renders
+from rup_fill.templates import TemplateCache
+
+from . import IMAGE_TEMPLATE, SIMPLE_TEMPLATE, TempDirTestCase
+
+
+class DeduplicationTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Lo stesso template copiato in due cartelle di fase
+        self.copies = []
+        for phase in ('B_RDA', 'C_NOMINA_RUP'):
+            os.makedirs(os.path.join(self.tmp, phase))
+            path = os.path.join(self.tmp, phase, 'template.docx')
+            shutil.copyfile(SIMPLE_TEMPLATE, path)
+            self.copies.append(path)
+        self.cache = TemplateCache()
+        self.variables = sorted(self.cache.get(SIMPLE_TEMPLATE).variables)
+
+    def output(self, name):
+        return os.path.join(self.tmp, name)
+
+    def test_identical_files_share_one_template(self):
+        first, second = (self.cache.get(path) for path in self.copies)
+        self.assertIs(first, second)
+        self.assertIs(self.cache.get(SIMPLE_TEMPLATE), first)
+        self.assertEqual((len(self.cache), self.cache.shared), (1, 2))
+
+        # Una copia modificata torna ad avere la propria voce
+        shutil.copyfile(IMAGE_TEMPLATE, self.copies[1])
+        self.assertIsNot(self.cache.get(self.copies[1]), first)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_jobs_with_the_same_document_form_one_unit(self):
+        context = {name: f"valore {name}" for name in self.variables}
+        # Colonna che il template non usa: non distingue i documenti
+        other_row = dict(context, colonna_non_usata='altra riga')
+        changed = dict(context, **{self.variables[0]: 'valore diverso'})
+        jobs = [(2, self.copies[0], context, self.output('a.docx')),
+                (2, self.copies[1], context, self.output('b.docx')),
+                (3, self.copies[0], other_row, self.output('c.docx')),
+                (4, self.copies[0], changed, self.output('d.docx'))]
+        units = plan_renders(jobs, self.cache)
+        self.assertEqual([indices for _, _, indices in units], [[0, 1, 2], [3]])
+        self.assertNotIn('colonna_non_usata', units[0][1])
+
+        results = list(render_jobs(jobs, workers=1, cache=self.cache))
+        self.assertEqual([error for _, error in results], [None] * 4)
+        # Due render per quattro documenti; le copie sono identiche al primo
+        self.assertEqual(self.cache.get(self.copies[0]).renders, 2)
+        self.assertTrue(filecmp.cmp(self.output('a.docx'), self.output('b.docx'), shallow=False))
+        self.assertTrue(filecmp.cmp(self.output('a.docx'), self.output('c.docx'), shallow=False))
+
+    def test_hardlinked_copies(self):
+        context = {name: f"valore {name}" for name in self.variables}
+        jobs = [(2, path, context, self.output(f"doc_{index}.docx")) for index, path in enumerate(self.copies)]
+        results = list(render_jobs(jobs, workers=1, cache=self.cache, link=True))
+        self.assertEqual([error for _, error in results], [None, None])
+        first, second = (os.stat(job[3]) for job in jobs)
+        # Dove il file system non ammette hard link si ripiega sulla copia
+        if first.st_nlink > 1:
+            self.assertEqual(first.st_ino, second.st_ino)
+        self.assertTrue(filecmp.cmp(jobs[0][3], jobs[1][3], shallow=False))
@@ -0,0 +1,93 @@
+import contextlib
+import io
+import json
+import os
+import pickle
+import shutil
+
+from benchmarks.synthetic import workbook_for
+from rup_fill.cli import main
+from rup_fill.failures import RenderError, describe_failure, failure_text, retry_jobs
+from rup_fill.templates import TemplateCache
+
+from . import IMAGE_TEMPLATE, SIMPLE_TEMPLATE, TempDirTestCase
+
+
+class FailureReportTest(TempDirTestCase):
+
+    def test_render_error_keeps_exception_across_processes(self):
+        error = pickle.loads(pickle.dumps(RenderError.from_exception(KeyError('manca'))))
+        self.assertEqual((str(error), error.exception), ("'manca'", 'KeyError'))
+
+    def test_missing_variables_of_the_failed_job(self):
+        variables = sorted(TemplateCache().get(SIMPLE_TEMPLATE).variables)
+        context = {name: "valore" for name in variables[1:]}
+        context[variables[2]] = "  "
+        job = (4, SIMPLE_TEMPLATE, context, os.path.join(self.tmp, 'doc.docx'))
+        failure = describe_failure(job, RenderError("'assente' is undefined", 'UndefinedError'))
+        self.assertEqual(failure['missing_variables'], ['assente', variables[0], variables[2]])
+        self.assertEqual((failure['row_idx'], failure['exception']), (4, 'UndefinedError'))
+        self.assertIn("(riga 4)", failure_text(failure))
+        self.assertIn(variables[0], failure_text(failure))
+
+    def test_retry_selects_failed_pairs_only(self):
+        jobs = [(row_idx, template, {}, f"{row_idx}_{index}.docx")
+                for row_idx in (1, 2, 3) for index, template in enumerate((SIMPLE_TEMPLATE, IMAGE_TEMPLATE))]
+        failures = [{'row_idx': 2, 'template': IMAGE_TEMPLATE}, {'row_idx': 3, 'template': SIMPLE_TEMPLATE},
+                    {'row_idx': None, 'template': ''}]
+        self.assertEqual(retry_jobs(jobs, failures), [jobs[3], jobs[4]])
+
+
+class RetryFailedTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.out = os.path.join(self.tmp, 'out')
+        # Template rotto, corretto dopo la prima generazione
+        self.broken = os.path.join(self.tmp, 'rotto.docx')
+        with open(self.broken, 'wb') as f:
+            f.write(b'non un docx')
+        self.workbook = workbook_for(3, self.tmp)
+
+    def generate(self, *argv):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(io.StringIO()):
+            status = main([*argv, '--workers', '1', '--no-cache'])
+        return status, json.loads(stdout.getvalue())
+
+    def first_run(self):
+        status, summary = self.generate('--workbook', self.workbook, '--templates', SIMPLE_TEMPLATE, self.broken,
+                                        '--out', self.out)
+        self.assertEqual(status, 1)
+        self.assertEqual((summary['documents'], summary['failed']), (3, 3))
+        with open(summary['failure_report'], encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual(report['workbook'], os.path.abspath(self.workbook))
+        self.assertEqual({failure['template'] for failure in report['failures']}, {self.broken})
+        # row_idx conta le righe dati (riga Excel - 1)
+        self.assertEqual(sorted(failure['row_idx'] for failure in report['failures']), [1, 2, 3])
+        shutil.copyfile(SIMPLE_TEMPLATE, self.broken)
+        return summary['failure_report']
+
+    def test_retry_renders_only_failed_documents(self):
+        report = self.first_run()
+        status, summary = self.generate('--retry-failed', report)
+        self.assertEqual(status, 0)
+        self.assertEqual((summary['rows'], summary['documents'], summary['failed']), (3, 3, 0))
+        self.assertEqual(summary['retry_of'], os.path.abspath(report))
+        generated = [name for name in os.listdir(self.out) if name.endswith('.docx')]
+        self.assertEqual(len(generated), 6)
+
+    def test_retry_with_stream(self):
+        report = self.first_run()
+        status, summary = self.generate('--retry-failed', report, '--stream')
+        self.assertEqual(status, 0)
+        self.assertEqual((summary['documents'], summary['failed']), (3, 0))
+
+    def test_unusable_report(self):
+        path = os.path.join(self.tmp, 'errori.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'workbook': None, 'failures': []}, f)
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            self.assertEqual(main(['--retry-failed', path]), 2)
+        self.assertIn("Rapporto degli errori non utilizzabile", stderr.getvalue())
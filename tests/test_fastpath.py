@@ -0,0 +1,48 @@
+import unittest
+
+from rup_fill.fastpath import compile_fast, verify
+from rup_fill.templates import TemplateCache
+
+from . import SIMPLE_TEMPLATE, usable_templates
+
+
+def contexts_for(compiled):
+    """Contexts covering filled, empty, blank, partially filled and escaped values"""
+    names = sorted(compiled.variables)
+    return [
+        {name: f"Valore di {name} à è" for name in names},
+        {},
+        {name: "" for name in names},
+        {name: (f"v{index} > 0" if index % 2 else " ") for index, name in enumerate(names)},
+        {name: 12.5 for name in names},
+    ]
+
+
+class FastPathTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache = TemplateCache()
+        cls.templates = usable_templates(cls.cache)
+
+    def test_matches_docxtpl_on_shipped_templates(self):
+        fast_templates = 0
+        for compiled in self.templates:
+            if compile_fast(compiled) is None:
+                continue
+            fast_templates += 1
+            for index, context in enumerate(contexts_for(compiled)):
+                # Il passthrough cambia solo il salvataggio: basta un contesto per verificarlo
+                for compresslevel in ((None, 6) if index == 0 else (None,)):
+                    with self.subTest(template=compiled.path, context=index, compresslevel=compresslevel):
+                        self.assertEqual(verify(compiled, context, compresslevel), [])
+        self.assertGreater(fast_templates, 0)
+
+    def test_markup_falls_back_to_docxtpl(self):
+        compiled = self.cache.get(SIMPLE_TEMPLATE)
+        fast = compile_fast(compiled)
+        self.assertIsNotNone(fast)
+        name = sorted(compiled.variables)[0]
+        for value in ("A & B", "<w:t>", "riga\nnuova"):
+            with self.subTest(value=value):
+                self.assertFalse(fast.render({name: value}, None))
@@ -0,0 +1,60 @@
+import os
+import unittest
+from datetime import datetime
+
+import openpyxl
+
+from rup_fill.fields import DATE_FIELDS, FIELD_INDEX
+from rup_fill.workbook import DATI_GENERALI, GENERAZIONI_OFFERTE, read_workbook
+
+from . import REPO_ROOT, TempDirTestCase
+
+TEMPLATE_WORKBOOK = os.path.join(REPO_ROOT, 'template.xlsx')
+
+
+def sheet_names():
+    """Variable names of dati_generali_procedura (column E) and generazioni_offerte headers"""
+    wb = openpyxl.load_workbook(TEMPLATE_WORKBOOK, read_only=True)
+    try:
+        names = [name for name, in wb[DATI_GENERALI].iter_rows(min_row=2, min_col=5, max_col=5, values_only=True)
+                 if name is not None and str(name).strip()]
+        names += [name for name in next(wb[GENERAZIONI_OFFERTE].iter_rows(max_row=1, values_only=True))
+                  if name is not None]
+    finally:
+        wb.close()
+    return names
+
+
+class FieldIndexTest(TempDirTestCase):
+
+    def test_dates_formatted_by_the_substring_rule_still_are(self):
+        names = sheet_names()
+        # Regola precedente: un campo data contenuto nel nome
+        old_dates = [name for name in names
+                     if any(date_field.lower() in str(name).lower() for date_field in DATE_FIELDS)]
+        self.assertGreater(len(old_dates), 5)
+        for name in old_dates:
+            with self.subTest(name=name):
+                self.assertTrue(FIELD_INDEX.classify(name)[1])
+                self.assertEqual(FIELD_INDEX.kind(name), ('date', None))
+
+    def test_support_rup_birth_date_is_a_date(self):
+        for name in ('data_nascita_supportoRUP', '\xa0data_nascita_supportoRUP ', 'DATA_NASCITA_SUPPORTORUP'):
+            with self.subTest(name=name):
+                self.assertEqual(FIELD_INDEX.kind(name), ('date', None))
+
+    def test_support_rup_birth_date_is_formatted_when_read(self):
+        path = os.path.join(self.tmp, 'procedura.xlsx')
+        wb = openpyxl.load_workbook(TEMPLATE_WORKBOOK)
+        for value, _, name in wb[DATI_GENERALI].iter_rows(min_row=2, min_col=3, max_col=5):
+            if str(name.value).strip() == 'data_nascita_supportoRUP':
+                value.value = datetime(1980, 4, 7)
+        wb.save(path)
+
+        entries = read_workbook(path)[DATI_GENERALI]
+        values = {entry['name'].strip(): entry['value'] for entry in entries if entry['type'] == 'value'}
+        self.assertEqual(values['data_nascita_supportoRUP'], '07/04/1980')
+
+
+if __name__ == '__main__':
+    unittest.main()
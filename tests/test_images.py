@@ -0,0 +1,83 @@
+import io
+import os
+import unittest
+from unittest import mock
+
+from rup_fill.images import ImageCache, _pillow, prepare_image
+
+from . import TempDirTestCase
+
+
+@unittest.skipIf(_pillow() is None, "Pillow non installato")
+class ImageCacheTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = os.path.join(self.tmp, 'cache')
+
+    def image(self, name, color, size=(1600, 800)):
+        from PIL import Image
+
+        path = os.path.join(self.tmp, name)
+        Image.new('RGB', size, color).save(path, 'PNG')
+        return path
+
+    def stored(self):
+        directory = os.path.join(self.cache_dir, 'images')
+        return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+    def test_prepared_once_then_reused(self):
+        from PIL import Image
+
+        path = self.image('firma.png', 'red')
+        cache = ImageCache(directory=self.cache_dir)
+        data = cache.get(path, 50)
+        self.assertEqual(cache.get(path, 50), data)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        with Image.open(io.BytesIO(data)) as image:
+            # 50 mm a 200 dpi
+            self.assertEqual(image.width, 394)
+        self.assertEqual(len(self.stored()), 1)
+
+        # Un nuovo processo ritrova l'immagine preparata su disco
+        with mock.patch('rup_fill.images.prepare_image', side_effect=AssertionError("ripreparata")):
+            self.assertEqual(ImageCache(directory=self.cache_dir).get(path, 50), data)
+
+    def test_disk_cache_is_bounded(self):
+        paths = [self.image(f"firma_{index}.png", color) for index, color in enumerate(('red', 'green', 'blue'))]
+        size = len(ImageCache(directory=os.path.join(self.tmp, 'misura')).get(paths[0], 50))
+        # Spazio per due immagini, non per tre
+        budget = size * 2 + size // 2
+        cache = ImageCache(directory=self.cache_dir, disk_max_bytes=budget)
+        seen = set()
+        for index, path in enumerate(paths):
+            cache.get(path, 50)
+            # mtime distinti: l'ordine LRU non dipende dalla risoluzione del file system
+            for name in set(self.stored()) - seen:
+                os.utime(os.path.join(self.cache_dir, 'images', name), (index + 1, index + 1))
+                seen.add(name)
+        stored = self.stored()
+        self.assertEqual(len(stored), 2)
+        self.assertLessEqual(sum(os.path.getsize(os.path.join(self.cache_dir, 'images', name))
+                                 for name in stored), budget)
+
+        # La prima immagine, la meno usata, è stata eliminata; le altre si leggono dal disco
+        with mock.patch('rup_fill.images.prepare_image', wraps=prepare_image) as prepare:
+            fresh = ImageCache(directory=self.cache_dir, disk_max_bytes=budget * 2)
+            fresh.get(paths[2], 50)
+            fresh.get(paths[1], 50)
+            self.assertEqual(prepare.call_count, 0)
+            fresh.get(paths[0], 50)
+            self.assertEqual(prepare.call_count, 1)
+
+    def test_failed_write_leaves_no_temporary_file(self):
+        path = self.image('firma.png', 'red')
+        cache = ImageCache(directory=self.cache_dir)
+        with mock.patch('rup_fill.images.os.replace', side_effect=OSError("disco pieno")):
+            data = cache.get(path, 50)
+        self.assertTrue(data)
+        self.assertEqual(self.stored(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
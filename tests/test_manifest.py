@@ -0,0 +1,65 @@
+import os
+import shutil
+
+from rup_fill.manifest import MANIFEST_NAME, Manifest
+from rup_fill.parallel import render_jobs
+from rup_fill.templates import TemplateCache
+
+from . import IMAGE_TEMPLATE, SIMPLE_TEMPLATE, TempDirTestCase
+
+
+class ManifestTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.template = os.path.join(self.tmp, 'template.docx')
+        shutil.copyfile(SIMPLE_TEMPLATE, self.template)
+        self.output_dir = os.path.join(self.tmp, 'output')
+        os.makedirs(self.output_dir)
+        self.cache = TemplateCache()
+        names = sorted(self.cache.get(self.template).variables)
+        self.contexts = [{name: f"{name} {index}" for name in names} for index in range(3)]
+
+    def output(self, index):
+        return os.path.join(self.output_dir, f"documento_{index}.docx")
+
+    def generate(self, contexts=None):
+        """Run the jobs against the manifest on disk, returns (rebuilt, skipped)"""
+        contexts = contexts or self.contexts
+        jobs = [(index, self.template, context, self.output(index)) for index, context in enumerate(contexts)]
+        manifest = Manifest(self.output_dir)
+        results = list(render_jobs(jobs, workers=1, cache=self.cache, manifest=manifest))
+        self.assertEqual([error for _, error in results], [None] * len(jobs))
+        return manifest.rebuilt, manifest.skipped
+
+    def test_second_run_skips_everything(self):
+        self.assertEqual(self.generate(), (3, 0))
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, MANIFEST_NAME)))
+        self.assertEqual(self.generate(), (0, 3))
+
+    def test_changed_context_is_rebuilt(self):
+        self.generate()
+        contexts = [dict(context) for context in self.contexts]
+        name = next(iter(contexts[1]))
+        contexts[1][name] = 'valore cambiato'
+        self.assertEqual(self.generate(contexts), (1, 2))
+        self.assertEqual(self.generate(contexts), (0, 3))
+
+    def test_missing_or_edited_output_is_rebuilt(self):
+        self.generate()
+        os.remove(self.output(0))
+        with open(self.output(2), 'ab') as f:
+            f.write(b'modificato a mano')
+        self.assertEqual(self.generate(), (2, 1))
+        self.assertTrue(os.path.exists(self.output(0)))
+
+    def test_changed_template_rebuilds_everything(self):
+        self.generate()
+        shutil.copyfile(IMAGE_TEMPLATE, self.template)
+        self.assertEqual(self.generate(), (3, 0))
+
+    def test_unreadable_manifest_rebuilds_everything(self):
+        self.generate()
+        with open(os.path.join(self.output_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            f.write('{non json')
+        self.assertEqual(self.generate(), (3, 0))
@@ -0,0 +1,65 @@
+import unittest
+from datetime import date, datetime
+
+from rup_fill.normalize import (ColumnNormalizer, format_amount, format_code, format_excel_date,
+                                normalize_column)
+
+DATES = [
+    None, datetime(2024, 3, 5, 10, 30), date(2023, 12, 31), date(1500, 1, 1), datetime(2400, 6, 1),
+    '2024-03-05 00:00:00', '2024-03-05', '05/03/2024', '31/02/2024', 'non una data', '',
+    45356, 45356.75, 0, -5, 1, 10 ** 7, float('nan'), True,
+]
+AMOUNTS = [None, 0, 1234.5, -98765.432, 10 ** 9, ' 1.234,56 ', '', 'gratuito', 12.0]
+CODES = [None, 1234, 1234.0, 12.5, ' 0042 ', 'ZX123', '', 10 ** 20, 7, '123']
+
+
+class Index:
+    """Minimal FieldIndex: the kind of each test column"""
+
+    KINDS = {'data': ('date', None), 'importo': ('amount', None), 'cap': ('code', 5)}
+
+    def kind(self, header):
+        return self.KINDS.get(header, (None, None))
+
+
+def same(first, second):
+    # NaN resta NaN: confronto per rappresentazione
+    return [repr(value) for value in first] == [repr(value) for value in second]
+
+
+class ColumnNormalizationTest(unittest.TestCase):
+
+    def test_dates_match_scalar_format(self):
+        expected = [format_excel_date(value) for value in DATES]
+        self.assertTrue(same(normalize_column('date', DATES), expected),
+                        (normalize_column('date', DATES), expected))
+
+    def test_amounts_match_scalar_format(self):
+        self.assertEqual(normalize_column('amount', AMOUNTS), [format_amount(value) for value in AMOUNTS])
+
+    def test_codes_match_scalar_format(self):
+        for width in (None, 5):
+            with self.subTest(width=width):
+                self.assertEqual(normalize_column('code', CODES, width),
+                                 [format_code(value, width) for value in CODES])
+
+    def test_rows_match_scalar_format_across_chunks(self):
+        rows = [{'row_idx': index, 'data': {'data': DATES[index % len(DATES)],
+                                            'importo': AMOUNTS[index % len(AMOUNTS)],
+                                            'cap': CODES[index % len(CODES)],
+                                            'nome': f"riga {index}"}}
+                for index in range(60)]
+        expected = [{'data': format_excel_date(row['data']['data']),
+                     'importo': format_amount(row['data']['importo']),
+                     'cap': format_code(row['data']['cap'], 5),
+                     'nome': row['data']['nome']} for row in rows]
+        # Memo piccolo: la cache dei valori viene svuotata fra un blocco e l'altro
+        normalizer = ColumnNormalizer(Index(), memo_limit=5)
+        for start in range(0, len(rows), 7):
+            normalizer.normalize_rows(rows[start:start + 7])
+        for row, values in zip(rows, expected):
+            self.assertTrue(same(row['data'].values(), values.values()), (row['data'], values))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import io
+import os
+import unittest
+import zipfile
+import zlib
+from unittest import mock
+
+from rup_fill.package import PassthroughWriter, SourceArchive
+from rup_fill.templates import TemplateCache
+
+from . import IMAGE_TEMPLATE, TempDirTestCase, usable_templates
+
+
+def members(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        return {info.filename: zf.read(info) for info in zf.infolist()}
+
+
+class Unseekable(io.RawIOBase):
+    """Write-only stream without seek or tell, like a pipe or an HTTP response"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+class PassthroughTest(TempDirTestCase):
+
+    def render(self, compiled, context, compresslevel):
+        output = io.BytesIO()
+        compiled.render(context, output, fast_path=False, compresslevel=compresslevel)
+        return output.getvalue()
+
+    def test_same_members_as_full_rewrite(self):
+        for compiled in usable_templates(TemplateCache()):
+            context = {name: f"Valore di {name}" for name in compiled.variables
+                       if name not in compiled.image_fields}
+            with open(compiled.path, 'rb') as f:
+                template = members(f.read())
+            with self.subTest(template=compiled.path):
+                passthrough = self.render(compiled, context, 6)
+                with zipfile.ZipFile(io.BytesIO(passthrough)) as zf:
+                    self.assertIsNone(zf.testzip())
+                passthrough = members(passthrough)
+                rewritten = members(self.render(compiled, context, None))
+                self.assertEqual(sorted(passthrough), sorted(rewritten))
+                self.assertEqual(passthrough['word/document.xml'], rewritten['word/document.xml'])
+                for name, data in passthrough.items():
+                    if data == rewritten[name]:
+                        continue
+                    # Membro copiato: byte del template, e python-docx lo avrebbe scritto come il template intatto
+                    self.assertEqual(data, template.get(name), name)
+                    rewritten_crc = zlib.crc32(rewritten[name])
+                    self.assertTrue(compiled.archive.unchanged(name, rewritten_crc, len(rewritten[name])), name)
+
+    def test_copied_members_keep_template_bytes(self):
+        with open(IMAGE_TEMPLATE, 'rb') as f:
+            data = f.read()
+        source = SourceArchive(data)
+        names = list(source.members)
+        path = os.path.join(self.tmp, 'copia.docx')
+        with PassthroughWriter(path, source) as writer:
+            # Membri copiati e riscritti alternati: directory centrale e offset devono restare coerenti
+            for index, name in enumerate(names):
+                if index % 2:
+                    writer.copy_member(name)
+                else:
+                    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+                        writer.write_member(name, zf.read(name))
+        self.assertEqual(writer.copied + writer.compressed, len(names))
+        self.assertGreater(writer.copied, 0)
+        with zipfile.ZipFile(path) as written, zipfile.ZipFile(io.BytesIO(data)) as original:
+            self.assertIsNone(written.testzip())
+            self.assertEqual(written.namelist(), names)
+            for name in names:
+                self.assertEqual(written.read(name), original.read(name))
+
+    def copy_all(self, output):
+        """Copy every member of IMAGE_TEMPLATE through a PassthroughWriter, returns (writer, template bytes)"""
+        with open(IMAGE_TEMPLATE, 'rb') as f:
+            data = f.read()
+        source = SourceArchive(data)
+        with PassthroughWriter(output, source) as writer:
+            for name in source.members:
+                writer.copy_member(name)
+        return writer, data
+
+    def assertSameMembers(self, written, data):
+        with zipfile.ZipFile(io.BytesIO(written)) as zf, zipfile.ZipFile(io.BytesIO(data)) as original:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.namelist(), original.namelist())
+            for name in original.namelist():
+                self.assertEqual(zf.read(name), original.read(name), name)
+
+    def test_unseekable_output_is_recompressed(self):
+        output = Unseekable()
+        writer, data = self.copy_all(output)
+        self.assertEqual(writer.copied, 0)
+        self.assertSameMembers(output.buffer.getvalue(), data)
+
+    def test_large_members_are_recompressed(self):
+        output = io.BytesIO()
+        # Soglia abbassata al posto dei 4 GB dello zip64
+        with mock.patch('rup_fill.package.MAX_COPY_SIZE', 2000):
+            writer, data = self.copy_all(output)
+        self.assertGreater(writer.copied, 0)
+        self.assertGreater(writer.compressed, 0)
+        self.assertSameMembers(output.getvalue(), data)
+
+    def test_python_docx_opens_passthrough_output(self):
+        from docx import Document
+
+        compiled = TemplateCache().get(IMAGE_TEMPLATE)
+        document = Document(io.BytesIO(self.render(compiled, {'nome_ditta_scelta': 'Ditta di prova'}, 6)))
+        self.assertIn('Ditta di prova', '\n'.join(paragraph.text for paragraph in document.paragraphs))
+
+
+if __name__ == '__main__':
+    unittest.main()
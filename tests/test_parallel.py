@@ -0,0 +1,67 @@
+import os
+import unittest
+import zipfile
+
+from rup_fill.parallel import render_jobs
+from rup_fill.templates import TemplateCache
+
+from . import IMAGE_TEMPLATE, SIMPLE_TEMPLATE, TempDirTestCase
+
+
+def document_text(path):
+    """XML of every part of a generated document, to look for the rendered values"""
+    with zipfile.ZipFile(path) as zf:
+        return b''.join(zf.read(name) for name in zf.namelist() if name.endswith('.xml')).decode('utf-8')
+
+
+class ParallelRenderTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache = TemplateCache()
+        self.templates = [SIMPLE_TEMPLATE, IMAGE_TEMPLATE]
+        # Una variabile per template, che ogni riga riempie con un valore diverso
+        self.variables = {path: sorted(name for name in cache.get(path).variables
+                                       if not name.startswith(('firma_', 'img_documento_')))
+                          for path in self.templates}
+
+    def jobs(self, directory, rows=4):
+        jobs = []
+        for row_idx in range(2, 2 + rows):
+            context = {name: f"riga {row_idx} {name}" for names in self.variables.values() for name in names}
+            for number, path in enumerate(self.templates):
+                jobs.append((row_idx, path, context, os.path.join(directory, f"doc_{row_idx}_{number}.docx")))
+        return jobs
+
+    def test_results_follow_job_order(self):
+        jobs = self.jobs(self.tmp)
+        # Template mancante a metà: l'errore resta alla sua posizione
+        jobs.insert(3, (9, os.path.join(self.tmp, 'mancante.docx'), {}, os.path.join(self.tmp, 'x.docx')))
+        results = list(render_jobs(jobs, workers=2, cache=TemplateCache()))
+        self.assertEqual([job for job, _ in results], jobs)
+        errors = [error for _, error in results]
+        self.assertIsNotNone(errors[3])
+        self.assertEqual(errors[:3] + errors[4:], [None] * (len(jobs) - 1))
+        for row_idx, path, context, output_path in jobs[:3] + jobs[4:]:
+            name = self.variables[path][0]
+            self.assertIn(context[name], document_text(output_path))
+
+    def test_same_documents_as_sequential(self):
+        outputs = {}
+        for workers in (1, 2):
+            directory = os.path.join(self.tmp, str(workers))
+            os.makedirs(directory)
+            jobs = self.jobs(directory, rows=3)
+            self.assertEqual([error for _, error in render_jobs(jobs, workers=workers, cache=TemplateCache())],
+                             [None] * len(jobs))
+            outputs[workers] = [document_text(job[3]) for job in jobs]
+        self.assertEqual(outputs[1], outputs[2])
+
+    def test_cancelled_before_start_renders_nothing(self):
+        jobs = self.jobs(self.tmp)
+        self.assertEqual(list(render_jobs(jobs, workers=2, cache=TemplateCache(), cancelled=lambda: True)), [])
+        self.assertEqual([name for name in os.listdir(self.tmp) if name.endswith('.docx')], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import contextlib
+import io
+import os
+import unittest
+
+from rup_fill.service import check_host, main
+
+from . import SIMPLE_TEMPLATE, TempDirTestCase
+
+
+class HostTest(unittest.TestCase):
+
+    def test_loopback_hosts_are_accepted(self):
+        for host in ('127.0.0.1', '127.0.1.1', 'localhost', 'LOCALHOST'):
+            with self.subTest(host=host):
+                check_host(host)
+
+    def test_other_hosts_are_refused(self):
+        for host in ('0.0.0.0', '', '192.168.1.10', '10.0.0.1', 'example.org', '::'):
+            with self.subTest(host=host):
+                with self.assertRaises(ValueError):
+                    check_host(host)
+
+    def test_command_line_refuses_public_host(self):
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit) as raised:
+                main(['--host', '0.0.0.0', '--workers', '1'])
+        self.assertEqual(raised.exception.code, 2)
+        self.assertIn("non locale", stderr.getvalue())
+
+
+class UnreachableServiceTest(TempDirTestCase):
+
+    def test_worker_falls_back_to_local_rendering(self):
+        from workers import GenerationWorker
+
+        output_path = os.path.join(self.tmp, 'documento.docx')
+        # Porta 9 (discard): nessun servizio in ascolto
+        worker = GenerationWorker([(1, SIMPLE_TEMPLATE, {}, output_path)], workers=1,
+                                  service='http://127.0.0.1:9')
+        unavailable = []
+        finished = []
+        worker.service_unavailable.connect(unavailable.append)
+        worker.finished.connect(lambda *args: finished.append(args))
+        worker.run()
+        self.assertEqual(unavailable, ['http://127.0.0.1:9'])
+        generated, failures, cancelled, skipped = finished[0]
+        self.assertEqual((generated, failures, cancelled), ([output_path], [], False))
+        self.assertTrue(os.path.exists(output_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import pickle
+import shutil
+import zlib
+from datetime import date, datetime, time, timedelta
+
+from benchmarks.synthetic import build_workbook, workbook_for
+from rup_fill.snapshot import SnapshotCache, read_workbook_cached, snapshot_rows
+from rup_fill.workbook import DATI_GENERALI, GENERAZIONI_OFFERTE, read_workbook
+
+from . import TempDirTestCase
+
+
+class SnapshotCacheTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = SnapshotCache(os.path.join(self.tmp, 'cache'))
+
+    def snapshots(self):
+        try:
+            return sorted(os.listdir(self.cache.directory))
+        except FileNotFoundError:
+            return []
+
+    def test_snapshot_matches_workbook(self):
+        path = workbook_for(25, self.tmp)
+        expected = read_workbook(path)
+        self.assertEqual(len(expected[GENERAZIONI_OFFERTE]), 25)
+
+        self.assertEqual(read_workbook_cached(path, cache=self.cache), expected)
+        snapshots = self.snapshots()
+        self.assertEqual(len(snapshots), 1)
+        # Seconda lettura dallo snapshot, senza openpyxl
+        self.assertEqual(read_workbook_cached(path, cache=self.cache), expected)
+        self.assertEqual(self.snapshots(), snapshots)
+
+    def test_changed_workbook_is_read_again(self):
+        path = os.path.join(self.tmp, 'procedura.xlsx')
+        shutil.copyfile(workbook_for(5, self.tmp), path)
+        self.assertEqual(len(read_workbook_cached(path, cache=self.cache)[GENERAZIONI_OFFERTE]), 5)
+
+        build_workbook(8, path)
+        data = read_workbook_cached(path, cache=self.cache)
+        self.assertEqual(data, read_workbook(path))
+        self.assertEqual(len(data[GENERAZIONI_OFFERTE]), 8)
+        self.assertEqual(len(self.snapshots()), 2)
+
+    def test_corrupt_snapshot_is_discarded(self):
+        path = workbook_for(5, self.tmp)
+        read_workbook_cached(path, cache=self.cache)
+        snapshot, = self.snapshots()
+        with open(os.path.join(self.cache.directory, snapshot), 'wb') as f:
+            f.write(b'non uno snapshot')
+        self.assertEqual(read_workbook_cached(path, cache=self.cache), read_workbook(path))
+
+    def test_cell_types_round_trip(self):
+        values = [None, True, 3, 2.5, float('inf'), "testo à", datetime(2024, 3, 5, 10, 30, 15, 250),
+                  date(2024, 3, 5), time(8, 45), timedelta(days=2, seconds=5, microseconds=7)]
+        data = {
+            DATI_GENERALI: [{'type': 'value', 'coord': 'C2', 'name': 'data_oggi', 'value': datetime(2025, 1, 2)}],
+            'field_values': {'data_oggi': '02/01/2025'},
+            GENERAZIONI_OFFERTE: [{'type': 'row', 'row_idx': 1, 'data': {f"c{i}": v for i, v in enumerate(values)}}]
+        }
+        self.cache.store('digest', data)
+        snapshot = self.cache.load('digest')
+        self.assertEqual(snapshot[DATI_GENERALI], data[DATI_GENERALI])
+        self.assertEqual(snapshot['field_values'], data['field_values'])
+        row, = snapshot_rows(snapshot)
+        self.assertEqual(row, data[GENERAZIONI_OFFERTE][0])
+        self.assertEqual([type(value) for value in row['data'].values()], [type(value) for value in values])
+
+    def test_pickled_snapshot_is_not_executed(self):
+        marker = os.path.join(self.tmp, 'eseguito')
+        # Un pickle che, se caricato, creerebbe il file marker
+        payload = pickle.dumps(Touch(marker))
+        os.makedirs(self.cache.directory)
+        with open(self.cache._path('digest'), 'wb') as f:
+            f.write(zlib.compress(payload))
+        self.assertIsNone(self.cache.load('digest'))
+        self.assertFalse(os.path.exists(marker))
+        self.assertEqual(self.snapshots(), [])
+
+
+class Touch:
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return open, (self.path, 'w')
@@ -0,0 +1,100 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+
+from benchmarks.synthetic import workbook_for
+from rup_fill.spool import METRICS_NAME, Spool
+
+from . import SIMPLE_TEMPLATE, TempDirTestCase
+
+
+class SpoolTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.inbox = os.path.join(self.tmp, 'inbox')
+        self.out = os.path.join(self.tmp, 'out')
+        os.makedirs(self.inbox)
+        self.workbook = workbook_for(3, self.tmp)
+
+    def spool(self, templates=(SIMPLE_TEMPLATE,), **options):
+        return Spool(self.inbox, list(templates), self.out, workers=1, **options)
+
+    def drop(self, name, source=None, data=b''):
+        path = os.path.join(self.inbox, name)
+        if source is not None:
+            shutil.copyfile(source, path)
+        else:
+            with open(path, 'wb') as f:
+                f.write(data)
+        return path
+
+    def run_once(self, spool):
+        with contextlib.redirect_stderr(io.StringIO()):
+            spool.run(once=True)
+
+    def report(self, folder, name):
+        with open(os.path.join(self.inbox, folder, os.path.splitext(name)[0] + '.json'), encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_files_are_picked_up_once_stable(self):
+        spool = self.spool(debounce=5)
+        path = self.drop('procedura.xlsx', self.workbook)
+        self.drop('~$procedura.xlsx', data=b'lock')
+        self.drop('note.txt', data=b'non un workbook')
+        self.assertEqual(spool.scan(now=0), [])
+        self.assertEqual(spool.scan(now=4), [])
+        # Ancora in copia: il conteggio riparte
+        with open(path, 'ab') as f:
+            f.write(b'\0')
+        self.assertEqual(spool.scan(now=6), [])
+        self.assertEqual(spool.scan(now=10), [])
+        self.assertEqual(spool.scan(now=11), [path])
+
+    def test_full_queue_leaves_files_for_later(self):
+        spool = self.spool(debounce=0, queue_size=1)
+        paths = [self.drop(f"procedura_{index}.xlsx", self.workbook) for index in range(2)]
+        spool.scan(now=0)
+        self.assertEqual(spool.enqueue(spool.scan(now=1)), 1)
+        self.assertEqual(spool.queue.get_nowait()[0], paths[0])
+        # Il secondo non è prenotato: la scansione successiva lo ripropone
+        self.assertEqual(spool.scan(now=2), [paths[1]])
+
+    def test_generated_workbook_goes_to_done(self):
+        self.drop('procedura.xlsx', self.workbook)
+        self.run_once(self.spool(debounce=0, interval=0.05))
+
+        self.assertEqual(os.listdir(self.inbox), ['done'])
+        report = self.report('done', 'procedura.xlsx')
+        self.assertEqual((report['status'], report['documents'], report['failures']), ('done', 3, []))
+        documents = [name for name in os.listdir(os.path.join(self.out, 'procedura')) if name.endswith('.docx')]
+        self.assertEqual(len(documents), 3)
+        with open(os.path.join(self.out, METRICS_NAME), encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['processed'], 1)
+
+    def test_unreadable_and_empty_workbooks_go_to_failed(self):
+        self.drop('corrotto.xlsx', data=b'non un file excel')
+        self.drop('vuoto.xlsx')
+        self.run_once(self.spool(debounce=0, interval=0.05))
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.inbox, 'failed'))),
+                         ['corrotto.json', 'corrotto.xlsx', 'vuoto.json', 'vuoto.xlsx'])
+        self.assertEqual(self.report('failed', 'vuoto.xlsx')['error'], "file vuoto")
+        self.assertEqual(self.report('failed', 'corrotto.xlsx')['status'], 'failed')
+        self.assertTrue(self.report('failed', 'corrotto.xlsx')['error'])
+
+    def test_failed_documents_leave_a_retry_report(self):
+        broken = os.path.join(self.tmp, 'rotto.docx')
+        with open(broken, 'wb') as f:
+            f.write(b'non un docx')
+        self.drop('procedura.xlsx', self.workbook)
+        self.run_once(self.spool(templates=(SIMPLE_TEMPLATE, broken), debounce=0, interval=0.05))
+
+        report = self.report('failed', 'procedura.xlsx')
+        self.assertEqual((report['documents'], len(report['failures'])), (3, 3))
+        self.assertTrue(os.path.exists(report['failure_report']))
+        with open(report['failure_report'], encoding='utf-8') as f:
+            failure_report = json.load(f)
+        self.assertEqual(failure_report['workbook'], os.path.join(self.inbox, 'failed', 'procedura.xlsx'))
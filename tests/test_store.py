@@ -0,0 +1,58 @@
+import unittest
+
+from rup_fill.store import RowStore
+
+
+def row(row_idx, **data):
+    return {'type': 'row', 'row_idx': row_idx, 'data': data}
+
+
+class RowStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [row(2, nome_OE='Alfa', sede_OE='Firenze', cap_OE=50121),
+                     row(3, nome_OE='Beta', sede_OE='Firenze', cap_OE=None),
+                     row(5, nome_OE='Gamma', sede_OE='Pisa', cap_OE=56121)]
+        self.store = RowStore()
+        self.store.extend(self.rows)
+
+    def test_records_behave_like_row_payloads(self):
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(self.store.headers, ['nome_OE', 'sede_OE', 'cap_OE'])
+        for record, expected in zip(self.store, self.rows):
+            self.assertEqual(record['type'], 'row')
+            self.assertEqual(record['row_idx'], expected['row_idx'])
+            self.assertEqual(record['data'], expected['data'])
+            self.assertIsNone(record.get('assente'))
+        self.assertEqual(self.store[-1].data, self.rows[-1]['data'])
+        for pos in (3, -4):
+            with self.assertRaises(IndexError):
+                self.store[pos]
+
+    def test_missing_and_extra_columns(self):
+        self.store.append(row(7, nome_OE='Delta', colonna_nuova='ignorata'))
+        self.assertEqual(self.store[3].data, {'nome_OE': 'Delta', 'sede_OE': None, 'cap_OE': None})
+
+    def test_repeated_strings_are_interned(self):
+        # Stringhe uguali ma oggetti distinti, come quelle lette da openpyxl
+        first = ''.join(['Fir', 'enze'])
+        second = ''.join(['Firen', 'ze'])
+        self.assertIsNot(first, second)
+        store = RowStore()
+        store.extend([row(2, sede_OE=first), row(3, sede_OE=second)])
+        self.assertIs(store.data(0)['sede_OE'], store.data(1)['sede_OE'])
+
+    def test_set_row_truncate_and_matches(self):
+        self.assertTrue(self.store.matches(1, self.rows[1]))
+        replacement = row(4, nome_OE='Beta bis', sede_OE='Prato', cap_OE=59100)
+        self.assertFalse(self.store.matches(1, replacement))
+        self.store.set_row(1, replacement)
+        self.assertTrue(self.store.matches(1, replacement))
+        self.assertEqual(self.store.row_idx(1), 4)
+
+        self.store.truncate(1)
+        self.assertEqual(len(self.store), 1)
+        self.assertEqual([record.row_idx for record in self.store], [2])
+
+    def test_display_text_skips_empty_values(self):
+        self.assertEqual(self.store.display_text(1), "  Beta,  Firenze")
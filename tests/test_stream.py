@@ -0,0 +1,102 @@
+import contextlib
+import io
+import json
+import os
+
+from benchmarks.synthetic import workbook_for
+from rup_fill.cli import main
+from rup_fill.stream import GenerationLog, MemoryGuard, MemoryLimitExceeded, memory_trend, stream_generate
+
+from . import SIMPLE_TEMPLATE, TempDirTestCase
+
+
+class ControlledGuard(MemoryGuard):
+    """MemoryGuard whose usage is above the limit while high is set"""
+
+    def __init__(self):
+        super().__init__(limit_bytes=1000)
+        self.high = True
+
+    def usage(self):
+        return 2000 if self.high else 500
+
+
+def no_render(jobs):
+    """render callable reporting every job as done without writing documents"""
+    for job in jobs:
+        yield job, None
+
+
+class StreamGenerateTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.workbook = workbook_for(20, self.tmp)
+        self.log_path = os.path.join(self.tmp, 'generazione.jsonl')
+
+    def events(self, kind):
+        with open(self.log_path, encoding='utf-8') as f:
+            return [event for event in map(json.loads, f) if event['event'] == kind]
+
+    def generate(self, guard, relieve):
+        with GenerationLog(self.log_path) as log:
+            try:
+                return stream_generate(self.workbook, [SIMPLE_TEMPLATE], self.tmp, '01/01/2025', log, no_render,
+                                       chunk_rows=4, guard=guard, relieve=relieve)
+            finally:
+                self.documents = log.documents
+
+    def test_relieving_memory_keeps_the_batch_size(self):
+        guard = ControlledGuard()
+        relieved = []
+
+        def relieve():
+            relieved.append(True)
+            guard.high = False
+
+        self.assertEqual(self.generate(guard, relieve), 20)
+        self.assertEqual((len(relieved), self.documents), (1, 20))
+        self.assertEqual([event['batch_rows'] for event in self.events('chunk')], [4] * 5)
+
+    def test_memory_above_the_limit_halves_batches_then_stops(self):
+        guard = ControlledGuard()
+        relieved = []
+        with self.assertRaises(MemoryLimitExceeded):
+            self.generate(guard, lambda: relieved.append(True))
+        # 4 -> 2 -> 1 righe per batch, poi l'interruzione dopo il terzo blocco
+        self.assertEqual([event['batch_rows'] for event in self.events('chunk')], [2, 1])
+        self.assertEqual((len(relieved), self.documents), (3, 12))
+        self.assertEqual(guard.peak, 2000)
+
+    def test_process_memory_guard(self):
+        guard = MemoryGuard()
+        self.assertFalse(guard.over())
+        if guard.peak:
+            # Dove la memoria del processo si può leggere, un byte di limite è sempre superato
+            self.assertTrue(MemoryGuard(1).over())
+
+    def test_memory_trend_per_run(self):
+        for rows in (2, 3):
+            with GenerationLog(self.log_path) as log:
+                for chunk in range(rows):
+                    log.write('chunk', chunk=chunk, memory_bytes=1000 * (chunk + 1) * rows)
+            run = log.run
+        self.assertEqual(memory_trend(self.log_path)['chunks'], 3)
+        self.assertEqual(memory_trend(self.log_path, run)['growth_bytes'], 3000)
+
+
+class StreamCommandTest(TempDirTestCase):
+
+    def test_memory_limit_stops_the_stream(self):
+        out = os.path.join(self.tmp, 'out')
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(io.StringIO()):
+            status = main(['--workbook', workbook_for(6, self.tmp), '--templates', SIMPLE_TEMPLATE, '--out', out,
+                           '--stream', '--chunk-rows', '2', '--memory-limit-mb', '1', '--workers', '1'])
+        summary = json.loads(stdout.getvalue())
+        self.assertEqual(status, 1)
+        self.assertIn("memoria oltre il limite", summary['error'])
+        # Batch da 2 righe, poi da 1, poi l'interruzione dopo il secondo blocco
+        self.assertEqual((summary['rows'], summary['documents'], summary['failed']), (4, 4, 0))
+        with open(summary['log'], encoding='utf-8') as f:
+            self.assertEqual([event['event'] for event in map(json.loads, f)][-1], 'error')
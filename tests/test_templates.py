@@ -0,0 +1,49 @@
+import io
+import threading
+import unittest
+
+from rup_fill.templates import TemplateCache
+
+from . import SIMPLE_TEMPLATE, usable_templates
+
+
+class SharedCacheTest(unittest.TestCase):
+
+    def test_concurrent_get_and_variables(self):
+        paths = [compiled.path for compiled in usable_templates(TemplateCache())][:8]
+        # Budget minimo: ogni get rifà i conti di _evict mentre gli altri thread riempiono patched
+        cache = TemplateCache(max_bytes=1)
+        errors = []
+        start = threading.Barrier(8)
+
+        def work(offset):
+            try:
+                start.wait()
+                for round_ in range(2):
+                    for path in paths[offset % len(paths):] + paths[:offset % len(paths)]:
+                        compiled = cache.get(path)
+                        self.assertTrue(compiled.variables)
+                        cache.nbytes
+                    cache.render(paths[offset % len(paths)], {}, io.BytesIO())
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(offset,)) for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertGreater(cache.evictions, 0)
+
+    def test_patched_xml_is_counted(self):
+        cache = TemplateCache()
+        compiled = cache.get(SIMPLE_TEMPLATE)
+        before = compiled.nbytes
+        compiled.variables
+        self.assertTrue(compiled.patched)
+        self.assertGreater(compiled.nbytes, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from rup_fill.client import ServiceClient
+from rup_fill.failures import describe_failure, save_report
+from rup_fill.manifest import Manifest
+from rup_fill.parallel import render_jobs
+from rup_fill.schema import load_schema
+from rup_fill.snapshot import read_workbook_cached, stream_workbook_cached
+from rup_fill.stream import GenerationLog
+from rup_fill.timing import collect, export, profile_summary, profiled
+from rup_fill.workbook import DATI_GENERALI
+
+
+# Oltre questo numero di documenti gli esiti vengono scritti anche in un log nella cartella di output
+LOG_THRESHOLD = 200
+
+
+class GenerationWorker(QObject):
+    """Render generation jobs off the GUI thread, reporting progress per document"""
+
+    # documenti completati, totale, percorso di output, messaggio di errore ("" se ok)
+    progress = pyqtSignal(int, int, str, str)
+    # file generati, errori (voci del rapporto di rup_fill.failures), annullata, documenti invariati non rigenerati
+    finished = pyqtSignal(list, list, bool, int)
+    # riepilogo dei tempi e del profilo, emesso prima di finished se richiesto
+    report = pyqtSignal(str)
+    # percorso del log degli esiti, emesso all'avvio per le generazioni grandi
+    log_started = pyqtSignal(str)
+    # percorso del rapporto degli errori, emesso prima di finished se ci sono documenti falliti
+    failures_saved = pyqtSignal(str)
+    # indirizzo del servizio di rendering non raggiungibile: si genera in locale
+    service_unavailable = pyqtSignal(str)
+
+    def __init__(self, jobs, workers=None, timings=None, report_dir=None, profile=False, manifest_dir=None,
+                 service=None, templates=(), executor=None):
+        super().__init__()
+        self.jobs = list(jobs)
+        self.manifest_dir = manifest_dir
+        # Indirizzo del servizio di rendering a cui inviare i documenti (None: rendering locale);
+        # se non risponde si genera in locale con executor
+        self.service = service
+        self.workers = workers
+        # Gruppo di processi della finestra, riusato fra le generazioni (None: uno nuovo per questa)
+        self.executor = executor
+        self.pool_broken = False
+        self.timings = timings
+        self.report_dir = report_dir
+        self.profile = profile
+        # Template della generazione, registrati nel rapporto degli errori
+        self.templates = list(templates)
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Stop after the documents currently being rendered"""
+        self._cancel.set()
+
+    def run(self):
+        generated = []
+        failures = []
+        total = len(self.jobs)
+        started = time.perf_counter()
+        profile_path = None
+        if self.profile and self.report_dir:
+            profile_path = os.path.join(self.report_dir, f"profilo_{time.strftime('%Y%m%d_%H%M%S')}.prof")
+        profiler = None
+        counts = None
+        log = None
+        try:
+            if self.report_dir and total > LOG_THRESHOLD:
+                log = GenerationLog(os.path.join(self.report_dir,
+                                                 f"generazione_{time.strftime('%Y%m%d_%H%M%S')}.jsonl"))
+                self.log_started.emit(log.path)
+            if self.service and not ServiceClient(self.service, timeout=1).available():
+                # Verifica fatta qui e non nella finestra: un servizio che non risponde non blocca la GUI
+                self.service_unavailable.emit(self.service)
+                self.service = None
+            if self.service:
+                # Il servizio applica lo stesso manifest della cartella di output
+                client = ServiceClient(self.service)
+                counts = client
+                results = client.render_jobs(self.jobs, cancelled=self._cancel.is_set,
+                                             manifest=bool(self.manifest_dir))
+            else:
+                # Con il manifest della cartella di output si rigenerano solo i documenti cambiati
+                if self.manifest_dir:
+                    counts = Manifest(self.manifest_dir)
+                results = render_jobs(self.jobs, self.workers, cancelled=self._cancel.is_set, manifest=counts,
+                                      executor=self.executor)
+            with collect(self.timings) if self.timings is not None else nullcontext(), \
+                    profiled(profile_path) if self.profile else nullcontext() as profiler:
+                for done, (job, error) in enumerate(results, start=1):
+                    row_idx, template_path, context, output_path = job
+                    if error is None:
+                        generated.append(output_path)
+                    else:
+                        failures.append(describe_failure(job, error))
+                    if log is not None:
+                        log.document(row_idx, template_path, output_path, error)
+                        if done % LOG_THRESHOLD == 0:
+                            log.flush()
+                    self.progress.emit(done, total, output_path, error or "")
+        except Exception as e:
+            # Un processo di rendering terminato in modo anomalo rende inutilizzabile il gruppo
+            self.pool_broken = isinstance(e, BrokenProcessPool)
+            failures.append({'template': '', 'row_idx': None, 'output_path': None,
+                             'exception': type(e).__name__, 'error': str(e), 'missing_variables': []})
+        finally:
+            if log is not None:
+                log.close()
+        if failures and self.report_dir:
+            try:
+                self.failures_saved.emit(save_report(self.report_dir, failures, templates=self.templates))
+            except OSError:
+                pass
+        if self.timings is not None or profiler is not None:
+            self.report.emit(self.build_report(time.perf_counter() - started, profiler, profile_path))
+        self.finished.emit(generated, failures, self._cancel.is_set(), counts.skipped if counts else 0)
+
+    def build_report(self, elapsed, profiler, profile_path):
+        lines = [f"Tempo totale della generazione: {elapsed:.3f} s"]
+        if self.timings is not None:
+            self.timings.add('generation', elapsed)
+            lines.append(self.timings.summary_text())
+            if self.report_dir:
+                try:
+                    lines.append("Tempi salvati in: " + ", ".join(export(self.timings, self.report_dir)))
+                except OSError as e:
+                    lines.append(f"Impossibile salvare i tempi: {e}")
+        if profiler is not None:
+            if profile_path:
+                lines.append(f"Profilo cProfile salvato in: {profile_path}")
+            lines.append(profile_summary(profiler))
+        return "\n".join(lines)
+
+
+class WorkbookLoader(QObject):
+    """Read a procedure workbook off the GUI thread, streaming rows in chunks"""
+
+    # voci di dati_generali_procedura, valori per l'autoriempimento del modulo
+    dati_generali_loaded = pyqtSignal(list, dict)
+    # blocco di righe di generazioni_offerte (il primo, anche vuoto, indica che il foglio esiste)
+    rows_loaded = pyqtSignal(list)
+    # righe lette, annullata
+    finished = pyqtSignal(int, bool)
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, timings=None):
+        super().__init__()
+        self.path = path
+        self.timings = timings
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        rows_read = 0
+        try:
+            with collect(self.timings) if self.timings is not None else nullcontext():
+                for sheet_name, payload in stream_workbook_cached(self.path, cancelled=self._cancel.is_set):
+                    if sheet_name == DATI_GENERALI:
+                        self.dati_generali_loaded.emit(*payload)
+                    else:
+                        rows_read += len(payload)
+                        self.rows_loaded.emit(payload)
+        except Exception as e:
+            self.failed.emit(str(e))
+        self.finished.emit(rows_read, self._cancel.is_set())
+
+
+class SchemaLoader(QObject):
+    """Build the field schema off the GUI thread when variabili_testo.xlsx is not cached yet"""
+
+    loaded = pyqtSignal(object)
+    finished = pyqtSignal()
+
+    def run(self):
+        # load_schema non solleva: in caso di errori restituisce i soli campi predefiniti
+        self.loaded.emit(load_schema())
+        self.finished.emit()
+
+
+class WorkbookReloader(QObject):
+    """Re-read a whole workbook off the GUI thread after it changed on disk"""
+
+    loaded = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def run(self):
+        try:
+            self.loaded.emit(read_workbook_cached(self.path))
+        except Exception as e:
+            self.failed.emit(str(e))
+        self.finished.emit()